@@ -13,6 +13,7 @@ https://docs.djangoproject.com/en/3.1/ref/settings/
 from pathlib import Path
 from os import getenv
 import sys
+import tempfile
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -214,14 +215,94 @@ REQUEST_IGNPORE_IP = [
 
 # Configure your Q cluster
 # More details https://django-q.readthedocs.io/en/latest/configure.html
+# the timeout has to be long enough for the result jobs of big polygons
+# and the retry has to be longer than the timeout
 Q_CLUSTER = {
     "name": "naturwb",
     "orm": "default",  # Use Django's ORM + database for broker
-    "timeout": 5,
+    "timeout": 300,
     "max_attempts": 4,
-    "retry": 30
+    "retry": 330
 }
 
+# the caches
+# the results of the NatUrWB queries are shared between the worker processes
+# in the file system, for Redis use e.g. "django_redis.cache.RedisCache"
+# with a maxmemory-policy of allkeys-lru
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    "naturwb_results": {
+        "BACKEND": "naturwb.cache_backends.LRUFileBasedCache",
+        "LOCATION": getenv(
+            "NATURWB_RESULT_CACHE_DIR",
+            Path(tempfile.gettempdir()).joinpath("naturwb_results").as_posix()),
+        "TIMEOUT": 60*60*24*7,
+        "OPTIONS": {
+            "MAX_ENTRIES": 2000,
+        }
+    },
+    "naturwb_plots": {
+        "BACKEND": "naturwb.cache_backends.LRUFileBasedCache",
+        "LOCATION": getenv(
+            "NATURWB_PLOT_CACHE_DIR",
+            Path(tempfile.gettempdir()).joinpath("naturwb_plots").as_posix()),
+        "TIMEOUT": 60*60*24*30,
+        "OPTIONS": {
+            "MAX_ENTRIES": 20000,
+            "MAX_SIZE": 500*1024**2,  # in bytes
+        }
+    },
+    "naturwb_tiles": {
+        "BACKEND": "naturwb.cache_backends.LRUFileBasedCache",
+        "LOCATION": getenv(
+            "NATURWB_TILE_CACHE_DIR",
+            Path(tempfile.gettempdir()).joinpath("naturwb_tiles").as_posix()),
+        "TIMEOUT": None,
+        "OPTIONS": {
+            "MAX_ENTRIES": 100000,
+            "MAX_SIZE": 2*1024**3,  # in bytes
+            # the files are only scanned when a limit is reached,
+            # then 1/CULL_FREQUENCY of the tiles get deleted
+            "CULL_FREQUENCY": 10,
+        }
+    }
+}
+NATURWB_RESULT_CACHE = "naturwb_results"
+NATURWB_RESULT_CACHE_TTL = 60*60*24*7  # in seconds
+NATURWB_RESULT_CACHE_GRID = 1  # in m
+NATURWB_PLOT_CACHE = "naturwb_plots"
+NATURWB_PLOT_CACHE_TTL = 60*60*24*30  # in seconds
+
+# the simplification of the polygons in the map of the result page
+# the tolerance in screen pixels and the decimals of the coordinates
+NATURWB_MAP_SIMPLIFY_PX = 0.5
+NATURWB_MAP_DECIMALS = 6
+
+# the vector tiles of the soil groups and NRE for the map of the result page
+# increase the version after an update of the simulation polygons
+NATURWB_TILE_CACHE = "naturwb_tiles"
+NATURWB_TILE_VERSION = 1
+NATURWB_TILE_MIN_ZOOM = 8
+NATURWB_TILE_MAX_ZOOM = 14
+NATURWB_TILE_MAX_AGE = 60*60*24*7  # in seconds, for the browser cache
+
+# the prebuilt input files of the simulations for the download,
+# build them with "python manage.py input_bundles build"
+NATURWB_INPUT_BUNDLE_DIR = getenv(
+    "NATURWB_INPUT_BUNDLE_DIR",
+    BASE_DIR.joinpath("naturwb/data/input_bundles").as_posix())
+NATURWB_INPUT_BUNDLE_SIZE = 2000  # sim_ids per partition
+
+# the number of recent downloads kept in the memory of every process
+NATURWB_DOWNLOAD_LRU_SIZE = 16
+
+# the cached results for the download (CachedResults),
+# deleted by the sheduled task naturwb.tasks.delete_cached_results
+NATURWB_CACHED_RESULTS_TTL = 20  # in minutes
+NATURWB_CACHED_RESULTS_DELETE_BATCH = 500
+
 GOOGLE_SITE_VERIFICATION_FILE = secrets.NATURWB_GOOGLE_VERIFICATION
 
 GDAL_LIBRARY_PATH = getenv("GDAL_LIBRARY_PATH")
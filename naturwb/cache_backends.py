@@ -0,0 +1,119 @@
+# the cache backends used by the naturwb app
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.core.cache.backends.filebased import FileBasedCache
+import os
+
+
+class LRUFileBasedCache(FileBasedCache):
+    """A file based cache, that evicts the least recently used entries.
+
+    Django's FileBasedCache deletes random entries if MAX_ENTRIES is reached.
+    Here every hit updates the modification time of the file
+    and the entries with the oldest modification time get deleted.
+    The expiry time (TIMEOUT) of an entry is not changed by a hit.
+    With the MAX_SIZE option (in bytes) the least recently used entries
+    also get deleted, if all the files together get bigger.
+    Like for MAX_ENTRIES, a 1/CULL_FREQUENCY part of MAX_SIZE is freed then.
+
+    The size of all the files is only scanned, when the cache gets culled.
+    In between it is estimated from the files written and deleted
+    by this process and the average size of the files
+    for the entries of the other processes.
+    """
+    _sentinel = object()
+
+    def __init__(self, dir, params):
+        super().__init__(dir, params)
+        self._max_size = params.get("OPTIONS", {}).get("MAX_SIZE", None)
+        # the size and number of the files since the last scan,
+        # None until the first scan of this process
+        self._size = None
+        self._n_files = 0
+
+    def get(self, key, default=None, version=None):
+        value = super().get(key, default=self._sentinel, version=version)
+        if value is self._sentinel:
+            return default
+        try:
+            os.utime(self._key_to_file(key, version))
+        except FileNotFoundError:
+            pass
+        return value
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        if self._max_size is None:
+            return super().set(key, value, timeout=timeout, version=version)
+
+        fname = self._key_to_file(key, version)
+        old_size = self._file_size(fname)
+        super().set(key, value, timeout=timeout, version=version)
+        new_size = self._file_size(fname)
+        if self._size is not None:
+            self._size += (new_size or 0) - (old_size or 0)
+            self._n_files += (new_size is not None) - (old_size is not None)
+
+    def _file_size(self, fname):
+        try:
+            return os.path.getsize(fname)
+        except FileNotFoundError:
+            return None
+
+    def _delete(self, fname):
+        size = self._file_size(fname) if self._size is not None else None
+        deleted = super()._delete(fname)
+        if deleted and size is not None:
+            self._size -= size
+            self._n_files -= 1
+        return deleted
+
+    def _estimated_size(self, num_entries):
+        """Estimate the size of all the files without reading them."""
+        if self._size is None:
+            return None
+        n_other = num_entries - self._n_files
+        if n_other <= 0 or self._n_files == 0:
+            return self._size
+        return self._size + n_other * self._size / self._n_files
+
+    def _cull(self):
+        filelist = self._list_cache_files()
+        num_entries = len(filelist)
+        if num_entries < self._max_entries:
+            if self._max_size is None:
+                return  # return early if no culling is required
+            size = self._estimated_size(num_entries)
+            if size is not None and size <= self._max_size:
+                return  # the size is still fine, no scan needed
+        if self._cull_frequency == 0 and num_entries >= self._max_entries:
+            return self.clear()  # Clear the cache when CULL_FREQUENCY = 0
+
+        # get the last use and size of every file, they could get deleted meanwhile
+        last_used = {}
+        sizes = {}
+        for fname in filelist:
+            try:
+                stat = os.stat(fname)
+            except FileNotFoundError:
+                continue
+            last_used[fname] = stat.st_mtime
+            sizes[fname] = stat.st_size
+
+        # delete the least recently used entries
+        filelist = sorted(last_used, key=last_used.get)
+        n_cull = 0
+        if num_entries >= self._max_entries:
+            n_cull = int(num_entries / self._cull_frequency)
+        total_size = sum(sizes[fname] for fname in filelist[n_cull:])
+        if self._max_size is not None and total_size > self._max_size:
+            # free some space, so the next writes don't scan again
+            target_size = self._max_size
+            if self._cull_frequency > 0:
+                target_size -= self._max_size / self._cull_frequency
+            while n_cull < len(filelist) and total_size > target_size:
+                total_size -= sizes[filelist[n_cull]]
+                n_cull += 1
+        self._size = None  # don't count the culled files twice
+        for fname in filelist[:n_cull]:
+            self._delete(fname)
+        self._size = total_size
+        self._n_files = len(filelist) - n_cull
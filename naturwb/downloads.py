@@ -0,0 +1,138 @@
+"""Find the results of a download without computing the query again.
+
+The download form sends the uuid of the result page and the urban polygon.
+The results are looked up in this order:
+
+1. the recent downloads in the memory of this process (LRU),
+2. the query state of the result page in the result cache,
+3. the results saved for the download (CachedResults),
+   rows that can't get decoded, e.g. pickled before GeoParquet, are skipped,
+4. the query of the urban polygon, from the result cache by the polygon
+   or computed again. Concurrent downloads of the same polygon
+   in this process wait for the same computation.
+"""
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from concurrent.futures import Future
+from collections import OrderedDict
+import pyarrow as pa
+import threading
+import logging
+
+from .functions.naturwb_sql import ids
+from .result_cache import ResultCache, geometry_key
+
+DOWNLOAD_LRU_SIZE = getattr(settings, "NATURWB_DOWNLOAD_LRU_SIZE", 16)
+
+logger = logging.getLogger(__name__)
+
+_recent = OrderedDict()
+_recent_lock = threading.Lock()
+_running = {}
+_running_lock = threading.Lock()
+
+
+def _get_recent(key):
+    with _recent_lock:
+        if key in _recent:
+            _recent.move_to_end(key)
+            return _recent[key]
+    return None
+
+
+def _set_recent(keys, data):
+    with _recent_lock:
+        for key in keys:
+            _recent[key] = data
+            _recent.move_to_end(key)
+        while len(_recent) > DOWNLOAD_LRU_SIZE:
+            _recent.popitem(last=False)
+
+
+def _deduplicated(key, func):
+    """Run the function once for all the concurrent calls with the same key."""
+    with _running_lock:
+        future = _running.get(key)
+        is_owner = future is None
+        if is_owner:
+            future = Future()
+            _running[key] = future
+    if is_owner:
+        try:
+            future.set_result(func())
+        except Exception as ex:
+            future.set_exception(ex)
+        finally:
+            with _running_lock:
+                del _running[key]
+    return future.result()
+
+
+def query_download_data(query):
+    """Get the results, the weather station ids and messages of a query."""
+    return (query.get_results_genid(),
+            ids(query.sim_infos["stat_id"]),
+            query.msgs)
+
+
+def get_download_data(cache_uuid=None, urban_shp=None, result_cache=None):
+    """Get the data of a download from the fastest available source.
+
+    Parameters
+    ----------
+    cache_uuid : str, optional
+        The uuid of the result page.
+        The default is None.
+    urban_shp : shapely.Polygon or MultiPolygon, optional
+        The urban polygon in EPSG:4326, to compute the query if needed.
+        The default is None.
+    result_cache : ResultCache, optional
+        The result cache with the query states of the result pages.
+        The default is None, which uses ResultCache().
+
+    Returns
+    -------
+    tuple of geopandas.GeoDataFrame, list of int and list of str or None
+        The results per soil group (Query.get_results_genid),
+        the weather station ids and the messages.
+        None if the results are expired and no polygon is given.
+    """
+    keys = []
+    if cache_uuid:
+        keys.append("uuid:" + str(cache_uuid))
+    if urban_shp is not None:
+        keys.append("geom:" + geometry_key(urban_shp))
+    for key in keys:
+        data = _get_recent(key)
+        if data is not None:
+            _set_recent(keys, data)
+            return data
+
+    data = None
+    if cache_uuid:
+        query = (result_cache or ResultCache()).get_result(cache_uuid)
+        if query is not None:
+            data = query_download_data(query)
+        else:
+            from .models import CachedResults
+            try:
+                data = CachedResults.objects.get_cache(uuid=cache_uuid)
+            except (CachedResults.DoesNotExist, ValidationError):
+                pass
+            except (ValueError, OSError, KeyError, TypeError,
+                    pa.ArrowException):
+                # e.g. a legacy row with the pickled results
+                # or a broken GeoParquet, compute the query again
+                logger.warning(
+                    "The cached results %s can't get decoded.", cache_uuid,
+                    exc_info=True)
+
+    if data is None and urban_shp is not None:
+        # imported here, as the views import this module
+        from .views import make_query
+        data = _deduplicated(
+            keys[-1], lambda: query_download_data(make_query(urban_shp)))
+
+    if data is not None:
+        _set_recent(keys, data)
+    return data
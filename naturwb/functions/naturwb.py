@@ -22,6 +22,7 @@
 import geopandas as gpd
 import pandas as pd
 from getpass import getpass
+import shapely
 from shapely.geometry import Polygon, MultiPolygon
 try:
     from shapely.geometry.polygon import PolygonAdapter
@@ -34,7 +35,6 @@ except:
 import numpy as np
 import sqlalchemy
 import json
-from textwrap import wrap
 try:
     import importlib.resources as pkg_resources
 except ImportError:
@@ -46,45 +46,164 @@ except ImportError:
         from .. import data
     except ImportError:
         import data
-from io import BytesIO
-import base64
-
-# plotly
-import plotly as ply
-import plotly.graph_objs as go
-from plotly.offline import plot as ply_plot
-
-# matplotlib
-from matplotlib import pyplot as plt
-import matplotlib as mpl
-from matplotlib.sankey import Sankey
-from matplotlib.path import Path as mplPath
-from matplotlib.patches import PathPatch
-from matplotlib import cm
-import contextily as cx
+try:
+    from .naturwb_sql import (
+        prepare, ids, view_exists, NOLANU_DISTS,
+        REF_LANUS_VIEW, REF_NOLANU_VIEW)
+except ImportError:
+    from naturwb_sql import (
+        prepare, ids, view_exists, NOLANU_DISTS,
+        REF_LANUS_VIEW, REF_NOLANU_VIEW)
+try:
+    from .naturwb_agg import aggregate_levels, renormalise_bfid_area
+except ImportError:
+    from naturwb_agg import aggregate_levels, renormalise_bfid_area
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import multiprocessing
+import time
+import os
 
 # load messages file
 with pkg_resources.open_text(
     data, "naturwb_messages.json", encoding="utf8") as f:
     MSGS_RAW = json.load(f)
-mpl.rcParams['hatch.linewidth'] = 2
 
-# changed Sankey class
-class _SankeyNWB(Sankey):
-    def finish(self):
-        return self.diagrams
+def _plot_module():
+    """Import the plot module, only when the first plot is made."""
+    try:
+        from . import naturwb_plot
+    except ImportError:
+        import naturwb_plot
+    return naturwb_plot
+
+# the simplification of the polygons for the interactive map
+# the tolerance is given in screen pixels at the initial zoom level
+# plus MAP_ZOOM_RESERVE levels, so the edges still look sharp when zooming in
+MAP_SIMPLIFY_PX = 0.5
+MAP_ZOOM_RESERVE = 2
+MAP_DECIMALS = 6 # about 0.1 m
 
-# plot transfer functions
-def _mpl_fig_to_graphic(fig, dpi=75):
-    fig.set_dpi(dpi)
-    with BytesIO() as buffer:
-        fig.savefig(buffer, format="png", bbox_inches="tight")
-        buffer.seek(0)
-        image_png = buffer.getvalue()
-    graphic = base64.b64encode(image_png)
-    graphic = graphic.decode('utf-8')
+def _simplify_for_map(geoms, tolerance, decimals=MAP_DECIMALS):
+    """Simplify and round the polygons of a map in EPSG:4326.
+
+    The polygons are simplified as coverage if possible,
+    so the shared edges of neighbouring polygons stay shared.
+
+    Parameters
+    ----------
+    geoms : geopandas.GeoSeries
+        The polygons in EPSG:4326.
+    tolerance : float or None
+        The tolerance of the simplification in degrees.
+        If None or 0, the polygons are not simplified.
+    decimals : int or None, optional
+        The number of decimals to round the coordinates to.
+        If None, the coordinates are not rounded.
+        The default is MAP_DECIMALS.
+
+    Returns
+    -------
+    geopandas.GeoSeries
+        The simplified polygons.
+    """
+    values = geoms.values.to_numpy()
+    if tolerance:
+        if hasattr(shapely, "coverage_simplify"):
+            # needs shapely >= 2.1 with GEOS >= 3.12
+            values = shapely.coverage_simplify(values, tolerance)
+        else:
+            values = shapely.simplify(values, tolerance, preserve_topology=True)
+    if decimals is not None:
+        values = shapely.transform(
+            values, lambda coords: np.round(coords, decimals))
+    return gpd.GeoSeries(values, index=geoms.index, crs=geoms.crs)
+
+# the concurrent plot rendering
+# the plotly figures are rendered in threads,
+# the matplotlib figures, that only need these attributes, in processes
+# as matplotlib holds the GIL while drawing
+PLOT_WORKERS = min(4, os.cpu_count() or 1)
+_PLOTLY_KINDS = ["pie_plotly", "pie_landuse", "sim_shps_clip_plotly", "ternary"]
+_PROCESS_KINDS = {"sankey": ["naturwb_ref"], "pie": ["naturwb_ref"]}
+_PROCESS_POOL = None
+
+def _get_process_pool(max_workers):
+    """Get the process pool for the plots, it is reused by all the queries.
+
+    The workers are started by a forkserver (or spawned on Windows),
+    as forking a process with running threads, e.g. of the plotly renderer
+    or the web server, can deadlock the child on inherited locks.
+    """
+    global _PROCESS_POOL
+    if _PROCESS_POOL is None:
+        if "forkserver" in multiprocessing.get_all_start_methods():
+            mp_context = multiprocessing.get_context("forkserver")
+        else:
+            mp_context = multiprocessing.get_context("spawn")
+        _PROCESS_POOL = ProcessPoolExecutor(
+            max_workers=max_workers, mp_context=mp_context)
+    return _PROCESS_POOL
+
+def _timed(func, *args, **kwargs):
+    """Run the function and return the result and the time in seconds."""
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+def _plot_web_state(state, kind, kwargs):
+    """Render a plot in a worker process from some attributes of a query."""
+    query = Query.__new__(Query)
+    query.__dict__.update(state)
+    query.db_engine = None
+    return _timed(query.plot_web, kind, **kwargs)
+
+# the columns and index of the tables in the single round trip query
+_SINGLE_QUERY_TABLES = {
+    "clip": dict(
+        columns=["sim_id", "gen_id", "nat_id", "geometry", "area",
+                 "color", "leg_tkle_txt", "leg_tkle_kurz"],
+        index_col=["sim_id", "gen_id", "nat_id"]),
+    "ref_lanus": dict(
+        columns=["gen_id", "nat_id", "lanu_id", "area", "lanu_name", "coef"],
+        index_col=["gen_id", "nat_id", "lanu_id"]),
+    "results": dict(
+        columns=["sim_id", "gen_id", "lanu_id", "bf_id", "n", "kap.A.",
+                 "et", "oa", "za", "bfid_area", "inf", "tp", "pet",
+                 "za_gwnah_flag"],
+        index_col=["sim_id", "gen_id", "bf_id", "lanu_id"]),
+    "sim_infos": dict(
+        columns=["sim_id", "stat_id", "buek_flag", "bfid_undef",
+                 "lanu_flag", "wea_flag", "wea_dist", "wea_flag_n",
+                 "wea_dist_n", "sl_flag", "sl_dist", "sl_std", "sun_flag",
+                 "sun_dist", "rs_std", "wea_t_std", "wea_et_std",
+                 "wea_n_wihj_std", "wea_n_sohj_std"],
+        index_col="sim_id")
+}
+
+def _json_to_df(records, table):
+    """Convert the JSON array of a single round trip query to a DataFrame.
 
-    return graphic
+    Parameters
+    ----------
+    records : list of dict or None
+        The records as returned by json_agg.
+        None if the table was empty.
+    table : str
+        The name of the table in _SINGLE_QUERY_TABLES.
+
+    Returns
+    -------
+    pandas.DataFrame
+        The DataFrame with the same columns and index
+        as with the separate queries.
+    """
+    spec = _SINGLE_QUERY_TABLES[table]
+    if isinstance(records, str):
+        records = json.loads(records)
+    return pd.DataFrame.from_records(
+        records or [], columns=spec["columns"]
+        ).set_index(spec["index_col"])
 
 
 # own classes
@@ -255,7 +374,8 @@ class Query(object):
         The clip of the lookup tabel with the urban_shp Polygon
         in UTM (EPSG=25832).
     ref_lanus : pandas.DataFrame
-        The DataFrame with all the landuse reference fields and their area.
+        The DataFrame with all the landuse reference fields, their area
+        and their coefficient per soil group and NRE.
     results : pandas.DataFrame
         The DataFrame with all the single simulation results from the database.
         These are the results without the aggregation.
@@ -410,7 +530,9 @@ class Query(object):
     """
 
     def __init__(self, urban_shp, db_engine=None,
-                 urban_shp_crs="EPSG:4326", do_plots=False):
+                 urban_shp_crs="EPSG:4326", do_plots=False,
+                 single_query=True, precomputed_lanus=True,
+                 exact_nolanu=False, progress=None):
         """
         Initiate the query. This is the only function needed to make the query.
 
@@ -435,24 +557,41 @@ class Query(object):
         do_plots : bool, optional
             should the basic plots get created while initiating the object?
             The default is False.
+        single_query : bool, optional
+            Should the basic tables (clip, ref_lanus, results and sim_infos)
+            get fetched from the database in one single round trip?
+            If False, the four tables are requested one after another.
+            The default is True.
+        precomputed_lanus : bool, optional
+            Should the landuse coefficients get read from the materialized view,
+            that is built with "python manage.py lanu_coefs build"?
+            If False, they are computed live from the lookup polygons,
+            e.g. to validate the materialized view.
+            If the view is not built yet, they are always computed live.
+            The default is True.
+        exact_nolanu : bool, optional
+            Should the landuses for soil groups without natural landuse
+            in the same NRE get searched in the exact distance bands
+            around the urban polygon?
+            If False, the precomputed distance bands around the grid cell
+            of the urban polygon are used and only the soil groups
+            that are not in the grid get searched exactly.
+            Only the cell with the point on the surface of the urban polygon
+            is looked up, so for polygons spanning several cells the
+            distances are measured from this cell and not from the polygon.
+            If the view is not built yet, they are always searched exactly.
+            The default is False.
+        progress : callable, optional
+            A function that gets called with the name of every stage
+            ("sql", "aggregation") when it starts, e.g. to report the progress.
+            The default is None.
 
         Returns
         -------
         None.
 
         """
-        # check if GeoSeries
-        if type(urban_shp) in [Polygon, MultiPolygon, PolygonAdapter, MultiPolygonAdapter]:
-            urban_shp_gs = gpd.GeoSeries(urban_shp, crs=urban_shp_crs)
-        elif type(urban_shp) == gpd.GeoSeries:
-            urban_shp_gs = urban_shp
-        else:
-            raise ValueError("The file format for the given urban_shape is not valid.")
-
-        # convert to UTM or WGS84 and export shapely Polygon
-        self.urban_shp_wgs = urban_shp_gs.to_crs(4326)
-        self.urban_shp_utm = urban_shp_gs.to_crs(25832)
-        self.urban_shp = self.urban_shp_utm.iloc[0]
+        self._set_urban_shp(urban_shp, urban_shp_crs)
 
         # save database engine to the naturwb database
         if db_engine is None:
@@ -461,21 +600,102 @@ class Query(object):
             self.db_engine = db_engine
 
         # do the sql queries
+        self.single_query = single_query
+        self.precomputed_lanus = precomputed_lanus
+        self.exact_nolanu = exact_nolanu
+        if progress is not None:
+            progress("sql")
         self._sql_query_basics()
 
         # aggregate the results
+        if progress is not None:
+            progress("aggregation")
         self._aggregate_results()
 
         # make the basic plots
         if do_plots:
-            self._make_plot_sim_shps_clip()
-            self._make_plot_pie()
-            self._make_plot_ternary()
-            self._make_plot_sankey()
+            for kind in ["sim_shps_clip", "pie", "ternary", "sankey"]:
+                self.plot(kind)
 
         # create the messages
         self._make_msgs()
 
+    # the attributes needed to restore the results and plots of a query
+    STATE_ATTRS = ["naturwb_ref", "coef_all", "res_gat_2", "res_sim",
+                   "coef_sim", "coef_gen", "sim_shps_clip", "sim_infos", "msgs"]
+
+    @classmethod
+    def from_state(cls, state, urban_shp, db_engine=None,
+                   urban_shp_crs="EPSG:4326"):
+        """
+        Restore a query from the state of a former query without any computation.
+
+        Parameters
+        ----------
+        state : dict
+            The state of the former query, see get_state.
+        urban_shp : shapely.Polygon or geopandas.GeoSeries
+            The urban Polygon of the query, see __init__.
+        db_engine : sqlalchemy.engine, optional.
+            The database engine to the NatUrWB database.
+            It is only needed for the plots that need further informations
+            from the database.
+            The default is None.
+        urban_shp_crs : str of crs type, optional
+            The coordinate reference system of the input urban_shp.
+            The default is "EPSG:4326"
+
+        Returns
+        -------
+        naturwb.Query
+            The restored query.
+        """
+        query = cls.__new__(cls)
+        query._set_urban_shp(urban_shp, urban_shp_crs)
+        query.db_engine = db_engine
+        for attr in cls.STATE_ATTRS:
+            setattr(query, attr, state[attr])
+        return query
+
+    def get_state(self):
+        """
+        Get the state of the query to restore it later with from_state.
+
+        Returns
+        -------
+        dict
+            The attributes of STATE_ATTRS.
+        """
+        return {attr: getattr(self, attr) for attr in self.STATE_ATTRS}
+
+    def _set_urban_shp(self, urban_shp, urban_shp_crs):
+        """Save the urban shape in UTM and WGS84."""
+        # check if GeoSeries
+        if type(urban_shp) in [Polygon, MultiPolygon, PolygonAdapter, MultiPolygonAdapter]:
+            urban_shp_gs = gpd.GeoSeries(urban_shp, crs=urban_shp_crs)
+        elif type(urban_shp) == gpd.GeoSeries:
+            urban_shp_gs = urban_shp
+        else:
+            raise ValueError("The file format for the given urban_shape is not valid.")
+
+        # convert to UTM or WGS84 and export shapely Polygon
+        self.urban_shp_wgs = urban_shp_gs.to_crs(4326)
+        self.urban_shp_utm = urban_shp_gs.to_crs(25832)
+        self.urban_shp = self.urban_shp_utm.iloc[0]
+
+    @staticmethod
+    def _plot_kind(kind):
+        """Get the name of the plot kind, like in the fig_<kind> attribute."""
+        kind = kind.lower()
+
+        # change lookup_clip to sim_shps__clip for backwords compatibility
+        for test, repl in zip(["lookup_clip", "lookup_clip_plotly"],
+                            ["sim_shps_clip", "sim_shps_clip_plotly"]):
+            if kind==test:
+                kind = repl
+                FutureWarning("The lookup_clip is not called anymore lookup_clip but sim_shps_clip. Please consider this, as in future, the lookup_clip will get removed completely")
+        return kind
+
     def plot(self, kind="pie", renew=True, **kwargs):
         """
         Plot the results.
@@ -494,7 +714,8 @@ class Query(object):
             If False only create the figur if it was not already created.
             The default is True.
         **kwargs : dict, optional
-            The Keyword arguments to be handed to the _make_plot_* function.
+            The Keyword arguments to be handed to the
+            naturwb_plot.QueryPlots._make_plot_* function.
 
         Returns
         -------
@@ -502,14 +723,7 @@ class Query(object):
             The figure object of the plot.
 
         """
-        kind = kind.lower()
-
-        # change lookup_clip to sim_shps__clip for backwords compatibility
-        for test, repl in zip(["lookup_clip", "lookup_clip_plotly"],
-                            ["sim_shps_clip", "sim_shps_clip_plotly"]):
-            if kind==test:
-                kind = repl
-                FutureWarning("The lookup_clip is not called anymore lookup_clip but sim_shps_clip. Please consider this, as in future, the lookup_clip will get removed completely")
+        kind = self._plot_kind(kind)
 
         # check if kind is valid
         valid_kinds = [
@@ -524,11 +738,13 @@ class Query(object):
 
         # if the figure got not already created, create it now
         if not hasattr(self, "fig_" + kind) or renew:
-            getattr(self, "_make_plot_" + kind)(**kwargs)
+            getattr(_plot_module().QueryPlots, "_make_plot_" + kind)(
+                self, **kwargs)
 
         return getattr(self, "fig_" + kind)
 
-    def plot_web(self, kind, dpi=75, **kwargs):
+    def plot_web(self, kind, dpi=75, fmt="png", bbox_inches="tight",
+                 keep=False, **kwargs):
         """Generate a plot to use in a website.
 
         Uses the Query.plot method to produce the plot.
@@ -538,23 +754,162 @@ class Query(object):
         dpi : int, optional
             The dpi value for a matplotlib plot to use
             The default is 75.
+        fmt : str or list of str, optional
+            The output format of a matplotlib plot,
+            one of naturwb_plot.MPL_WEB_FORMATS or "web",
+            which is webp or png if Pillow can't write webp.
+            If a list is given, the plot is saved in all of the formats
+            and the smallest output is returned, e.g. to compare them.
+            The default is "png".
+        bbox_inches : str or None, optional
+            The bbox_inches of matplotlib's savefig.
+            "tight" cuts the white space, but takes an extra pass.
+            The default is "tight".
+        keep : bool, optional
+            Should the figure be kept as fig_<kind> attribute of the query?
+            If False, the figure is released after it got converted,
+            so a long running server doesn't pile up figures.
+            The default is False.
         **kwargs : dict
             The keyword arguments to be handed to the Query.plot method.
 
         Returns
         -------
-        string of img64 or plotly.offline.plot
+        string of a data URI or plotly.offline.plot
             Depending on the kind of plot produced
-            a 64 bytes string image is returned(matplotlib)
+            a data URI with the base64 encoded image is returned (matplotlib),
+            e.g. to use as src of an img tag,
             or a html string for plotly plots is returned.
         """
         fig = self.plot(kind=kind, **kwargs)
-        if type(fig) == mpl.figure.Figure:
-            return _mpl_fig_to_graphic(fig, dpi=dpi)
-        elif type(fig) == go.Figure:
-            return ply_plot(fig, output_type='div', include_plotlyjs=False)
+        web = _plot_module().fig_to_web(
+            fig, dpi=dpi, fmt=fmt, bbox_inches=bbox_inches)
+        if not keep:
+            # only drop the own figure, the threads of plot_web_many
+            # set the figures of the other kinds meanwhile
+            self.__dict__.pop("fig_" + self._plot_kind(kind), None)
+            _plot_module().release_figure(fig)
+        return web
+
+    def plot_data(self, kind):
+        """Get the data of a plot to render it in the browser.
+
+        Only a few numbers are needed for the sankey and the pie figures,
+        so they can get rendered in the browser (e.g. with plotly.js)
+        instead of sending the image.
+
+        Parameters
+        ----------
+        kind : str
+            The kind of the plot,
+            one of "sankey", "pie", "pie_landuse" or "map".
+
+        Returns
+        -------
+        dict
+            The JSON serializable data of the plot.
+            The water balance components in mm/a for the sankey,
+            the relative components for the pie,
+            the labels, values and colors for the landuse pie
+            and the GeoJSON and bounds of the urban polygon in EPSG:4326
+            for the map, which shows the soils and NRE from vector tiles.
+        """
+        if kind == "sankey":
+            df_sankey = self.naturwb_ref.copy()
+            df_sankey["za_oa"] = df_sankey["za"] - df_sankey["za_gwnah"]
+            return {
+                para: round(float(df_sankey[para]), 1)
+                for para in ["n", "kap.A.", "et", "pet", "oa", "za",
+                             "za_oa", "za_gwnah", "tp", "runoff"]}
+        elif kind == "pie":
+            return {
+                para: round(float(self.naturwb_ref[para + "_rel"]), 4)
+                for para in ["runoff", "tp", "et"]}
+        elif kind == "pie_landuse":
+            lanu_parts = _plot_module().QueryPlots._get_lanu_parts(self)
+            return {
+                "labels": lanu_parts["name"].to_list(),
+                "values": lanu_parts["coef"].round(4).to_list(),
+                "colors": lanu_parts["colors"].to_list()}
+        elif kind == "map":
+            urban_shp = _simplify_for_map(self.urban_shp_wgs, None)
+            return {
+                "urban": json.loads(urban_shp.to_json()),
+                "bounds": [round(bound, MAP_DECIMALS)
+                           for bound in urban_shp.total_bounds.tolist()]}
         else:
-            return None
+            raise ValueError(
+                "There is no data for the plot kind {kind}.".format(kind=kind))
+
+    def plot_web_many(self, plots, max_workers=PLOT_WORKERS):
+        """Generate several plots to use in a website concurrently.
+
+        The plotly figures are rendered in a thread pool,
+        the matplotlib sankey and pie in a process pool.
+        The other matplotlib figures are rendered one after another,
+        like the process plots if their worker fails.
+
+        Parameters
+        ----------
+        plots : dict of tuple
+            The plots to render as name: (kind, kwargs),
+            the kwargs are handed to the Query.plot_web method.
+        max_workers : int, optional
+            The maximal number of threads and processes.
+            The default is PLOT_WORKERS.
+
+        Returns
+        -------
+        dict, dict
+            The output of plot_web and the rendering time in seconds
+            for every name.
+        """
+        # processes can't get started from daemonic processes, e.g. django-q
+        use_processes = not multiprocessing.current_process().daemon
+
+        futures = {}
+        process_names = set()
+        results = {}
+        with ThreadPoolExecutor(max_workers=max_workers) as threads:
+            for name, (kind, kwargs) in plots.items():
+                if use_processes and kind in _PROCESS_KINDS:
+                    state = {attr: getattr(self, attr)
+                             for attr in _PROCESS_KINDS[kind]}
+                    try:
+                        futures[name] = _get_process_pool(max_workers).submit(
+                            _plot_web_state, state, kind, kwargs)
+                        process_names.add(name)
+                    except Exception:
+                        # no worker could get started,
+                        # the plot is rendered in this thread below
+                        pass
+                elif kind in _PLOTLY_KINDS:
+                    futures[name] = threads.submit(
+                        _timed, self.plot_web, kind, **kwargs)
+
+            # the other matplotlib plots in this thread
+            for name, (kind, kwargs) in plots.items():
+                if name not in futures:
+                    results[name] = _timed(self.plot_web, kind, **kwargs)
+
+            for name, future in futures.items():
+                if name not in process_names:
+                    results[name] = future.result()
+                    continue
+                # render in this process, if the worker failed,
+                # e.g. the pool broke or the state couldn't get pickled.
+                # Errors of the plot itself get raised again in here
+                try:
+                    results[name] = future.result()
+                except Exception as ex:
+                    if isinstance(ex, BrokenProcessPool):
+                        global _PROCESS_POOL
+                        _PROCESS_POOL = None
+                    kind, kwargs = plots[name]
+                    results[name] = _timed(self.plot_web, kind, **kwargs)
+
+        return ({name: results[name][0] for name in plots},
+                {name: results[name][1] for name in plots})
 
     def get_msgs(self, kind="str"):
         """Get the messages of the NatUrWB Query.
@@ -590,146 +945,136 @@ class Query(object):
         Make the basic queries to the NatUrWB Database.
         Save the resulting tables in object.
 
+        Depending on the single_query attribute the tables are fetched
+        in one round trip or with four consecutive queries.
+
+        Returns
+        -------
+        None.
+
+        """
+        if getattr(self, "single_query", True):
+            self._sql_query_basics_single()
+        else:
+            self._sql_query_basics_multi()
+
+        self.sim_shps_clip["anteil"] = (self.sim_shps_clip["area"] /
+                                        self.sim_shps_clip["area"].sum())
+        self.sim_infos = self.sim_infos.join(
+            self.sim_shps_clip[["anteil", "area"]].groupby("sim_id").sum())
+
+    def _statement(self, con, name):
+        """Get the name of the statement with precomputed or live landuses.
+
+        The landuses are computed live, if the materialized view
+        is not built yet.
+        """
+        if (getattr(self, "precomputed_lanus", True) and
+                view_exists(con, REF_LANUS_VIEW)):
+            return name
+        else:
+            return name + "_live"
+
+    def _sql_query_basics_single(self):
+        """
+        Get the basic tables from the NatUrWB Database in one round trip.
+
+        The four result sets (clip, ref_lanus, results and sim_infos)
+        are computed in one CTE-query on the server
+        and returned as JSON arrays in one single row.
+        The id lists for the later tables are therefor
+        taken directly from the clip on the server.
+
         Returns
         -------
         None.
 
         """
         with self.db_engine.connect() as con:
-            # clip urban shape with lookup table
+            clip, ref_lanus, results, sim_infos = con.execute(
+                prepare(con, self._statement(con, "basics")),
+                dict(urban_wkb=self.urban_shp.wkb)).first()
+
+        # decode the JSON arrays into the DataFrames
+        sim_shps_clip = _json_to_df(clip, "clip")
+        sim_shps_clip["geometry"] = gpd.GeoSeries.from_wkb(
+            sim_shps_clip["geometry"], index=sim_shps_clip.index, crs=25832)
+        self.sim_shps_clip = gpd.GeoDataFrame(
+            sim_shps_clip, geometry="geometry", crs=25832)
+        self.ref_lanus = _json_to_df(ref_lanus, "ref_lanus")
+        self.results = _json_to_df(results, "results")
+        self.sim_infos = _json_to_df(sim_infos, "sim_infos")
+
+    def _sql_query_basics_multi(self):
+        """
+        Get the basic tables from the NatUrWB Database with four queries.
+
+        This is the fallback to the single round trip query.
 
-            sql_clip = f"""
-                WITH urban_geom AS (
-                        SELECT ST_GeomFromText('{self.urban_shp.wkt}', 25832) as geom
-                    ), clip_sim AS (
-                        SELECT sim_id, gen_id, sym_nr, tkle_nr,
-                            ST_Intersection(geom, (SELECT geom from urban_geom)) as geom
-                        FROM tbl_simulation_polygons
-                        WHERE ST_Intersects(geom, (SELECT geom from urban_geom))
-                    ), inters AS (
-                        SELECT sim_id, gen_id, sym_nr, tkle_nr,
-                            tn.nat_id,
-                            ST_Intersection(cs.geom, tn.geom) as geom
-                        FROM clip_sim cs
-                        JOIN tbl_nre tn
-                        ON ST_Intersects(cs.geom, tn.geom)
-                )
-                SELECT inters.sim_id, inters.gen_id, inters.nat_id,
-                        ST_UNION(geom) as geometry,
-                        SUM(ST_AREA(geom)) AS area,
-                        lbc.color , ltn.txt as leg_tkle_txt,
-                        ltn.kurz as leg_tkle_kurz
-                    FROM inters
-                    JOIN leg_buek_col lbc ON lbc.sym_nr=inters.sym_nr
-                    JOIN leg_tklenr ltn ON ltn.tkle_nr=inters.tkle_nr
-                    WHERE ST_Dimension(inters.geom)=2
-                    GROUP BY inters.sim_id, inters.gen_id, inters.nat_id,
-                            lbc.color, ltn.txt, ltn.kurz;"""
+        Returns
+        -------
+        None.
 
+        """
+        with self.db_engine.connect() as con:
+            # clip urban shape with lookup table
             self.sim_shps_clip = gpd.read_postgis(
-                sql=sql_clip,
+                sql=prepare(con, "clip"),
                 con = con,
+                params=dict(urban_wkb=self.urban_shp.wkb),
                 geom_col="geometry",
                 index_col=["sim_id", "gen_id", "nat_id"])
-            self.sim_shps_clip["anteil"] = (self.sim_shps_clip["area"] /
-                                          self.sim_shps_clip["area"].sum())
 
             # lookup for landuses in the same NRE with same soil
-            sql_ref_lanus = (
-                "SELECT gen_id, nat_id, tlp.lanu_id, SUM (area) AS area, " +
-                "ll.name as lanu_name FROM tbl_lookup_polygons tlp " +
-                "JOIN leg_lanuid ll ON ll.lanu_id=tlp.lanu_id " +
-                "WHERE gen_id IN ({genid}) AND nat_id IN ({natid}) " +
-                    "AND NOT is_urban " +
-                "GROUP BY gen_id, nat_id, tlp.lanu_id, ll.name").format(
-                    genid=", ".join(self.sim_shps_clip.index
-                                    .get_level_values("gen_id")
-                              .unique().astype(str)),
-                    natid=", ".join(self.sim_shps_clip.index
-                                    .get_level_values("nat_id")
-                              .unique().astype(str)))
-
             self.ref_lanus = pd.read_sql(
-                sql=sql_ref_lanus,
+                sql=prepare(con, self._statement(con, "ref_lanus")),
                 con = con,
+                params=dict(
+                    gen_ids=ids(self.sim_shps_clip.index
+                                .get_level_values("gen_id")),
+                    nat_ids=ids(self.sim_shps_clip.index
+                                .get_level_values("nat_id"))),
                 index_col=["gen_id", "nat_id", "lanu_id"])
 
             # get the results
-            sql_results = ('''
-                SELECT tr.sim_id, tsp.gen_id, tr.lanu_id, tr.bf_id,
-                        n, "kap.A.", et, oa, za, bfid_area, inf, tp, wea_et as pet,
-                        za_gwnah_flag
-                FROM tbl_simulation_polygons tsp
-                INNER JOIN tbl_results tr on tsp.sim_id = tr.sim_id
-                INNER JOIN tbl_soils ts on tr.bf_id = ts.bf_id
-                WHERE tsp.sim_id IN ({0})'''.format(
-                    ", ".join(self.sim_shps_clip.index.get_level_values("sim_id")
-                              .unique().astype(str)))
-                )
-
+            sim_ids = ids(self.sim_shps_clip.index.get_level_values("sim_id"))
             self.results = pd.read_sql(
-                sql=sql_results,
+                sql=prepare(con, "results"),
                 con=con,
+                params=dict(sim_ids=sim_ids),
                 index_col=["sim_id", "gen_id", "bf_id", "lanu_id"])
 
             # get the simulation informations like flags etc.
-            sql_sim_infos = ("""
-                SELECT sim_id, stat_id, buek_flag, bfid_undef,
-                       lanu_flag, wea_flag, wea_dist, wea_flag_n, wea_dist_n,
-                       sl_flag, sl_dist, sl_std, sun_flag, sun_dist, rs_std,
-                       wea_t_std, wea_et_std, wea_n_wihj_std, wea_n_sohj_std
-                FROM tbl_simulation_polygons tsp
-                    JOIN tbl_soils ts ON ts.gen_id=tsp.gen_id
-                WHERE sim_id IN ({simids})
-                GROUP BY sim_id, buek_flag, lanu_flag, wea_flag, wea_dist,
-                         sl_flag, sl_dist, sun_flag, sun_dist, bfid_undef;"""
-                ).format(
-                    simids=", ".join(self.sim_shps_clip.index
-                                     .get_level_values("sim_id")
-                                     .unique().astype(str)))
-
             self.sim_infos = pd.read_sql(
-                sql=sql_sim_infos,
+                sql=prepare(con, "sim_infos"),
                 con=con,
+                params=dict(sim_ids=sim_ids),
                 index_col="sim_id")
-            self.sim_infos = self.sim_infos.join(
-                self.sim_shps_clip[["anteil", "area"]].groupby("sim_id").sum())
 
     def _sql_query_ref_polys(self):
         """
         Get the reference shapes from the database from which the landuses were taken
         """
-        sql_ref_polys = (
-            "SELECT gen_id, nat_id, tlp.lanu_id, area, " +
-            "ll.name as lanu_name, geom as geometry " +
-            "FROM tbl_lookup_polygons tlp " +
-            "JOIN leg_lanuid ll ON ll.lanu_id=tlp.lanu_id " +
-            "WHERE gen_id IN ({0}) AND nat_id IN ({1}) " +
-                "AND not is_urban;").format(
-            ", ".join(self.sim_shps_clip.index.get_level_values("gen_id")\
-                      .unique().astype(str)),
-            ", ".join(self.sim_shps_clip.index.get_level_values("nat_id")\
-                      .unique().astype(str)))
-
         with self.db_engine.connect() as con:
             self.ref_polys = gpd.read_postgis(
-                sql=sql_ref_polys,
+                sql=prepare(con, "ref_polys"),
                 con=con,
+                params=dict(
+                    gen_ids=ids(self.sim_shps_clip.index
+                                .get_level_values("gen_id")),
+                    nat_ids=ids(self.sim_shps_clip.index
+                                .get_level_values("nat_id"))),
                 geom_col="geometry",
                 index_col=["gen_id", "nat_id", "lanu_id"])
 
     def _sql_nre(self):
-        sql_nre = (
-            """SELECT nat_id, name,
-                      ST_Transform(geom, 4326) geometry
-               FROM tbl_nre
-               WHERE tbl_nre.nat_id in ({});""".format(
-                ", ".join(self.sim_shps_clip.index.get_level_values("nat_id")
-                          .unique().astype(str))))
         with self.db_engine.connect() as con:
             self.nre = gpd.read_postgis(
-                sql=sql_nre,
+                sql=prepare(con, "nre"),
                 con=con,
+                params=dict(
+                    nat_ids=ids(self.sim_shps_clip.index
+                                .get_level_values("nat_id"))),
                 geom_col="geometry",
                 index_col="nat_id",
                 crs=4326)
@@ -778,27 +1123,12 @@ class Query(object):
         # --------
         # check for forced landuses for one soil profile
         if (self.sim_infos["lanu_flag"] == 2).sum() > 0:  # alt: (results["bfid_area"].groupby(["sim_id", "lanu_id"]).sum() != 100).sum()>0:
-            for (simid, genid, lanuid), df \
-                    in results.groupby(["sim_id", "gen_id", "lanu_id"]):
-                sum_area = df["bfid_area"].sum()
-                results.loc[
-                    (simid, genid, slice(None), lanuid), "bfid_area"] = (
-                        df["bfid_area"] / sum_area * 100)
-
-        # aggregate
-        res_gat_1 = results[res_agg_cols].copy()
-        res_gat_1 = res_gat_1.mul(results["bfid_area"].div(100).to_list(),
-                                  axis=0)
-        self.res_gat_1 = res_gat_1.groupby(["sim_id", "gen_id", "lanu_id"]
-                                           ).sum()
+            results["bfid_area"] = renormalise_bfid_area(results["bfid_area"])
 
         # 2. lanu_id
         # ----------
         # get landus distribution
-        self.coef_lanu = (self.ref_lanus[["area"]] /
-                          self.ref_lanus[["area"]].groupby(
-                              ["gen_id", "nat_id"]).sum())
-        self.coef_lanu.rename({"area":"coef"}, axis=1, inplace=True)
+        self.coef_lanu = self.ref_lanus[["coef"]].copy()
 
         # get missing landuses if soil group has no natural lanu in same NRE
         self.missing_lanus = (
@@ -813,81 +1143,70 @@ class Query(object):
 
         # check for those missing landuses in the surrounding areas
         if len(self.missing_lanus) != 0:
-            sql_urban_geom = f"ST_GeomFromText('{self.urban_shp.wkt}', 25832)"
-            sql_ref_nolanu_raw = (
-                "SELECT gen_id, lanu_id, SUM(area) as area " +
-                "FROM tbl_lookup_polygons "+
-                "WHERE ST_Intersects(geom, " +
-                        "(ST_Buffer({urban_geom}, {dist}))) " +
-                    "AND gen_id IN ({genids}) "+
-                    "AND not is_urban " +
-                "GROUP BY gen_id, lanu_id")
-
             missing_genids = \
                 self.missing_lanus.index.get_level_values("gen_id").unique()
 
-            # itterate over different distances to find landuses on same soil
+            # search the landuses on same soil in the distance bands at once
+            # every gen_id only gets the landuses of its smallest band
             with self.db_engine.connect() as con:
-                for dist in [30, 60, 90, 120]:
+                if (getattr(self, "exact_nolanu", False) or
+                        not view_exists(con, REF_NOLANU_VIEW)):
+                    ref_nolanu = None
+                else:
+                    # lookup in the precomputed grid
                     ref_nolanu = pd.read_sql(
-                        sql=sql_ref_nolanu_raw.format(
-                            dist=dist*1000,
-                            genids=", ".join(missing_genids.astype(str)),
-                            urban_geom=sql_urban_geom),
-                        con=con, index_col=["gen_id",  "lanu_id"])
-
-                    if len(ref_nolanu)>0:
-                        resolved_genids = \
-                            ref_nolanu.index.get_level_values("gen_id").unique()
-                        missing_genids = missing_genids.drop(resolved_genids)
-                        self.missing_lanus.loc[
-                            (resolved_genids, slice(None)), "nolanu_dist"] = dist
-                        self.missing_lanus.loc[
-                            (resolved_genids, slice(None)), "resolved"] = True
-
-                        coef_nolanu_i = (
-                            self.missing_lanus.loc[
-                                (resolved_genids, slice(None), slice(None)), []]
-                            .groupby(["gen_id", "nat_id"]).first()
-                            .join(ref_nolanu))
-                        coef_nolanu_i[["coef"]] = (
-                            coef_nolanu_i[["area"]] /
-                            (coef_nolanu_i[["area"]]
-                            .groupby(["gen_id", "nat_id"]).sum()))
-                        coef_nolanu_i.drop("area", inplace=True, axis=1)
-                        self.coef_lanu = pd.concat([self.coef_lanu,coef_nolanu_i])
-
-                    if len(missing_genids) == 0:
-                        break
-
-        # aggregate
-        sim_nat_comb = pd.DataFrame(
-            index=self.sim_shps_clip.index.droplevel("gen_id").unique())
-        self.res_gat_2 = self.res_gat_1.join(sim_nat_comb).join(self.coef_lanu)
-        self.res_gat_2 = \
-            self.res_gat_2[res_agg_cols].mul(self.res_gat_2["coef"].to_list(),
-                                             axis=0)
-        self.res_gat_2 = \
-            self.res_gat_2.groupby(["sim_id", "gen_id", "nat_id"]).sum()
-
-        # 3. nat_id
-        # ---------
-        # get coeficients for every NAT a SIM_ID is in
-        self.coef_nat = (
-            self.sim_shps_clip[["area"]]
-            .groupby(["sim_id", "nat_id"]).sum()
-            .join(self.sim_shps_clip["area"].groupby(["sim_id"]).sum(),
-                  rsuffix="_simid"))
-        self.coef_nat["coef"] = \
-            self.coef_nat["area"] / self.coef_nat["area_simid"]
-        self.coef_nat.drop(["area", "area_simid"], axis=1, inplace=True)
-
-        # aggregate
-        self.res_sim = self.res_gat_2.join(self.coef_nat)
-        self.res_sim = \
-            self.res_sim[res_agg_cols].mul(self.res_sim["coef"].to_list(),
-                                           axis=0)
-        self.res_sim = self.res_sim.groupby(["sim_id", "gen_id"]).sum()
+                        sql=prepare(con, "ref_nolanu_grid"),
+                        con=con,
+                        params=dict(
+                            urban_wkb=self.urban_shp.wkb,
+                            gen_ids=ids(missing_genids)),
+                        index_col=["gen_id",  "lanu_id"])
+                    missing_genids = missing_genids.difference(
+                        ref_nolanu.index.get_level_values("gen_id"))
+
+                if len(missing_genids) > 0:
+                    # search exactly around the urban polygon
+                    ref_nolanu = pd.concat([ref_nolanu, pd.read_sql(
+                        sql=prepare(con, "ref_nolanu"),
+                        con=con,
+                        params=dict(
+                            urban_wkb=self.urban_shp.wkb,
+                            dists=[dist*1000 for dist in NOLANU_DISTS],
+                            gen_ids=ids(missing_genids)),
+                        index_col=["gen_id",  "lanu_id"])])
+
+            if len(ref_nolanu)>0:
+                nolanu_dist = (ref_nolanu["nolanu_dist"]
+                               .groupby("gen_id").first() / 1000)
+                resolved_genids = nolanu_dist.index
+                self.missing_lanus["nolanu_dist"] = (
+                    self.missing_lanus.index.get_level_values("gen_id")
+                    .map(nolanu_dist))
+                self.missing_lanus["resolved"] = \
+                    self.missing_lanus["nolanu_dist"].notna()
+
+                coef_nolanu = (
+                    self.missing_lanus.loc[
+                        (resolved_genids, slice(None), slice(None)), []]
+                    .groupby(["gen_id", "nat_id"]).first()
+                    .join(ref_nolanu[["area"]]))
+                coef_nolanu[["coef"]] = (
+                    coef_nolanu[["area"]] /
+                    (coef_nolanu[["area"]]
+                    .groupby(["gen_id", "nat_id"]).sum()))
+                coef_nolanu.drop("area", inplace=True, axis=1)
+                self.coef_lanu = pd.concat([self.coef_lanu, coef_nolanu])
+
+        # aggregate over all the levels
+        # ----------------------------
+        levels = aggregate_levels(
+            results=results,
+            bfid_area_raw=self.results["bfid_area"],
+            coef_lanu=self.coef_lanu,
+            clip_area=self.sim_shps_clip["area"],
+            res_agg_cols=res_agg_cols)
+        for name, value in levels.items():
+            setattr(self, name, value)
 
         # check if the precipitation didn't change
         check_n = (
@@ -903,46 +1222,7 @@ class Query(object):
                 "\nThe resulting precipitation differes " +
                 "from the input precipitation.")
 
-        # 4. sim_id
-        # ---------
-        # get the coeeficients
-        self.coef_sim = (
-            self.sim_shps_clip[["area"]].groupby(["gen_id", "sim_id"]).sum() /
-            self.sim_shps_clip[["area"]].groupby("gen_id").sum())
-        self.coef_sim.rename({"area": "coef"}, axis=1, inplace=True)
-
-        # aggregate
-        self.res_gen = self.res_sim.join(self.coef_sim)
-        self.res_gen = \
-            self.res_gen[res_agg_cols].mul(self.res_gen["coef"].to_list(),
-                                           axis=0)
-        self.res_gen = self.res_gen.groupby("gen_id").sum()
-
-        # 5. gen_id
-        # ---------
-        # get the coeeficients
-        self.coef_gen = (self.sim_shps_clip[["area"]].groupby("gen_id").sum() /
-                         self.sim_shps_clip["area"].sum())
-        self.coef_gen.rename({"area": "coef"}, axis=1, inplace=True)
-
-        # aggregate
-        self.naturwb_ref = self.res_gen.join(self.coef_gen)
-        self.naturwb_ref = \
-            self.naturwb_ref[res_agg_cols].mul(
-                self.naturwb_ref["coef"].to_list(),
-                axis=0)
-        self.naturwb_ref = self.naturwb_ref.sum()
-
-        # gather all the cooefficients and check if sum is 1
-        self.coef_all = (
-            self.coef_gen.join(self.coef_sim, lsuffix="_gen", rsuffix="_sim")
-            .join(self.coef_nat
-                  .rename({"coef": "coef_nat"}, axis=1))
-            .join(self.coef_lanu
-                  .rename({"coef": "coef_lanu"}, axis=1))
-            .join((self.results[["bfid_area"]]/100)
-                  .rename({"bfid_area": "coef_bfid"}, axis=1)))
-
+        # check if the sum of all the coefficients is 1
         if not np.isclose(self.coef_all.prod(axis=1).sum(), 1, atol=0.00001):
             raise ValueError(
                 "There was an error with the gathering of the results " +
@@ -973,19 +1253,15 @@ class Query(object):
             A DataFrame with the simulation input parameters.
         """
         if (not hasattr(self, "input_paras")) or renew:
-            sql_input_paras = (
-                "SELECT * FROM view_simulation_paras " +
-                "WHERE sim_id IN ({simids}) " +
-                "AND lanu_id IN ({lanuids})").format(
-                simids=", ".join(self.results.index.
-                    get_level_values("sim_id").unique().astype(str)),
-                lanuids=", ".join(self.results.index.
-                    get_level_values("lanu_id").unique().astype(str))
-                )
             with self.db_engine.connect() as con:
                 self.input_paras = pd.read_sql(
-                    sql=sql_input_paras,
+                    sql=prepare(con, "input_paras"),
                     con=con,
+                    params=dict(
+                        sim_ids=ids(self.results.index
+                                    .get_level_values("sim_id")),
+                        lanu_ids=ids(self.results.index
+                                     .get_level_values("lanu_id"))),
                     index_col=self.results.index.names)
 
         if join_results:
@@ -1006,1075 +1282,6 @@ class Query(object):
                         "za_gwnah": "ZA_GWnah"}, axis=1)
             return self.results_genid
 
-    def _make_plot_sim_shps_clip(self, width=20, cex=1,
-                               bbox_x_gen=0, bbox_x_nat=0):
-        """
-        Create the sim_shps_clip plot to represent the soil groups and the NRE
-        in the urban area.
-
-        It is recommended to use the plot or plot_web methode to create the plot figure not this function.
-
-        Parameters
-        ----------
-        width : int, optional
-            The width of the matplotlibs figsize.
-            The default is 20.
-        cex : int, optional
-            Factor to stretch the fontsizes.
-            The default is 1.
-        bbox_x_gen : int, optional
-            Factor to add to the GEN_ID legend bbox_to_anchor x coords.
-            The default is 0.
-        bbox_x_nat : int, optional
-            Factor to add to the NRE legend bbox_to_anchor x coords.
-            The default is 0.
-
-        Returns
-        -------
-        matplotlib.figure.Figure
-
-        """
-        # define variables to be able to copy the plot syntax from Notebook 5.2
-        # -----------------
-        sim_shps_clip = self.sim_shps_clip
-        height = width * 17/20
-
-        # plot code
-        # ----------
-        fig, ax = plt.subplots(figsize=(width, height))
-
-        # plot soil classes
-        gen_dis = sim_shps_clip.dissolve(["gen_id", "color", "leg_tkle_kurz"])
-        plots = []
-        labels_gen = []
-        colors_gen = []
-        for (genid, color, label), df in gen_dis.groupby(["gen_id",
-                                                          "color",
-                                                          "leg_tkle_kurz"]):
-            plot = df.plot(ax=ax, color=color, label=label, alpha=0.8,
-                           legend=True, categorical=True)
-            plots.append(plot)
-            labels_gen.append(str(genid) + ": " + label)
-            colors_gen.append(color)
-
-        # add NRE ID and border
-        # nat_dis = sim_shps_clip.dissolve("nat_id").reset_index().explode(index_parts=True)
-        sql_nre_clip = (
-            'SELECT tbl_nre.nat_id, name, geom ' +
-            'FROM tbl_nre ' +
-            "WHERE tbl_nre.nat_id in ({})").format(
-                ", ".join(sim_shps_clip.index.get_level_values("nat_id").unique().astype(str)))
-
-        with self.db_engine.connect() as conn:
-            nre_clip = gpd.read_postgis(
-                sql=sql_nre_clip,
-                con=conn,
-                geom_col="geom",
-                index_col="nat_id",
-                crs=25832
-            )
-        lut = len(np.unique(nre_clip.index.values))
-        colors_nat = cm.get_cmap(name="Set1", lut=lut)(range(0, lut))
-        hatches_all = ["/", "\\", "|", "-", ".", "x", "+",
-                       "//", "||", "\\\\", "*", "+"] * 2
-        labels_nat = []
-        for (_, gdf_nat), hatch, color in zip(nre_clip.groupby("nat_id"),
-                                                  hatches_all, colors_nat):
-            gdf_nat.plot(ax=ax, edgecolor=color,
-                         facecolor=(0, 0, 0, 0), hatch=hatch)
-            labels_nat.append(gdf_nat["name"].iloc[0])
-
-        # add urban shape
-        self.urban_shp_utm.boundary.plot(ax=ax, color="k")
-
-        # add basemap
-        cx.add_basemap(ax=ax,
-                       crs=sim_shps_clip.crs,
-                       source=cx.providers.OpenStreetMap.Mapnik,
-                       attribution_size=18 * cex)
-        ax.set_axis_off()
-
-        # set legends
-        legend_nat = ax.legend(
-            handles=(
-                [mpl.patches.Patch(
-                    edgecolor=color,
-                    facecolor=(0, 0, 0, 0),
-                    hatch=hatch)
-                    for color, hatch in zip(colors_nat, hatches_all)] +
-                [mpl.patches.Patch(color=(0,0,0,0)),
-                mpl.patches.Patch(edgecolor="k", facecolor=(0,0,0,0))]),
-            labels=labels_nat + ["", "Urbanes Gebiet"],
-            loc=2,
-            bbox_to_anchor=(-0.1 - bbox_x_nat, 1),
-            labelspacing=1.5, handlelength=3, borderpad=1,
-            fontsize=13 * cex, title_fontsize=15 * cex)
-        for patch in legend_nat.get_patches():
-            patch.set_height(20 + 8 * (width - 20)/20)
-            patch.set_y(-5)
-        ax.add_artist(legend_nat)
-
-        ncol_leg_gen = max(25, len(labels_gen))//25
-        ax.legend(
-            handles=[mpl.patches.Patch(color=color) for color in colors_gen],
-            labels=['\n        '.join(wrap(lbl, 50)) for lbl in labels_gen],
-            title="      Bodengesellschaft\nGEN_ID: Kurzbeschreibung",
-            loc=1,
-            bbox_to_anchor=((1.25 + (ncol_leg_gen-1) * 0.28) + bbox_x_gen, 1),
-            ncol=ncol_leg_gen,
-            fontsize=13 * cex, title_fontsize=15 * cex)
-
-        fig.set_tight_layout(True)
-
-        # save fig to object
-        # -------------------
-        self.fig_sim_shps_clip = fig
-
-    def _make_plot_sim_shps_clip_plotly(self):
-        """Create the sim_shps_clip figure with plotly (interactive).
-
-        It is recommended to use the plot or plot_web methode to create the plot figure not this function.
-        """
-        # create df
-        gen_dis = self.sim_shps_clip.dissolve(
-            ["gen_id", "color", "leg_tkle_kurz"]).to_crs(4326)
-        gen_dis = gen_dis.reset_index()\
-            .explode(index_parts=False).reset_index(drop=True)
-        urban_shp_plot = self.urban_shp_wgs.iloc[0]
-
-        if not hasattr(self, "nre"):
-            self._sql_nre()
-
-        # extend
-        bounds = np.array(urban_shp_plot.bounds)
-        center_x, center_y = bounds[:2] + ((bounds[2:] - bounds[:2]) / 2)
-        ext_x = bounds[2] - bounds[0]
-        ext_y = bounds[3] - bounds[1]
-        zoom = min(
-            np.log(360/(ext_x)) / np.log(2),
-            np.log(360/(ext_y)) / np.log(2),
-        ) - 1
-
-        fig = go.Figure()
-
-        # add soils
-        for i_gen, ((genid, color, tkle_kurz, tkle_txt), df) in enumerate(
-                gen_dis.groupby(["gen_id", "color",
-                                 "leg_tkle_kurz", "leg_tkle_txt"])):
-            fig.add_choroplethmapbox(
-                geojson=json.loads(df[["geometry"]].to_json()),
-                z=[i_gen,] * len(df),
-                locations=df.index,
-                colorscale=((0, color), (1, color)),
-                showscale=False,
-                hovertemplate=(
-                    "<b>Bodengesellschaft</b>:<br>" +
-                    "GEN_ID: %{meta[0]}<br>%{meta[1]}" +
-                    "<extra>%{meta[2]}</extra>"
-                ),
-                meta=[genid,
-                      "<br>".join(wrap(tkle_kurz, 30)),
-                      "<br>".join(wrap(tkle_txt, 30))],
-                showlegend=True,
-                hoverlabel=dict(bgcolor=color),
-                name="<br>".join(wrap(str(genid) + ": " + tkle_kurz, 40)),
-                marker_line_width=0,
-                marker=dict(opacity=0.75),
-                legendgroup="Soils",
-                visible=True
-            )
-
-        # add nat_id
-        n_nre = len(self.nre)
-        colors_nat = [
-            mpl.colors.to_hex(color) for color in
-            cm.get_cmap(name="Set1", lut=n_nre)(range(0, n_nre))]
-        for i_nat, (((natid, name), gdf_nat), color) in enumerate(
-                zip(self.nre.groupby(["nat_id", "name"]), colors_nat)):
-            fig.add_choroplethmapbox(
-                geojson=json.loads(gdf_nat[["geometry"]].to_json()),
-                locations=gdf_nat.index,
-                z=[i_nat,] * len(gdf_nat),
-                colorscale=((0, color), (1, color)),
-                showscale=False,
-                hovertemplate=(
-                    "<b>Naturraumeinheit</b>:<br>%{meta[0]}" +
-                    "<extra></extra>"
-                ),
-                meta=["<br>".join(wrap(name, 30))],
-                showlegend=True,
-                name="<br>".join(wrap(name, 40)),
-                marker_line_width=0,
-                marker=dict(opacity=0.75),
-                legendgroup="NRE",
-                visible=False
-            )
-
-        # add urban_shp
-        if type(urban_shp_plot) == MultiPolygon:
-            long, lat = [],[]
-            for geom in urban_shp_plot.geoms:
-                xy = geom.exterior.xy
-                long.append(xy[0].tolist())
-                lat.append(xy[1].tolist())
-        else:
-            long, lat = urban_shp_plot.exterior.xy
-            long = list([long.tolist()])
-            lat = list([lat.tolist()])
-
-        leg_bool = True
-        for lati, longi in zip(lat, long):
-            fig.add_scattermapbox(
-                lat=lati,
-                lon=longi,
-                mode = "lines",
-                marker=dict(color="black"),
-                legendgroup="urban shape",
-                name="urbanes Gebiet",
-                visible=True,
-                showlegend=leg_bool,
-                hoverinfo="skip"
-            )
-            leg_bool=False
-
-        # update layout
-        fig.update_layout(
-            mapbox=dict(
-                style="open-street-map",
-                zoom=zoom,
-                center={"lat": center_y, "lon": center_x}),
-            legend=dict(
-                title=dict(
-                    text="      <b>Bodengesellschaft<br>GEN_ID: Kurzbeschreibung</b>",
-                    font=dict(size=16)),
-                tracegroupgap=35),
-            updatemenus=[dict(
-                type="dropdown",
-                direction="down",
-                buttons=list([
-                    dict(
-                        args=[
-                            {"visible": ([True, ] * (i_gen+1) +
-                                         [False, ] * (i_nat+1) +
-                                         [True,] * len(lat))},
-                            {"legend.title.text":
-                                "      <b>Bodengesellschaft<br>GEN_ID: Kurzbeschreibung</b>",
-                            "legend.x": 1.1}],
-                        label="Bodengesellschaften",
-                        method="update"
-                    ),
-                    dict(
-                        args=[
-                            {"visible": ([False, ] * (i_gen+1) +
-                                         [True, ] * (i_nat+1) +
-                                         [True,] * len(lat))},
-                            {"legend.title.text":
-                                "<b>Naturraumeinheiten</b>"}],
-                        label="Naturraumeinheiten",
-                        method="update"
-                    )
-                ]),
-                showactive=True,
-                x=1.05,
-                xanchor="left",
-                y=1.1,
-                yanchor="top",
-                pad=dict(r=20) )],
-            autosize=True,
-            margin=dict(t=12, l=0, autoexpand=True),
-            modebar=dict(orientation="v"),
-            height=650,
-            font_size=16,
-            hoverlabel=dict(font=dict(size=14)),
-            annotations=[
-                {"text": "© GeoBasis-DE/ BKG 2018",
-                "valign": "bottom", "align": "right",
-                "showarrow":False,
-                "xref":'paper', "yref":'paper',
-                "x":0.01, "y":0.01,
-                "font_size": 12}]
-        )
-
-        # save fig to object
-        # -------------------
-        self.fig_sim_shps_clip_plotly = fig
-
-    def _make_plot_reference_polys(self, figsize=(15, 15)):
-        """
-        Create the figure with the reference shapes.
-
-        This plot takes a bit to get created.
-
-        It is recommended to use the plot or plot_web methode to create the plot figure not this function.
-
-        Parameters
-        ----------
-        figsize : tuple, optional
-            The size of the figure in a matplotlib figsize format.
-            The default is (15, 15).
-        """
-        # define variables to be able to copy the plot syntax from Notebook 5.2
-        # -----------------
-        sim_shps_clip = self.sim_shps_clip
-
-        if hasattr(self, "ref_polys"):
-            ref_polys = self.ref_polys
-        else:
-            self._sql_query_ref_polys()
-            ref_polys = self.ref_polys
-
-        # plot code
-        # ----------
-        fig, ax = plt.subplots(figsize=figsize)
-        ref_polys.reset_index().plot(
-            ax=ax, column="lanu_name",
-            categorical=True, legend=True, alpha=0.7)
-
-        # legend
-        leg = ax.get_legend()
-        leg.set_label("Landnutzung")
-        for text in leg.get_texts():
-            text.set_text("\n".join(wrap(text.get_text(), 40)))
-        leg._set_loc(2)
-        leg.set_bbox_to_anchor((0.9, 1))
-
-        cx.add_basemap(ax=ax,
-                       crs=sim_shps_clip.crs,
-                       source=cx.providers.OpenStreetMap.Mapnik,
-                       attribution_size=18)
-        ax.set_axis_off()
-
-        # save fig to object
-        # -------------------
-        self.fig_reference_polys = fig
-
-    def _make_plot_pie(self, figsize=(7, 7), do_title=True,
-                       label_fontsize="x-large", title_fontsize="xx-large"):
-        """
-        Create the naturwb pie figure.
-
-        It is recommended to use the plot or plot_web methode to create the plot figure not this function.
-
-        Parameters
-        ----------
-        figsize : tuple, optional
-            The size of the figure.
-            The Default is (7, 7).
-        do_title : bool, optional
-            Should the figure have a title?
-            The default is True.
-        label_fontsize : str or int, optional
-            The fontsize of the labels in a matplotlib fontsize format
-            The default is "x-large".
-        title_fontsize : str or int, optional
-            The fontsize of the labels in a matplotlib fontsize format.
-            Only used if do_title is True.
-            The default is "xx-large".
-        """
-        # plot code
-        # ----------
-        fig, ax = plt.subplots(figsize=figsize)
-        self.naturwb_ref[["runoff", "tp", "et"]].plot.pie(
-            ax=ax,
-            ylabel="",
-            labels=[
-                "Abfluss (Q)",
-                "Grundwasserneubildung (GWNB)",
-                "Evapotranspitation (ET)"],
-            autopct='%1.0f%%',
-            fontsize=label_fontsize
-        )
-
-        if do_title:
-            ax.set_title(label="NatUrWB Referenz", fontsize=title_fontsize)
-
-        fig.set_tight_layout(True)
-
-        # save fig to object
-        # -------------------
-        self.fig_pie = fig
-
-    def _make_plot_pie_plotly(self):
-        """
-        Create the naturwb pie figure with plotly (interactive).
-
-        It is recommended to use the plot or plot_web methode to create the plot figure not this function.
-        """
-        # define variables to be able to copy the plot syntax from Notebook 5.2
-        # -----------------
-        naturwb_ref = self.naturwb_ref
-
-        # plot code
-        # ----------
-        colors = ['#1f77b4', '#ff7f0e', '#2ca02c'] # mpl standarts
-
-        fig = go.Figure(data=[
-            go.Pie(
-                values=(naturwb_ref[["runoff", "tp", "et"]] /
-                        naturwb_ref[["runoff", "tp", "et"]].sum()),
-                labels=["Abfluss (Q)", "Grundwasserneubildung (GWNB)", "Evapotranspiration (ET)"],
-                hovertemplate="%{label}<br>%{value:.1%}<extra></extra>",
-                texttemplate="%{value:.1%}",
-                marker=dict(
-                    colors=colors
-                )
-            )])
-
-        fig.update_layout(
-            title=dict(
-                text="NatUrWB Referenz",
-                font_size=20,
-                x=0.5,
-                xanchor="center"),
-            font_size=16,
-            hoverlabel=dict(font=dict(size=14)),
-            legend=dict(
-                orientation="h",
-                valign="bottom")
-        )
-
-        # save fig to object
-        # -------------------
-        self.fig_pie_plotly = fig
-
-    def _make_plot_pie_landuse(self):
-        """Create the landuse pie figure.
-
-        It is recommended to use the plot or plot_web methode to create the plot figure not this function.
-        """
-        # plot code
-        # ----------
-        lanu_parts = self.coef_all.prod(axis=1).groupby("lanu_id").sum().to_frame("coef")
-        sql_leg = ("SELECT lanu_id, name FROM leg_lanuid " +
-                "WHERE lanu_id in ({})").format(", ".join(lanu_parts.index.astype(str)))
-        with self.db_engine.connect() as con:
-            lanu_parts = lanu_parts.join(pd.read_sql(con=con, sql=sql_leg, index_col="lanu_id"))
-
-        colors=list(map(
-            mpl.colors.to_hex,
-            cm.get_cmap("Set1_r", len(lanu_parts))(range(0, len(lanu_parts)))))
-        fig = go.Figure(data=[
-            go.Pie(
-                values=lanu_parts["coef"],
-                labels=lanu_parts["name"].apply(lambda x: "<br>".join(wrap(x, 30))),
-                hovertemplate="%{label}<br>%{value:.1%}<extra></extra>",
-                texttemplate="%{value:.1%}",
-                marker=dict(colors=colors)
-            )])
-        fig.update_layout(
-            title=dict(
-                text="Landnutzungsverteilung",
-                x=0.5,
-                xanchor="center"),
-            font_size=16,
-            hoverlabel=dict(font=dict(size=14))
-        )
-
-        # save fig to object
-        # -------------------
-        self.fig_pie_landuse = fig
-
-    def _make_plot_pie_landuse_mpl(self, figsize=(7,7), explode_small=False):
-        """Create the landuse pie figure.
-
-        It is recommended to use the plot or plot_web methode to create the plot figure not this function.
-        """
-        # get df
-        # ----------
-        lanu_parts = self.coef_all.prod(axis=1).groupby("lanu_id").sum().to_frame("coef")
-        sql_leg = ("SELECT lanu_id, name FROM leg_lanuid " +
-                   "WHERE lanu_id in ({})").format(
-                       ", ".join(lanu_parts.index.astype(str)))
-        with self.db_engine.connect() as con:
-            lanu_parts = lanu_parts.join(
-                pd.read_sql(con=con, sql=sql_leg, index_col="lanu_id"))
-
-        colors=list(map(
-            mpl.colors.to_hex,
-            cm.get_cmap("Set1_r", len(lanu_parts))(range(0, len(lanu_parts)))))
-
-        lanu_parts["colors"] = colors
-        lanu_parts["name"] = lanu_parts["name"].apply(
-            lambda x: x.replace("/", "/\n"))
-        lanu_parts = lanu_parts.sort_values("coef")
-        lanu_parts = lanu_parts[lanu_parts["coef"]>0.001]
-
-        # make plot
-        fig, ax = plt.subplots(figsize=figsize)
-        lanu_parts.plot.pie(
-                    ax=ax,
-                    y="coef",
-                    ylabel="",
-                    labels=lanu_parts["name"],
-                    colors=colors,
-                    autopct='%1.0f%%',
-                    fontsize=12,
-                    labeldistance=None,
-                    pctdistance=0.8,
-                    startangle=15,
-                    explode=lanu_parts["coef"].apply(
-                        lambda x: 0.3 if x < 0.03 and explode_small else 0)
-                )
-        ax.get_legend().remove()
-        fig.legend(loc="lower right", bbox_to_anchor=(1.25,0.2))
-        ax.set_title("Landnutzungsverteilung")
-
-        # save fig to object
-        # -------------------
-        self.fig_pie_landuse_mpl = fig
-
-    def _make_plot_ternary(self, do_size=False, width=1000,
-                           marker_sizemin=2.5, marker_sizecoef=0.04):
-        """
-        Create the ternary figure.
-
-        It is recommended to use the plot or plot_web methode to create the plot figure not this function.
-
-        Parameters
-        ----------
-        do_size : boolean, optional
-            Should the size of the dots represent the share the dot represents?
-            The default is False.
-        width : int, optional
-            The width of the figure.
-            The default is 1000.
-        marker_sizemin : int, optional
-            The Minimum size of the dots. Only relevant if do_size=True.
-            The default is 2.5.
-        marker_sizecoef : TYPE, optional
-            The coefficient to use to scale the size of the dots.
-            Only relevant if do_size=True.
-            The default is 0.04.
-
-        Returns
-        -------
-        plotly.graph_objs.Figure
-            The plotly figure object of the plot.
-        """
-        # plot code
-        # ----------
-        # create dataframe
-        res_3_ternary = self.res_sim.copy()
-        naturwb_ternary = self.naturwb_ref.copy()
-
-        paras = ["runoff", "tp", "et"]
-        for para in paras:
-            res_3_ternary[para + "_part"] = \
-                res_3_ternary[para] / res_3_ternary[paras].sum(axis=1)
-            naturwb_ternary[para + "_part"] = \
-                naturwb_ternary[para] / naturwb_ternary[paras].sum()
-
-        res_3_ternary = res_3_ternary.join(self.coef_gen * self.coef_sim)
-
-        # add legend information to the dataframe
-        sql_ternary_leg = (
-            "SELECT tsp.sim_id, txt as leg_txt, kurz as leg_kurz, color " +
-            "FROM tbl_simulation_polygons tsp " +
-            "JOIN leg_tklenr lt ON lt.tkle_nr=tsp.tkle_nr " +
-            "JOIN leg_buek_col lbc ON lbc.sym_nr=tsp.sym_nr "
-            "WHERE tsp.sim_id in ({simids})"
-        ).format(
-            simids=", ".join(
-                res_3_ternary.index.get_level_values("sim_id")
-                .unique().astype(str)
-            )
-        )
-
-        with self.db_engine.connect() as con:
-            ternary_leg = pd.read_sql(sql=sql_ternary_leg,
-                                      con=con,
-                                      index_col="sim_id")
-            res_3_ternary = res_3_ternary.join(ternary_leg)
-
-        # initiate the figure
-        fig = go.Figure()
-
-        # plot the different soil
-        for (genid, color), df in res_3_ternary.groupby(["gen_id", "color"]):
-            # create marker dict depending if the size should be dependent
-            if do_size:
-                marker_dict = dict(
-                    opacity=0.7, color=color,
-                    size=df["coef"],
-                    sizeref=marker_sizecoef * res_3_ternary["coef"].max(),
-                    sizemin=marker_sizemin)
-            else:
-                marker_dict = dict(color=color)
-
-            # wrap the labels
-            df["leg_txt"] = df["leg_txt"].apply(
-                lambda x: "<br>".join(wrap(x, 30)))
-
-            # add the traces
-            fig.add_trace(
-                go.Scatterternary(
-                    a=df["runoff_part"],
-                    b=df["tp_part"],
-                    c=df["et_part"],
-                    mode="markers",
-                    hovertemplate=(
-                        "ET:        %{c:.1%} (%{customdata[0]:.0f} mm/a)<br>" +
-                        "Q:          %{a:.1%} (%{customdata[1]:.0f} mm/a)<br>" +
-                        "GWNB: %{b:.1%} (%{customdata[2]:.0f} mm/a)<br><br>" +
-                        "Anteil an NatUrWB-Zielwert: %{customdata[3]:.2%}" +
-                        "<extra>GEN_ID: %{meta[0]}<br>%{customdata[4]}" +
-                        "</extra>"
-                    ),
-                    meta=[genid],
-                    customdata=df[
-                        ["et", "runoff", "tp", "coef", "leg_txt"]],
-                    name=str(genid),  # "<br>".join(wrap(leg_kurz, 20)),
-                    legendgroup="Bodengesellschaft",
-                    marker=marker_dict,
-                    cliponaxis=False
-                )
-            )
-
-        # plot the naturwb-reference
-        fig.add_trace(
-            go.Scatterternary(
-                a=naturwb_ternary[["runoff_part"]],
-                b=naturwb_ternary[["tp_part"]],
-                c=naturwb_ternary[["et_part"]],
-                mode="markers",
-                hovertemplate=(
-                    "ET:        %{c:.1%} (%{meta[0]:,.0f} mm/a)<br>" +
-                    "Q:          %{a:.1%} (%{meta[1]:,.0f} mm/a)<br>" +
-                    "GWNB: %{b:.1%} (%{meta[2]:,.0f} mm/a)" +
-                    "<extra>NatUrWB-Zielwert</extra>"),
-                meta=[naturwb_ternary[["et", "runoff", "tp"]]],
-                name="NatUrWB-Zielwert",
-                legendgroup="Zielwert",
-                hoverinfo="text",
-                marker=dict(
-                    symbol=17, size=20, color="#007bff",
-                    line_color="#000000", line_width=1.5),
-                cliponaxis=False
-            )
-        )
-
-        # update layout
-        tickvals = np.arange(0, 1.2, 0.2)
-        ticktext = list(map(lambda x: x + " %",
-                            np.arange(0, 120, 20).astype(str)))
-        width = min(1500, max(800, width))
-        height = width - 250
-
-        fig.update_layout(
-            legend=dict(
-                title=dict(
-                    text="Bodengesellschafts ID",
-                    font=dict(size=16)),
-                tracegroupgap=35
-            ),
-            ternary=dict(
-                aaxis=dict(
-                    title="",
-                    color="#4B8A08",
-                    ticks="outside",
-                    tickangle=0,
-                    tickvals=tickvals, ticktext=ticktext,
-                    showline=True, linecolor="#4B8A08",
-                    showgrid=True, gridcolor="#4B8A08"),
-                baxis=dict(
-                    title="", color="#8A2908",
-                    ticks="outside", tickangle=60,
-                    tickvals=tickvals, ticktext=ticktext,
-                    showline=True, linecolor="#8A2908",
-                    showgrid=True, gridcolor="#8A2908"),
-                caxis=dict(
-                    title="",  color="#0B2161",
-                    ticks="outside", tickangle=-60,
-                    tickvals=tickvals, ticktext=ticktext,
-                    showline=True, linecolor="#0B2161",
-                    showgrid=True, gridcolor="#0B2161",
-                    hoverformat="ET: %{a:2}")
-            ),
-            annotations=[
-                dict(text="Abfluss",
-                     x=0.07, xref="paper",
-                     y=0.5, yref="paper",
-                     textangle=-60,
-                     font=dict(color="#4B8A08", size=16),
-                     align="left", showarrow=False),
-                dict(text="Grundwasserneubildung",
-                     x=0.5, xref="paper",
-                     y=0.00018571*height-0.31214, yref="paper",
-                     font=dict(color="#8A2908", size=16),
-                     align="left", showarrow=False),
-                dict(text="Evapotranspiration",
-                     x=0.97, xref="paper",
-                     y=0.5, yref="paper",
-                     textangle=60,
-                     font=dict(color="#0B2161", size=16),
-                     align="left", showarrow=False)
-            ],
-            clickmode="event+select",
-            hovermode="closest",
-            width=width,
-            height=height,
-            font_size=16,
-            hoverlabel=dict(font=dict(size=14)),
-            margin=dict(b=120, r=120)
-        )
-
-        if do_size:
-            fig.update_layout(
-                legend=dict(
-                    itemsizing="constant"))
-
-        # save fig to object
-        # -------------------
-        self.fig_ternary = fig
-
-    def _make_plot_bar(self):
-        """Create the Bar figure.
-
-        It is recommended to use the plot or plot_web methode to create the plot figure not this function.
-        """
-        # create dfs
-        res_bar = self.res_gen.copy()
-        naturwb_bar = self.naturwb_ref.copy()
-        paras = ["runoff", "tp", "et"]
-        for para in paras:
-            res_bar[para + "_part"] = \
-                res_bar[para] / res_bar[paras].sum(axis=1)
-            naturwb_bar[para + "_part"] = \
-                naturwb_bar[para] / naturwb_bar[paras].sum()
-
-        # create dicts for the plot labels
-        name_dict = {
-            "legend": {
-                "et_part": "Evaoptranspiration (ET)",
-                "runoff_part": "Abfluss (Q)",
-                "tp_part": "Grundwasserneubildung (GWNB)"},
-            "short": {
-                "et_part": "ET",
-                "runoff_part": "Q",
-                "tp_part": "GWNB"
-            }
-        }
-        col_dict = {
-            "et_part": "blue",
-            "runoff_part": "green",
-            "tp_part": "brown"}
-
-        # create the plot
-        fig = go.Figure()
-
-        # add naturwb bar
-        for col in ["tp_part", "runoff_part", "et_part"]:
-            fig.add_trace(
-                go.Bar(
-                    x=['NatUrWB-Referenz'],
-                    y=naturwb_bar[[col]]*100,
-                    text=name_dict["legend"][col],
-                    hovertemplate='%{y:.2f}%<br>%{meta}<extra>%{x}</extra>',
-                    meta=name_dict["short"][col],
-                    name=name_dict["legend"][col],
-                    marker=dict(color=col_dict[col])
-                )
-            )
-
-        # add other soils
-        start = 2
-        for genid, df in res_bar.groupby("gen_id"):
-            for col in ["tp_part", "runoff_part", "et_part", ]:
-                fig.add_trace(
-                    go.Bar(
-                        x=[genid],
-                        text=genid,
-                        y=df[col]*100,
-                        hovertemplate=(
-                            '%{label:.2f}%<br>%{meta}<extra>%{x}</extra>'),
-                        meta=[name_dict["short"][col], ],
-                        name=name_dict["legend"][col],
-                        marker=dict(color=col_dict[col]),
-                        showlegend=False,
-                        opacity=0.7
-                    )
-                )
-            start += len(df) + 1
-
-        # update the layout
-        fig.update_layout(
-            barmode='stack',
-            xaxis=dict(
-                type='category',
-                categoryorder='array',
-                categoryarray=['NatUrWB-Referenz', ""]),
-            yaxis=dict(
-                title='Anteil am Niederschlag<br>und kapillaren Aufstieg in %'),
-            annotations=[
-                dict(text="Bodengesellschafts-ID",
-                     x=0.6, y=-0.2, xref="paper", yref="paper",
-                     align="left", showarrow=False)
-            ],
-            font_size=16,
-            hoverlabel=dict(font=dict(size=14))
-        )
-
-        # save fig to object
-        # -------------------
-        self.fig_bar = fig
-
-    def _make_plot_sankey(self, figsize=(15, 15), cex=1, add_pet=True):
-        """
-        Create the Sankey figure.
-
-        It is recommended to use the plot or plot_web methode to create the plot figure not this function.
-
-        Parameters
-        ----------
-        figsize : tuple of 2 int, optional
-            The size of the figure.
-            The default is (15, 15).
-        cex : float, optional
-            The factor to change the size of the labels.
-            The default is 1.
-        add_pet : bool, optional
-            Should the potential evapotranspiration be added to the plot?
-            The default is True.
-
-        Returns
-        -------
-        matplotlib.figure.Figure.
-
-        """
-        # define variables to be able to copy the plot syntax from Notebook 5.2
-        # -----------------
-        df_sankey = self.naturwb_ref.copy()
-
-        # plot code
-        # ----------
-        df_sankey["za_oa"] = df_sankey["za"] - df_sankey["za_gwnah"]
-
-        with pkg_resources.open_binary(
-            data, "Wasserbilanz_raw.jpg") as f:
-            bg = plt.imread(f)
-
-        scale = 1/df_sankey[["n", "kap.A."]].sum()*140
-        gap = 20
-        color = (0.12156862745098039, 0.4666666666666667,  0.7058823529411765,
-                 0.8)
-        radius = 20
-        x_offset = 320
-        et_width = df_sankey["et"] * scale
-        tot_width = df_sankey[["n", "kap.A."]].sum() * scale
-        oa_width = df_sankey["oa"] * scale
-        tp_width = df_sankey["tp"] * scale
-        zagw_width = df_sankey["za_gwnah"] * scale
-        soil_width = 313
-        x_abf_mid = 780
-        y_abf_ground = -41
-        y_offset = max(tot_width/2 - et_width + 2*radius + oa_width/2,
-                       tot_width/2 - 1/3 * et_width)
-        extent = (-bg.shape[1]/2+x_offset, bg.shape[1]/2+x_offset,
-                  -bg.shape[0]/2+y_offset, bg.shape[0]/2+y_offset)
-
-        fig, ax = plt.subplots(figsize=figsize)
-
-        ax.imshow(bg, extent=extent)
-
-        # create Sankey diagramm
-        sk = _SankeyNWB(ax=ax, unit=" mm/a", scale=scale,
-                        shoulder=0, gap=gap, radius=radius, margin=20,
-                        offset=-80, format="%.1F")
-
-        # main Sankey
-        #############
-        len_tp = soil_width - y_offset - tot_width/2 - radius - tp_width/2
-        # remove flows with 0
-        flows_sk1=pd.concat([
-                df_sankey[["n", "kap.A."]],
-                -df_sankey[["et", "oa"]],
-                -df_sankey[["za", "tp"]]]
-            ).to_list()
-        labels_sk1=["Niederschlag", "kapillarer Aufstieg",
-                "Evapotranspiration", "Oberflächenabfluss",
-                "Zwischenabfluss", "Tiefenperkolation"]
-        orientations_sk1=[1,-1,
-                    1, 1,
-                    0, -1]
-        pathlengths_sk1=[100+y_offset, 245-y_offset-radius,
-                    150+y_offset, 20,
-                    50, len_tp]
-        pops_count_sk1 = 0
-        for i, flow in enumerate(flows_sk1):
-            if flow == 0:
-                j = i - pops_count_sk1
-                flows_sk1.pop(j)
-                labels_sk1.pop(j)
-                orientations_sk1.pop(j)
-                pathlengths_sk1.pop(j)
-                pops_count_sk1 += 1
-        sk.add(patchlabel="",
-            flows=flows_sk1,
-            labels=labels_sk1,
-            orientations=orientations_sk1,
-            trunklength=180, alpha=0.8,
-            pathlengths=pathlengths_sk1
-            )
-
-        # ZA-Sankey
-        ###########
-        if df_sankey["za"] != 0:
-            # remove flows with 0
-            flows_sk2=pd.concat([
-                df_sankey[["za"]],
-                -df_sankey[["za_oa", "za_gwnah"]]]).to_list()
-            labels_sk2=["delete",
-                    "Zwischenabfluss\nzum Abfluss",
-                    "Zwischenabfluss\nbei hohem Grundwasser"]
-            orientations_sk2=[0, 0, -1]
-            len_zagw = soil_width - y_offset - tot_width/2 + tp_width - radius * 2 - zagw_width * 3/2
-            pathlengths_sk2=[50,
-                        635-x_offset-gap-zagw_width, #998
-                        len_zagw ]
-            pops_count_sk2 = 0
-            for i, flow in enumerate(flows_sk2):
-                if flow == 0:
-                    j = i - pops_count_sk2
-                    flows_sk2.pop(j)
-                    labels_sk2.pop(j)
-                    orientations_sk2.pop(j)
-                    pathlengths_sk2.pop(j)
-                    pops_count_sk2 += 1
-            sk.add(patchlabel="",
-                flows=flows_sk2,
-                labels=labels_sk2,
-                orientations=orientations_sk2,
-                trunklength=130, alpha=0.8,
-                pathlengths=pathlengths_sk2,
-                prior=0,
-                connect=(labels_sk1.index("Zwischenabfluss"),0)
-                )
-
-        # aditional arrows
-        ##################
-        skouts = sk.finish()
-        self.skouts = skouts
-
-        # add potential evapotranspiration
-        if add_pet:
-            et_label = skouts[0].texts[labels_sk1.index("Evapotranspiration")]
-            et_label.set_text(et_label.get_text()+
-                            f"\n(pot. ET: {self.naturwb_ref['pet'].round():.0f} mm/a)")
-
-        # add Path for OA
-        if oa_width != 0:
-            oa_tip = skouts[0].tips[labels_sk1.index("Oberflächenabfluss")]
-            oapath_raw = [
-                (mplPath.MOVETO, oa_tip),
-                (mplPath.LINETO, oa_tip - [oa_width / 2, oa_width / 2]),
-                (mplPath.LINETO, (oa_tip[0] - oa_width / 2,
-                                y_offset - radius - oa_width))]
-            oapath_raw.extend(
-                sk._arc(quadrant=1, cw=False,
-                        radius=radius + oa_width,
-                        center=(oa_tip[0] + oa_width / 2 + radius,
-                                y_offset - radius)))
-            oapath_raw.extend([
-                (mplPath.LINETO, (670, y_offset + oa_width)),
-                (mplPath.LINETO, (670 + oa_width/2, y_offset + oa_width/2)),
-                (mplPath.LINETO, (670, y_offset)),
-                (mplPath.LINETO, (oa_tip[0] + oa_width/2 + radius, y_offset))])
-            oapath_raw.extend(
-                sk._arc(quadrant=1, cw=True,
-                        radius=radius,
-                        center=(oa_tip[0] + oa_width / 2 + radius,
-                                y_offset - radius)))
-            oapath_raw.extend([
-                (mplPath.LINETO, oa_tip + [oa_width / 2, + oa_width / 2])])
-
-            codes, vertices = zip(*oapath_raw)
-            oapath = mplPath(vertices=vertices, codes=codes, closed=True)
-            ax.add_artist(PathPatch(oapath, color=color))
-
-        # add Path for ZA GWNAH
-        if zagw_width != 0:
-            # hinweg
-            zagw_tip = skouts[1].tips[labels_sk2.index("Zwischenabfluss\nbei hohem Grundwasser")]
-            zagw_path_raw = [(mplPath.MOVETO, zagw_tip),
-                            (mplPath.LINETO, zagw_tip + [zagw_width / 2, zagw_width / 2]),
-                            (mplPath.LINETO, (zagw_tip[0] + zagw_width / 2,
-                                            zagw_tip[1]))
-                            ]
-            zagw_path_raw.extend(sk._arc(quadrant=2, cw=True, radius=radius,
-                                        center=(zagw_tip[0] + zagw_width / 2 + radius,
-                                                zagw_tip[1])))
-            zagw_path_raw.extend(sk._arc(quadrant=3, cw=True, radius=radius,
-                                        center=(x_abf_mid - radius - zagw_width/2,
-                                                zagw_tip[1] )))
-            zagw_path_raw.extend([
-                (mplPath.LINETO, (x_abf_mid - zagw_width/2, y_abf_ground - zagw_width/2)),
-                (mplPath.LINETO, (x_abf_mid, y_abf_ground))])
-
-            # rückweg
-            zagw_path_raw.extend([
-                (mplPath.LINETO, (x_abf_mid + zagw_width/2, y_abf_ground - zagw_width/2)),
-                (mplPath.LINETO, (x_abf_mid + zagw_width/2, zagw_tip[1] + zagw_width/2)),
-            ])
-            zagw_path_raw.extend(sk._arc(quadrant=3, cw=False, radius=radius + zagw_width,
-                                        center=(x_abf_mid - radius - zagw_width/2,
-                                                zagw_tip[1] )))
-            zagw_path_raw.extend(sk._arc(quadrant=2, cw=False,
-                                        radius=radius + zagw_width,
-                                        center=(zagw_tip[0] + zagw_width / 2 + radius,
-                                                zagw_tip[1])))
-            zagw_path_raw.extend([
-                (mplPath.LINETO, zagw_tip + [-zagw_width / 2, zagw_width / 2])])
-
-            codes, vertices = zip(*zagw_path_raw)
-            zagwpath = mplPath(vertices=vertices, codes=codes, closed=True)
-            ax.add_artist(PathPatch(zagwpath, color=color))
-
-            # add Information Textbox
-            ax.text(x=x_abf_mid, y=y_abf_ground - 100,
-                    s="Dieser Anteil wird hier \ndem Abfluss zugeordnet.\nWenn möglich selbst entscheiden.",
-                    ha='center', va='center',
-                    fontsize=skouts[0].texts[0].get_fontsize()*cex,
-                    backgroundcolor="#FFFFFF")
-
-        # change label background and patch color
-        for skout in skouts:
-            skout.patch.set_color(color)
-            for text in skout.texts:
-                text.set_backgroundcolor("#FFFFFF")
-
-        # change labels position
-        if "Zwischenabfluss" in labels_sk1:
-            ind_za = labels_sk1.index("Zwischenabfluss")
-            skouts[0].texts[ind_za].set_x(
-                skouts[0].texts[ind_za].get_position()[0] + 130)
-        if "Oberflächenabfluss" in labels_sk1:
-            ind_oa = labels_sk1.index("Oberflächenabfluss")
-            if "Zwischenabfluss" in labels_sk1:
-                pos_za = skouts[0].texts[labels_sk1.index("Zwischenabfluss")].get_position()
-                pos_oa = (pos_za[0] , y_offset + + oa_width/2)
-            else:
-                pos_oa = (300, y_offset + oa_width/2)
-            skouts[0].texts[ind_oa].set_position(pos_oa)
-        if "Zwischenabfluss\nzum Abfluss" in labels_sk2:
-            ind_zagw = labels_sk2.index("Zwischenabfluss\nzum Abfluss")
-            skouts[1].texts[ind_zagw].set_x(
-                skouts[1].texts[ind_zagw].get_position()[0] - 50)
-
-        skouts[1].texts[0].remove()
-
-        # change labels fontsize
-        for skout in skouts:
-            for text in skout.texts:
-                text.set_fontsize(text.get_fontsize() * cex)
-
-        # layout
-        ax.set_axis_off()
-        fig.set_tight_layout(True)
-
-        # save fig to object
-        # -------------------
-        self.fig_sankey = fig
-
     def _make_msgs(self):
         self.msgs = []
 
@@ -2204,7 +1411,6 @@ class Query(object):
 if __name__ == '__main__':
     from max_fun.geometry import geoencode
     import click
-    import time
 
     @click.command()
     @click.option('--db_user', help='NatUrWB Database username')
@@ -0,0 +1,462 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""The aggregation of the NatUrWB simulation results to one reference value.
+
+The results are aggregated over the five levels:
+
+    1. BF_ID
+    2. lanu_id
+    3. nat_id
+    4. sim_id
+    5. gen_id
+
+aggregate_levels is the vectorized NumPy kernel used by naturwb.Query.
+The hierarchy of ids gets factorized once to integer codes
+and every level is then computed with np.bincount on those codes.
+aggregate_levels_pandas is the original implementation
+with the pandas join/groupby chain and is kept as reference.
+
+If a soil profile got a forced landuse (lanu_flag=2), the bfid_area
+of the other profiles has to be renormalised to 100 % before,
+see renormalise_bfid_area.
+"""
+
+# libraries
+import numpy as np
+import pandas as pd
+
+
+# helper functions
+# ----------------
+def _nan0(values):
+    """Replace NaN with 0, as pandas sum skips NaN values."""
+    return np.where(np.isnan(values), 0, values)
+
+
+def _group_sum(keys, values):
+    """Sum up the rows of values with the same key.
+
+    Parameters
+    ----------
+    keys : numpy.ndarray of int
+        The group key of every row.
+    values : numpy.ndarray
+        The values to sum up, 1D or 2D with one row per key.
+
+    Returns
+    -------
+    first : numpy.ndarray of int
+        The position of the first row of every group.
+        The groups are sorted by their key.
+    sums : numpy.ndarray
+        The sums of every group.
+    """
+    _, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+    inverse = inverse.reshape(-1)
+    if values.ndim == 1:
+        return first, np.bincount(inverse, weights=values,
+                                  minlength=len(first))
+    sums = np.empty((len(first), values.shape[1]))
+    for i_col in range(values.shape[1]):
+        sums[:, i_col] = np.bincount(
+            inverse, weights=values[:, i_col], minlength=len(first))
+    return first, sums
+
+
+def _join(left_keys, right_keys, how="inner"):
+    """Join two arrays of integer keys.
+
+    Parameters
+    ----------
+    left_keys, right_keys : numpy.ndarray of int
+        The keys to join on.
+    how : str, optional
+        "inner" or "left".
+        The default is "inner".
+
+    Returns
+    -------
+    left_idx, right_idx : numpy.ndarray of int
+        The positions of the joined rows in the left and right array.
+        Not matched rows of a left join get -1 as right position.
+        The rows are in the order of the left keys.
+    """
+    order = np.argsort(right_keys, kind="stable")
+    right_sorted = right_keys[order]
+    lo = np.searchsorted(right_sorted, left_keys, side="left")
+    counts = np.searchsorted(right_sorted, left_keys, side="right") - lo
+    n_rows = np.maximum(counts, 1) if how == "left" else counts
+
+    left_idx = np.repeat(np.arange(len(left_keys)), n_rows)
+    offsets = np.arange(len(left_idx)) - np.repeat(np.cumsum(n_rows) - n_rows, n_rows)
+    if len(order) == 0:
+        right_idx = np.full(len(left_idx), -1)
+    else:
+        right_idx = order[np.minimum(np.repeat(lo, n_rows) + offsets,
+                                     len(order) - 1)]
+        right_idx[np.repeat(counts, n_rows) == 0] = -1
+    return left_idx, right_idx
+
+
+def _take(values, idx):
+    """Take the values at the positions, NaN for -1."""
+    values = np.asarray(values, dtype=float)
+    if len(values) == 0:
+        return np.full(idx.shape + values.shape[1:], np.nan)
+    taken = values[idx]
+    taken[idx == -1] = np.nan
+    return taken
+
+
+class _Codes(object):
+    """The integer codes of the id hierarchy.
+
+    Every dimension gets factorized once over all the given tables.
+    The codes are sorted like the ids,
+    so sorting by codes is the same as sorting by the ids.
+    """
+    def __init__(self, **dims):
+        self.uniques = {}
+        for dim, arrays in dims.items():
+            self.uniques[dim] = pd.Index(np.unique(np.concatenate(
+                [np.asarray(array) for array in arrays])), name=dim)
+
+    def codes(self, dim, values):
+        return self.uniques[dim].get_indexer(np.asarray(values))
+
+    def key(self, **codes):
+        """Combine the codes of several dimensions to one integer key."""
+        key = np.zeros(len(next(iter(codes.values()))), dtype=np.int64)
+        for dim, code in codes.items():
+            key = key * (len(self.uniques[dim]) + 1) + (code + 1)
+        return key
+
+    def index(self, **codes):
+        """Create the (Multi)Index from the codes, -1 becomes NaN."""
+        if len(codes) == 1:
+            dim, code = next(iter(codes.items()))
+            return self.uniques[dim][code]
+        return pd.MultiIndex(
+            levels=[self.uniques[dim] for dim in codes],
+            codes=list(codes.values()),
+            names=list(codes.keys()),
+            verify_integrity=False
+        ).remove_unused_levels()
+
+
+# forced landuses
+# ---------------
+def renormalise_bfid_area(bfid_area):
+    """Renormalise the soil profile areas to 100 % per landuse.
+
+    Parameters
+    ----------
+    bfid_area : pandas.Series
+        The area share of the soil profiles in percent,
+        with the index (sim_id, gen_id, bf_id, lanu_id).
+
+    Returns
+    -------
+    pandas.Series
+        The renormalised bfid_area with the same index.
+    """
+    sum_area = bfid_area.groupby(
+        level=["sim_id", "gen_id", "lanu_id"]).transform("sum")
+    return bfid_area / sum_area * 100
+
+
+def renormalise_bfid_area_loop(bfid_area):
+    """Renormalise the soil profile areas with the original loop.
+
+    This is kept as reference for renormalise_bfid_area
+    and takes and returns the same arguments.
+    """
+    bfid_area = bfid_area.copy()
+    for (simid, genid, lanuid), df \
+            in bfid_area.groupby(level=["sim_id", "gen_id", "lanu_id"]):
+        sum_area = df.sum()
+        bfid_area.loc[(simid, genid, slice(None), lanuid)] = (
+            df / sum_area * 100)
+    return bfid_area
+
+
+# aggregation
+# -----------
+def aggregate_levels(results, bfid_area_raw, coef_lanu, clip_area,
+                     res_agg_cols):
+    """Aggregate the simulation results over all five levels with NumPy.
+
+    Parameters
+    ----------
+    results : pandas.DataFrame
+        The results with the index (sim_id, gen_id, bf_id, lanu_id),
+        the res_agg_cols and the (renormalised) bfid_area column.
+    bfid_area_raw : pandas.Series
+        The bfid_area of the original results, used for coef_all.
+    coef_lanu : pandas.DataFrame
+        The landuse coefficients with the index (gen_id, nat_id, lanu_id)
+        and the column "coef".
+    clip_area : pandas.Series
+        The area of the clip with the index (sim_id, gen_id, nat_id).
+    res_agg_cols : list of str
+        The columns of the results to aggregate.
+
+    Returns
+    -------
+    dict
+        The aggregated tables res_gat_1, res_gat_2, coef_nat, res_sim,
+        coef_sim, res_gen, coef_gen, naturwb_ref and coef_all,
+        in the same form as with aggregate_levels_pandas.
+    """
+    # factorize the id hierarchy once
+    r_idx = results.index
+    raw_idx = bfid_area_raw.index
+    cl_idx = coef_lanu.index
+    clip_idx = clip_area.index
+    codes = _Codes(
+        sim_id=[r_idx.get_level_values("sim_id"),
+                raw_idx.get_level_values("sim_id"),
+                clip_idx.get_level_values("sim_id")],
+        gen_id=[r_idx.get_level_values("gen_id"),
+                raw_idx.get_level_values("gen_id"),
+                cl_idx.get_level_values("gen_id"),
+                clip_idx.get_level_values("gen_id")],
+        nat_id=[cl_idx.get_level_values("nat_id"),
+                clip_idx.get_level_values("nat_id")],
+        lanu_id=[r_idx.get_level_values("lanu_id"),
+                 raw_idx.get_level_values("lanu_id"),
+                 cl_idx.get_level_values("lanu_id")],
+        bf_id=[r_idx.get_level_values("bf_id"),
+               raw_idx.get_level_values("bf_id")])
+    r = {dim: codes.codes(dim, r_idx.get_level_values(dim))
+         for dim in ["sim_id", "gen_id", "bf_id", "lanu_id"]}
+    cl = {dim: codes.codes(dim, cl_idx.get_level_values(dim))
+          for dim in ["gen_id", "nat_id", "lanu_id"]}
+    clip = {dim: codes.codes(dim, clip_idx.get_level_values(dim))
+            for dim in ["sim_id", "gen_id", "nat_id"]}
+    cl_key = codes.key(gen_id=cl["gen_id"], nat_id=cl["nat_id"],
+                       lanu_id=cl["lanu_id"])
+    cl_coef = coef_lanu["coef"].to_numpy(dtype=float)
+    clip_area = clip_area.to_numpy(dtype=float)
+    out = {}
+
+    # 1. BF_ID
+    # --------
+    values = results[res_agg_cols].to_numpy(dtype=float)
+    weights = results["bfid_area"].to_numpy(dtype=float) / 100
+    first, res_1 = _group_sum(
+        codes.key(sim_id=r["sim_id"], gen_id=r["gen_id"],
+                  lanu_id=r["lanu_id"]),
+        _nan0(values * weights[:, None]))
+    g1 = {dim: r[dim][first] for dim in ["sim_id", "gen_id", "lanu_id"]}
+    out["res_gat_1"] = pd.DataFrame(
+        res_1, columns=res_agg_cols, index=codes.index(**g1))
+
+    # 2. lanu_id
+    # ----------
+    # every sim_id can be in several NRE
+    first, _ = _group_sum(
+        codes.key(sim_id=clip["sim_id"], nat_id=clip["nat_id"]),
+        clip_area)
+    sim_nat = {dim: clip[dim][first] for dim in ["sim_id", "nat_id"]}
+    i1, i_sn = _join(g1["sim_id"], sim_nat["sim_id"])
+    j2 = {dim: g1[dim][i1] for dim in ["sim_id", "gen_id", "lanu_id"]}
+    j2["nat_id"] = sim_nat["nat_id"][i_sn]
+    i2, i_cl = _join(
+        codes.key(gen_id=j2["gen_id"], nat_id=j2["nat_id"],
+                  lanu_id=j2["lanu_id"]),
+        cl_key, how="left")
+    first, res_2 = _group_sum(
+        codes.key(sim_id=j2["sim_id"][i2], gen_id=j2["gen_id"][i2],
+                  nat_id=j2["nat_id"][i2]),
+        _nan0(res_1[i1[i2]] * _take(cl_coef, i_cl)[:, None]))
+    g2 = {dim: j2[dim][i2][first] for dim in ["sim_id", "gen_id", "nat_id"]}
+    out["res_gat_2"] = pd.DataFrame(
+        res_2, columns=res_agg_cols, index=codes.index(**g2))
+
+    # 3. nat_id
+    # ---------
+    first_sn, area_sn = _group_sum(
+        codes.key(sim_id=clip["sim_id"], nat_id=clip["nat_id"]), clip_area)
+    first_s, area_s = _group_sum(clip["sim_id"], clip_area)
+    sn = {dim: clip[dim][first_sn] for dim in ["sim_id", "nat_id"]}
+    _, i_s = _join(sn["sim_id"], clip["sim_id"][first_s])
+    coef_nat = area_sn / area_s[i_s]
+    out["coef_nat"] = pd.DataFrame(
+        {"coef": coef_nat}, index=codes.index(**sn))
+
+    i_2, i_cn = _join(
+        codes.key(sim_id=g2["sim_id"], nat_id=g2["nat_id"]),
+        codes.key(sim_id=sn["sim_id"], nat_id=sn["nat_id"]),
+        how="left")
+    first, res_sim = _group_sum(
+        codes.key(sim_id=g2["sim_id"][i_2], gen_id=g2["gen_id"][i_2]),
+        _nan0(res_2[i_2] * _take(coef_nat, i_cn)[:, None]))
+    g3 = {dim: g2[dim][i_2][first] for dim in ["sim_id", "gen_id"]}
+    out["res_sim"] = pd.DataFrame(
+        res_sim, columns=res_agg_cols, index=codes.index(**g3))
+
+    # 4. sim_id
+    # ---------
+    first_gs, area_gs = _group_sum(
+        codes.key(gen_id=clip["gen_id"], sim_id=clip["sim_id"]), clip_area)
+    first_g, area_g = _group_sum(clip["gen_id"], clip_area)
+    gs = {dim: clip[dim][first_gs] for dim in ["gen_id", "sim_id"]}
+    gen = clip["gen_id"][first_g]
+    _, i_g = _join(gs["gen_id"], gen)
+    coef_sim = area_gs / area_g[i_g]
+    out["coef_sim"] = pd.DataFrame(
+        {"coef": coef_sim}, index=codes.index(**gs))
+
+    i_3, i_cs = _join(
+        codes.key(gen_id=g3["gen_id"], sim_id=g3["sim_id"]),
+        codes.key(gen_id=gs["gen_id"], sim_id=gs["sim_id"]),
+        how="left")
+    first, res_gen = _group_sum(
+        g3["gen_id"][i_3],
+        _nan0(res_sim[i_3] * _take(coef_sim, i_cs)[:, None]))
+    g4 = g3["gen_id"][i_3][first]
+    out["res_gen"] = pd.DataFrame(
+        res_gen, columns=res_agg_cols, index=codes.index(gen_id=g4))
+
+    # 5. gen_id
+    # ---------
+    coef_gen = area_g / clip_area.sum()
+    out["coef_gen"] = pd.DataFrame(
+        {"coef": coef_gen}, index=codes.index(gen_id=gen))
+    i_4, i_cg = _join(g4, gen, how="left")
+    out["naturwb_ref"] = pd.Series(
+        _nan0(res_gen[i_4] * _take(coef_gen, i_cg)[:, None]).sum(axis=0),
+        index=res_agg_cols)
+
+    # gather all the coefficients
+    # ---------------------------
+    # gen_id -> sim_id -> nat_id, the coef_sim rows are sorted by gen_id
+    i_gs, i_sn = _join(gs["sim_id"], sn["sim_id"])
+    _, i_g = _join(gs["gen_id"][i_gs], gen)
+    rows = {"gen_id": gs["gen_id"][i_gs],
+            "sim_id": gs["sim_id"][i_gs],
+            "nat_id": sn["nat_id"][i_sn]}
+    coefs = {"coef_gen": coef_gen[i_g],
+             "coef_sim": coef_sim[i_gs],
+             "coef_nat": coef_nat[i_sn]}
+
+    # landuses of the soil group in the NRE
+    i_rows, i_cl = _join(
+        codes.key(gen_id=rows["gen_id"], nat_id=rows["nat_id"]),
+        codes.key(gen_id=cl["gen_id"], nat_id=cl["nat_id"]),
+        how="left")
+    rows = {dim: code[i_rows] for dim, code in rows.items()}
+    coefs = {col: coef[i_rows] for col, coef in coefs.items()}
+    rows["lanu_id"] = np.where(i_cl == -1, -1, cl["lanu_id"][i_cl])
+    coefs["coef_lanu"] = _take(cl_coef, i_cl)
+
+    # soil profiles of the simulation polygon with this landuse
+    raw = {dim: codes.codes(dim, raw_idx.get_level_values(dim))
+           for dim in ["sim_id", "gen_id", "bf_id", "lanu_id"]}
+    i_rows, i_raw = _join(
+        np.where(rows["lanu_id"] == -1, -1, codes.key(
+            sim_id=rows["sim_id"], gen_id=rows["gen_id"],
+            lanu_id=rows["lanu_id"])),
+        codes.key(sim_id=raw["sim_id"], gen_id=raw["gen_id"],
+                  lanu_id=raw["lanu_id"]),
+        how="left")
+    rows = {dim: code[i_rows] for dim, code in rows.items()}
+    coefs = {col: coef[i_rows] for col, coef in coefs.items()}
+    rows["bf_id"] = np.where(i_raw == -1, -1, raw["bf_id"][i_raw])
+    coefs["coef_bfid"] = _take(
+        bfid_area_raw.to_numpy(dtype=float) / 100, i_raw)
+
+    # sort by the ids, rows with undefined ids last
+    dims_all = ["gen_id", "sim_id", "lanu_id", "nat_id", "bf_id"]
+    order = np.lexsort([
+        np.where(rows[dim] == -1, np.iinfo(np.int64).max, rows[dim])
+        for dim in reversed(dims_all)])
+    out["coef_all"] = pd.DataFrame(
+        {col: coef[order] for col, coef in coefs.items()},
+        index=codes.index(**{dim: rows[dim][order] for dim in dims_all}))
+
+    return out
+
+
+def aggregate_levels_pandas(results, bfid_area_raw, coef_lanu, clip_area,
+                            res_agg_cols):
+    """Aggregate the simulation results over all five levels with pandas.
+
+    This is the original join/groupby implementation.
+    It is kept as reference for aggregate_levels
+    and takes and returns the same arguments.
+    """
+    out = {}
+    sim_shps_clip = clip_area.to_frame("area")
+
+    # 1. BF_ID
+    # --------
+    res_gat_1 = results[res_agg_cols].copy()
+    res_gat_1 = res_gat_1.mul(results["bfid_area"].div(100).to_list(),
+                              axis=0)
+    res_gat_1 = res_gat_1.groupby(["sim_id", "gen_id", "lanu_id"]).sum()
+    out["res_gat_1"] = res_gat_1
+
+    # 2. lanu_id
+    # ----------
+    sim_nat_comb = pd.DataFrame(
+        index=sim_shps_clip.index.droplevel("gen_id").unique())
+    res_gat_2 = res_gat_1.join(sim_nat_comb).join(coef_lanu)
+    res_gat_2 = res_gat_2[res_agg_cols].mul(res_gat_2["coef"].to_list(),
+                                            axis=0)
+    res_gat_2 = res_gat_2.groupby(["sim_id", "gen_id", "nat_id"]).sum()
+    out["res_gat_2"] = res_gat_2
+
+    # 3. nat_id
+    # ---------
+    coef_nat = (
+        sim_shps_clip[["area"]]
+        .groupby(["sim_id", "nat_id"]).sum()
+        .join(sim_shps_clip["area"].groupby(["sim_id"]).sum(),
+              rsuffix="_simid"))
+    coef_nat["coef"] = coef_nat["area"] / coef_nat["area_simid"]
+    coef_nat.drop(["area", "area_simid"], axis=1, inplace=True)
+    out["coef_nat"] = coef_nat
+
+    res_sim = res_gat_2.join(coef_nat)
+    res_sim = res_sim[res_agg_cols].mul(res_sim["coef"].to_list(), axis=0)
+    res_sim = res_sim.groupby(["sim_id", "gen_id"]).sum()
+    out["res_sim"] = res_sim
+
+    # 4. sim_id
+    # ---------
+    coef_sim = (
+        sim_shps_clip[["area"]].groupby(["gen_id", "sim_id"]).sum() /
+        sim_shps_clip[["area"]].groupby("gen_id").sum())
+    coef_sim.rename({"area": "coef"}, axis=1, inplace=True)
+    out["coef_sim"] = coef_sim
+
+    res_gen = res_sim.join(coef_sim)
+    res_gen = res_gen[res_agg_cols].mul(res_gen["coef"].to_list(), axis=0)
+    res_gen = res_gen.groupby("gen_id").sum()
+    out["res_gen"] = res_gen
+
+    # 5. gen_id
+    # ---------
+    coef_gen = (sim_shps_clip[["area"]].groupby("gen_id").sum() /
+                sim_shps_clip["area"].sum())
+    coef_gen.rename({"area": "coef"}, axis=1, inplace=True)
+    out["coef_gen"] = coef_gen
+
+    naturwb_ref = res_gen.join(coef_gen)
+    naturwb_ref = naturwb_ref[res_agg_cols].mul(
+        naturwb_ref["coef"].to_list(), axis=0)
+    out["naturwb_ref"] = naturwb_ref.sum()
+
+    # gather all the cooefficients
+    out["coef_all"] = (
+        coef_gen.join(coef_sim, lsuffix="_gen", rsuffix="_sim")
+        .join(coef_nat
+              .rename({"coef": "coef_nat"}, axis=1))
+        .join(coef_lanu
+              .rename({"coef": "coef_lanu"}, axis=1))
+        .join((bfid_area_raw.to_frame("bfid_area") / 100)
+              .rename({"bfid_area": "coef_bfid"}, axis=1)))
+
+    return out
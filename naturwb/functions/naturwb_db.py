@@ -1,3 +1,5 @@
+from .naturwb_sql import prepare
+
 
 def results_to_db(naturwb_query):
     """Save a naturwb.Query object to the database.
@@ -14,21 +16,12 @@ def results_to_db(naturwb_query):
         ).fillna(0)
 
     # insert to database
-    sql_insert = (
-        'INSERT INTO naturwb_results_saved ' +
-        '(urban_shp, centroid, n, et, runoff, gwnb, "kap.A.", {lanu_cols})' +
-        "VALUES (ST_GeomFromText('{urban_shp}', 4326), " +
-        "ST_Centroid(ST_GeomFromText('{urban_shp}', 4326)), "
-        "{n}, {et}, {runoff}, {tp}, {kap}, {lanu_values});" +
-        "DELETE FROM naturwb_results_saved " +
-        "WHERE timestamp < (now() - INTERVAL '2 HOUR') ;"
-    ).format(
-        urban_shp=naturwb_query.urban_shp_wgs.iloc[0].to_wkt(),
-        lanu_cols="lanu_" + ", lanu_".join(lanus.index.astype(str)),
-        lanu_values=", ".join(lanus.astype(str).to_list()),
-        **naturwb_query.naturwb_ref.rename({"kap.A.": "kap"}).to_dict()
-        )
-    with naturwb_query.db_engine.connect() as conn:
-        conn.execute(sql_insert)
-
-    
\ No newline at end of file
+    params = naturwb_query.naturwb_ref.rename({"kap.A.": "kap"})[
+        ["n", "et", "runoff", "tp", "kap"]].astype(float).to_dict()
+    params.update({
+        "lanu_" + str(lanu_id): float(value)
+        for lanu_id, value in lanus.items()})
+    params["urban_wkb"] = naturwb_query.urban_shp_wgs.iloc[0].wkb
+    with naturwb_query.db_engine.begin() as conn:
+        conn.execute(prepare(conn, "results_to_db"), params)
+        conn.execute(prepare(conn, "delete_saved_results"))
@@ -0,0 +1,1233 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""The plots of the NatUrWB query.
+
+matplotlib, plotly and contextily take most of the import time
+of the naturwb package. Therefor the plots are in this module,
+which only gets imported by naturwb.Query when the first plot is made.
+The methods of QueryPlots are called with the naturwb.Query as self.
+
+The matplotlib figures are created with the object-oriented Figure API
+on an Agg canvas, so no figure gets registered in the global state of pyplot
+and the figures are freed as soon as the query releases them.
+"""
+
+# libraries
+import geopandas as gpd
+import pandas as pd
+from shapely.geometry import MultiPolygon
+import numpy as np
+import json
+from textwrap import wrap
+try:
+    import importlib.resources as pkg_resources
+except ImportError:
+    import importlib_resources as pkg_resources
+try:
+    from . import data
+except ImportError:
+    try:
+        from .. import data
+    except ImportError:
+        import data
+try:
+    from .naturwb_sql import prepare, ids
+except ImportError:
+    from naturwb_sql import prepare, ids
+try:
+    from .naturwb import (
+        _simplify_for_map, MAP_SIMPLIFY_PX, MAP_ZOOM_RESERVE, MAP_DECIMALS)
+except ImportError:
+    from naturwb import (
+        _simplify_for_map, MAP_SIMPLIFY_PX, MAP_ZOOM_RESERVE, MAP_DECIMALS)
+from io import BytesIO
+import base64
+
+# plotly
+import plotly as ply
+import plotly.graph_objs as go
+from plotly.offline import plot as ply_plot
+
+# matplotlib
+import matplotlib as mpl
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.image import imread
+from matplotlib import patheffects
+from matplotlib.sankey import Sankey
+from matplotlib import cm
+from matplotlib.path import Path as mplPath
+from matplotlib.patches import PathPatch
+import contextily as cx
+
+
+mpl.rcParams['hatch.linewidth'] = 2
+
+# changed Sankey class
+class _SankeyNWB(Sankey):
+    def finish(self):
+        return self.diagrams
+
+def _new_figure(figsize):
+    """Create a matplotlib figure with one axes on an Agg canvas.
+
+    Unlike plt.subplots the figure is not kept by pyplot.
+    """
+    fig = Figure(figsize=figsize)
+    FigureCanvasAgg(fig)
+    ax = fig.subplots()
+    return fig, ax
+
+def _add_basemap(ax, crs, attribution_size):
+    """Add the OpenStreetMap basemap with its attribution.
+
+    contextily's attribution calls pyplot.draw, which would create
+    a new pyplot figure, therefor the attribution is added here.
+    """
+    source = cx.providers.OpenStreetMap.Mapnik
+    cx.add_basemap(ax=ax, crs=crs, source=source, attribution=False)
+
+    # draw to get the size of the axis to wrap the text, like contextily
+    ax.figure.canvas.draw()
+    text = ax.text(
+        0.005, 0.005, source["attribution"],
+        transform=ax.transAxes,
+        size=attribution_size,
+        path_effects=[patheffects.withStroke(linewidth=2, foreground="w")],
+        wrap=True)
+    wrap_width = ax.get_window_extent().width * 0.99
+    text._get_wrap_line_width = lambda: wrap_width
+
+# the output formats of the matplotlib plots for the web with their mime type
+# webp needs Pillow
+MPL_WEB_FORMATS = {
+    "svg": "image/svg+xml",
+    "webp": "image/webp",
+    "png": "image/png"}
+# the format for fmt="web", webp if Pillow can write it, otherwise png
+try:
+    from PIL import features as pil_features
+    MPL_WEB_FORMAT = "webp" if pil_features.check("webp") else "png"
+except ImportError:
+    MPL_WEB_FORMAT = "png"
+
+def _mpl_fig_to_graphic(fig, dpi=75, fmt="png", bbox_inches="tight"):
+    fig.set_dpi(dpi)
+    with BytesIO() as buffer:
+        fig.savefig(buffer, format=fmt, bbox_inches=bbox_inches)
+        buffer.seek(0)
+        image = buffer.getvalue()
+    graphic = base64.b64encode(image)
+    graphic = graphic.decode('utf-8')
+
+    return graphic
+
+def _mpl_fig_to_data_uri(fig, dpi=75, fmt="png", bbox_inches="tight"):
+    """Get the figure as data URI, for several formats the smallest one."""
+    if fmt == "web":
+        fmt = MPL_WEB_FORMAT
+    if isinstance(fmt, str):
+        fmt = [fmt]
+    graphics = [
+        "data:{mime};base64,{graphic}".format(
+            mime=MPL_WEB_FORMATS[single_fmt],
+            graphic=_mpl_fig_to_graphic(
+                fig, dpi=dpi, fmt=single_fmt, bbox_inches=bbox_inches))
+        for single_fmt in fmt]
+    return min(graphics, key=len)
+
+def fig_to_web(fig, dpi=75, fmt="png", bbox_inches="tight"):
+    """Convert a figure for a website, see naturwb.Query.plot_web."""
+    if isinstance(fig, Figure):
+        return _mpl_fig_to_data_uri(
+            fig, dpi=dpi, fmt=fmt, bbox_inches=bbox_inches)
+    elif type(fig) == go.Figure:
+        return ply_plot(fig, output_type='div', include_plotlyjs=False)
+    else:
+        return None
+
+def release_figure(fig):
+    """Free a converted figure.
+
+    The matplotlib figures hold reference cycles between the figure,
+    the axes and the artists, clearing them lets the memory get freed
+    without waiting for the garbage collector.
+    """
+    if isinstance(fig, Figure):
+        fig.clear()
+
+
+class QueryPlots(object):
+    """The plot methods of naturwb.Query.
+
+    Use the plot or plot_web method of the query to create the figures.
+    """
+    def _make_plot_sim_shps_clip(self, width=20, cex=1,
+                               bbox_x_gen=0, bbox_x_nat=0):
+        """
+        Create the sim_shps_clip plot to represent the soil groups and the NRE
+        in the urban area.
+
+        It is recommended to use the plot or plot_web methode to create the plot figure not this function.
+
+        Parameters
+        ----------
+        width : int, optional
+            The width of the matplotlibs figsize.
+            The default is 20.
+        cex : int, optional
+            Factor to stretch the fontsizes.
+            The default is 1.
+        bbox_x_gen : int, optional
+            Factor to add to the GEN_ID legend bbox_to_anchor x coords.
+            The default is 0.
+        bbox_x_nat : int, optional
+            Factor to add to the NRE legend bbox_to_anchor x coords.
+            The default is 0.
+
+        Returns
+        -------
+        matplotlib.figure.Figure
+
+        """
+        # define variables to be able to copy the plot syntax from Notebook 5.2
+        # -----------------
+        sim_shps_clip = self.sim_shps_clip
+        height = width * 17/20
+
+        # plot code
+        # ----------
+        fig, ax = _new_figure(figsize=(width, height))
+
+        # plot soil classes
+        gen_dis = sim_shps_clip.dissolve(["gen_id", "color", "leg_tkle_kurz"])
+        plots = []
+        labels_gen = []
+        colors_gen = []
+        for (genid, color, label), df in gen_dis.groupby(["gen_id",
+                                                          "color",
+                                                          "leg_tkle_kurz"]):
+            plot = df.plot(ax=ax, color=color, label=label, alpha=0.8,
+                           legend=True, categorical=True)
+            plots.append(plot)
+            labels_gen.append(str(genid) + ": " + label)
+            colors_gen.append(color)
+
+        # add NRE ID and border
+        # nat_dis = sim_shps_clip.dissolve("nat_id").reset_index().explode(index_parts=True)
+        with self.db_engine.connect() as conn:
+            nre_clip = gpd.read_postgis(
+                sql=prepare(conn, "nre_clip"),
+                con=conn,
+                params=dict(
+                    nat_ids=ids(sim_shps_clip.index.get_level_values("nat_id"))),
+                geom_col="geom",
+                index_col="nat_id",
+                crs=25832
+            )
+        lut = len(np.unique(nre_clip.index.values))
+        colors_nat = cm.get_cmap(name="Set1", lut=lut)(range(0, lut))
+        hatches_all = ["/", "\\", "|", "-", ".", "x", "+",
+                       "//", "||", "\\\\", "*", "+"] * 2
+        labels_nat = []
+        for (_, gdf_nat), hatch, color in zip(nre_clip.groupby("nat_id"),
+                                                  hatches_all, colors_nat):
+            gdf_nat.plot(ax=ax, edgecolor=color,
+                         facecolor=(0, 0, 0, 0), hatch=hatch)
+            labels_nat.append(gdf_nat["name"].iloc[0])
+
+        # add urban shape
+        self.urban_shp_utm.boundary.plot(ax=ax, color="k")
+
+        # add basemap
+        _add_basemap(ax, crs=sim_shps_clip.crs, attribution_size=18 * cex)
+        ax.set_axis_off()
+
+        # set legends
+        legend_nat = ax.legend(
+            handles=(
+                [mpl.patches.Patch(
+                    edgecolor=color,
+                    facecolor=(0, 0, 0, 0),
+                    hatch=hatch)
+                    for color, hatch in zip(colors_nat, hatches_all)] +
+                [mpl.patches.Patch(color=(0,0,0,0)),
+                mpl.patches.Patch(edgecolor="k", facecolor=(0,0,0,0))]),
+            labels=labels_nat + ["", "Urbanes Gebiet"],
+            loc=2,
+            bbox_to_anchor=(-0.1 - bbox_x_nat, 1),
+            labelspacing=1.5, handlelength=3, borderpad=1,
+            fontsize=13 * cex, title_fontsize=15 * cex)
+        for patch in legend_nat.get_patches():
+            patch.set_height(20 + 8 * (width - 20)/20)
+            patch.set_y(-5)
+        ax.add_artist(legend_nat)
+
+        ncol_leg_gen = max(25, len(labels_gen))//25
+        ax.legend(
+            handles=[mpl.patches.Patch(color=color) for color in colors_gen],
+            labels=['\n        '.join(wrap(lbl, 50)) for lbl in labels_gen],
+            title="      Bodengesellschaft\nGEN_ID: Kurzbeschreibung",
+            loc=1,
+            bbox_to_anchor=((1.25 + (ncol_leg_gen-1) * 0.28) + bbox_x_gen, 1),
+            ncol=ncol_leg_gen,
+            fontsize=13 * cex, title_fontsize=15 * cex)
+
+        fig.set_tight_layout(True)
+
+        # save fig to object
+        # -------------------
+        self.fig_sim_shps_clip = fig
+
+    def _make_plot_sim_shps_clip_plotly(self, simplify_px=MAP_SIMPLIFY_PX,
+                                        decimals=MAP_DECIMALS):
+        """Create the sim_shps_clip figure with plotly (interactive).
+
+        It is recommended to use the plot or plot_web methode to create the plot figure not this function.
+
+        Parameters
+        ----------
+        simplify_px : float or None, optional
+            The tolerance in pixels to simplify the polygons with,
+            at the initial zoom level plus MAP_ZOOM_RESERVE.
+            If None or 0, the polygons are not simplified.
+            The default is MAP_SIMPLIFY_PX.
+        decimals : int or None, optional
+            The number of decimals to round the coordinates to.
+            If None, the coordinates are not rounded.
+            The default is MAP_DECIMALS.
+        """
+        urban_shp_plot = self.urban_shp_wgs.iloc[0]
+
+        # extend
+        bounds = np.array(urban_shp_plot.bounds)
+        center_x, center_y = bounds[:2] + ((bounds[2:] - bounds[:2]) / 2)
+        ext_x = bounds[2] - bounds[0]
+        ext_y = bounds[3] - bounds[1]
+        zoom = min(
+            np.log(360/(ext_x)) / np.log(2),
+            np.log(360/(ext_y)) / np.log(2),
+        ) - 1
+
+        # the size of a pixel in degrees, with tiles of 256 pixels
+        tolerance = None
+        if simplify_px:
+            tolerance = simplify_px * 360 / (256 * 2**(zoom + MAP_ZOOM_RESERVE))
+
+        # create df
+        gen_dis = self.sim_shps_clip.dissolve(
+            ["gen_id", "color", "leg_tkle_kurz"]).to_crs(4326)
+        gen_dis["geometry"] = _simplify_for_map(
+            gen_dis.geometry, tolerance, decimals)
+        gen_dis = gen_dis.reset_index()\
+            .explode(index_parts=False).reset_index(drop=True)
+        gen_dis = gen_dis[~gen_dis.geometry.is_empty]
+        urban_shp_plot = _simplify_for_map(
+            self.urban_shp_wgs, tolerance, decimals).iloc[0]
+
+        if not hasattr(self, "nre"):
+            self._sql_nre()
+        nre = self.nre.copy()
+        nre["geometry"] = _simplify_for_map(nre.geometry, tolerance, decimals)
+
+        fig = go.Figure()
+
+        # add soils
+        for i_gen, ((genid, color, tkle_kurz, tkle_txt), df) in enumerate(
+                gen_dis.groupby(["gen_id", "color",
+                                 "leg_tkle_kurz", "leg_tkle_txt"])):
+            fig.add_choroplethmapbox(
+                geojson=json.loads(df[["geometry"]].to_json()),
+                z=[i_gen,] * len(df),
+                locations=df.index,
+                colorscale=((0, color), (1, color)),
+                showscale=False,
+                hovertemplate=(
+                    "<b>Bodengesellschaft</b>:<br>" +
+                    "GEN_ID: %{meta[0]}<br>%{meta[1]}" +
+                    "<extra>%{meta[2]}</extra>"
+                ),
+                meta=[genid,
+                      "<br>".join(wrap(tkle_kurz, 30)),
+                      "<br>".join(wrap(tkle_txt, 30))],
+                showlegend=True,
+                hoverlabel=dict(bgcolor=color),
+                name="<br>".join(wrap(str(genid) + ": " + tkle_kurz, 40)),
+                marker_line_width=0,
+                marker=dict(opacity=0.75),
+                legendgroup="Soils",
+                visible=True
+            )
+
+        # add nat_id
+        n_nre = len(nre)
+        colors_nat = [
+            mpl.colors.to_hex(color) for color in
+            cm.get_cmap(name="Set1", lut=n_nre)(range(0, n_nre))]
+        for i_nat, (((natid, name), gdf_nat), color) in enumerate(
+                zip(nre.groupby(["nat_id", "name"]), colors_nat)):
+            fig.add_choroplethmapbox(
+                geojson=json.loads(gdf_nat[["geometry"]].to_json()),
+                locations=gdf_nat.index,
+                z=[i_nat,] * len(gdf_nat),
+                colorscale=((0, color), (1, color)),
+                showscale=False,
+                hovertemplate=(
+                    "<b>Naturraumeinheit</b>:<br>%{meta[0]}" +
+                    "<extra></extra>"
+                ),
+                meta=["<br>".join(wrap(name, 30))],
+                showlegend=True,
+                name="<br>".join(wrap(name, 40)),
+                marker_line_width=0,
+                marker=dict(opacity=0.75),
+                legendgroup="NRE",
+                visible=False
+            )
+
+        # add urban_shp
+        if type(urban_shp_plot) == MultiPolygon:
+            long, lat = [],[]
+            for geom in urban_shp_plot.geoms:
+                xy = geom.exterior.xy
+                long.append(xy[0].tolist())
+                lat.append(xy[1].tolist())
+        else:
+            long, lat = urban_shp_plot.exterior.xy
+            long = list([long.tolist()])
+            lat = list([lat.tolist()])
+
+        leg_bool = True
+        for lati, longi in zip(lat, long):
+            fig.add_scattermapbox(
+                lat=lati,
+                lon=longi,
+                mode = "lines",
+                marker=dict(color="black"),
+                legendgroup="urban shape",
+                name="urbanes Gebiet",
+                visible=True,
+                showlegend=leg_bool,
+                hoverinfo="skip"
+            )
+            leg_bool=False
+
+        # update layout
+        fig.update_layout(
+            mapbox=dict(
+                style="open-street-map",
+                zoom=zoom,
+                center={"lat": center_y, "lon": center_x}),
+            legend=dict(
+                title=dict(
+                    text="      <b>Bodengesellschaft<br>GEN_ID: Kurzbeschreibung</b>",
+                    font=dict(size=16)),
+                tracegroupgap=35),
+            updatemenus=[dict(
+                type="dropdown",
+                direction="down",
+                buttons=list([
+                    dict(
+                        args=[
+                            {"visible": ([True, ] * (i_gen+1) +
+                                         [False, ] * (i_nat+1) +
+                                         [True,] * len(lat))},
+                            {"legend.title.text":
+                                "      <b>Bodengesellschaft<br>GEN_ID: Kurzbeschreibung</b>",
+                            "legend.x": 1.1}],
+                        label="Bodengesellschaften",
+                        method="update"
+                    ),
+                    dict(
+                        args=[
+                            {"visible": ([False, ] * (i_gen+1) +
+                                         [True, ] * (i_nat+1) +
+                                         [True,] * len(lat))},
+                            {"legend.title.text":
+                                "<b>Naturraumeinheiten</b>"}],
+                        label="Naturraumeinheiten",
+                        method="update"
+                    )
+                ]),
+                showactive=True,
+                x=1.05,
+                xanchor="left",
+                y=1.1,
+                yanchor="top",
+                pad=dict(r=20) )],
+            autosize=True,
+            margin=dict(t=12, l=0, autoexpand=True),
+            modebar=dict(orientation="v"),
+            height=650,
+            font_size=16,
+            hoverlabel=dict(font=dict(size=14)),
+            annotations=[
+                {"text": "© GeoBasis-DE/ BKG 2018",
+                "valign": "bottom", "align": "right",
+                "showarrow":False,
+                "xref":'paper', "yref":'paper',
+                "x":0.01, "y":0.01,
+                "font_size": 12}]
+        )
+
+        # save fig to object
+        # -------------------
+        self.fig_sim_shps_clip_plotly = fig
+
+    def _make_plot_reference_polys(self, figsize=(15, 15)):
+        """
+        Create the figure with the reference shapes.
+
+        This plot takes a bit to get created.
+
+        It is recommended to use the plot or plot_web methode to create the plot figure not this function.
+
+        Parameters
+        ----------
+        figsize : tuple, optional
+            The size of the figure in a matplotlib figsize format.
+            The default is (15, 15).
+        """
+        # define variables to be able to copy the plot syntax from Notebook 5.2
+        # -----------------
+        sim_shps_clip = self.sim_shps_clip
+
+        if hasattr(self, "ref_polys"):
+            ref_polys = self.ref_polys
+        else:
+            self._sql_query_ref_polys()
+            ref_polys = self.ref_polys
+
+        # plot code
+        # ----------
+        fig, ax = _new_figure(figsize=figsize)
+        ref_polys.reset_index().plot(
+            ax=ax, column="lanu_name",
+            categorical=True, legend=True, alpha=0.7)
+
+        # legend
+        leg = ax.get_legend()
+        leg.set_label("Landnutzung")
+        for text in leg.get_texts():
+            text.set_text("\n".join(wrap(text.get_text(), 40)))
+        leg._set_loc(2)
+        leg.set_bbox_to_anchor((0.9, 1))
+
+        _add_basemap(ax, crs=sim_shps_clip.crs, attribution_size=18)
+        ax.set_axis_off()
+
+        # save fig to object
+        # -------------------
+        self.fig_reference_polys = fig
+
+    def _make_plot_pie(self, figsize=(7, 7), do_title=True,
+                       label_fontsize="x-large", title_fontsize="xx-large"):
+        """
+        Create the naturwb pie figure.
+
+        It is recommended to use the plot or plot_web methode to create the plot figure not this function.
+
+        Parameters
+        ----------
+        figsize : tuple, optional
+            The size of the figure.
+            The Default is (7, 7).
+        do_title : bool, optional
+            Should the figure have a title?
+            The default is True.
+        label_fontsize : str or int, optional
+            The fontsize of the labels in a matplotlib fontsize format
+            The default is "x-large".
+        title_fontsize : str or int, optional
+            The fontsize of the labels in a matplotlib fontsize format.
+            Only used if do_title is True.
+            The default is "xx-large".
+        """
+        # plot code
+        # ----------
+        fig, ax = _new_figure(figsize=figsize)
+        self.naturwb_ref[["runoff", "tp", "et"]].plot.pie(
+            ax=ax,
+            ylabel="",
+            labels=[
+                "Abfluss (Q)",
+                "Grundwasserneubildung (GWNB)",
+                "Evapotranspitation (ET)"],
+            autopct='%1.0f%%',
+            fontsize=label_fontsize
+        )
+
+        if do_title:
+            ax.set_title(label="NatUrWB Referenz", fontsize=title_fontsize)
+
+        fig.set_tight_layout(True)
+
+        # save fig to object
+        # -------------------
+        self.fig_pie = fig
+
+    def _make_plot_pie_plotly(self):
+        """
+        Create the naturwb pie figure with plotly (interactive).
+
+        It is recommended to use the plot or plot_web methode to create the plot figure not this function.
+        """
+        # define variables to be able to copy the plot syntax from Notebook 5.2
+        # -----------------
+        naturwb_ref = self.naturwb_ref
+
+        # plot code
+        # ----------
+        colors = ['#1f77b4', '#ff7f0e', '#2ca02c'] # mpl standarts
+
+        fig = go.Figure(data=[
+            go.Pie(
+                values=(naturwb_ref[["runoff", "tp", "et"]] /
+                        naturwb_ref[["runoff", "tp", "et"]].sum()),
+                labels=["Abfluss (Q)", "Grundwasserneubildung (GWNB)", "Evapotranspiration (ET)"],
+                hovertemplate="%{label}<br>%{value:.1%}<extra></extra>",
+                texttemplate="%{value:.1%}",
+                marker=dict(
+                    colors=colors
+                )
+            )])
+
+        fig.update_layout(
+            title=dict(
+                text="NatUrWB Referenz",
+                font_size=20,
+                x=0.5,
+                xanchor="center"),
+            font_size=16,
+            hoverlabel=dict(font=dict(size=14)),
+            legend=dict(
+                orientation="h",
+                valign="bottom")
+        )
+
+        # save fig to object
+        # -------------------
+        self.fig_pie_plotly = fig
+
+    def _get_lanu_parts(self):
+        """Get the shares, names and colors of the reference landuses."""
+        lanu_parts = self.coef_all.prod(axis=1).groupby("lanu_id").sum().to_frame("coef")
+        with self.db_engine.connect() as con:
+            lanu_parts = lanu_parts.join(pd.read_sql(
+                con=con, sql=prepare(con, "leg"),
+                params=dict(lanu_ids=ids(lanu_parts.index)),
+                index_col="lanu_id"))
+
+        lanu_parts["colors"] = list(map(
+            mpl.colors.to_hex,
+            cm.get_cmap("Set1_r", len(lanu_parts))(range(0, len(lanu_parts)))))
+        return lanu_parts
+
+    def _make_plot_pie_landuse(self):
+        """Create the landuse pie figure.
+
+        It is recommended to use the plot or plot_web methode to create the plot figure not this function.
+        """
+        # plot code
+        # ----------
+        lanu_parts = QueryPlots._get_lanu_parts(self)
+        fig = go.Figure(data=[
+            go.Pie(
+                values=lanu_parts["coef"],
+                labels=lanu_parts["name"].apply(lambda x: "<br>".join(wrap(x, 30))),
+                hovertemplate="%{label}<br>%{value:.1%}<extra></extra>",
+                texttemplate="%{value:.1%}",
+                marker=dict(colors=lanu_parts["colors"].to_list())
+            )])
+        fig.update_layout(
+            title=dict(
+                text="Landnutzungsverteilung",
+                x=0.5,
+                xanchor="center"),
+            font_size=16,
+            hoverlabel=dict(font=dict(size=14))
+        )
+
+        # save fig to object
+        # -------------------
+        self.fig_pie_landuse = fig
+
+    def _make_plot_pie_landuse_mpl(self, figsize=(7,7), explode_small=False):
+        """Create the landuse pie figure.
+
+        It is recommended to use the plot or plot_web methode to create the plot figure not this function.
+        """
+        # get df
+        # ----------
+        lanu_parts = QueryPlots._get_lanu_parts(self)
+        colors = lanu_parts["colors"].to_list()
+        lanu_parts["name"] = lanu_parts["name"].apply(
+            lambda x: x.replace("/", "/\n"))
+        lanu_parts = lanu_parts.sort_values("coef")
+        lanu_parts = lanu_parts[lanu_parts["coef"]>0.001]
+
+        # make plot
+        fig, ax = _new_figure(figsize=figsize)
+        lanu_parts.plot.pie(
+                    ax=ax,
+                    y="coef",
+                    ylabel="",
+                    labels=lanu_parts["name"],
+                    colors=colors,
+                    autopct='%1.0f%%',
+                    fontsize=12,
+                    labeldistance=None,
+                    pctdistance=0.8,
+                    startangle=15,
+                    explode=lanu_parts["coef"].apply(
+                        lambda x: 0.3 if x < 0.03 and explode_small else 0)
+                )
+        ax.get_legend().remove()
+        fig.legend(loc="lower right", bbox_to_anchor=(1.25,0.2))
+        ax.set_title("Landnutzungsverteilung")
+
+        # save fig to object
+        # -------------------
+        self.fig_pie_landuse_mpl = fig
+
+    def _make_plot_ternary(self, do_size=False, width=1000,
+                           marker_sizemin=2.5, marker_sizecoef=0.04):
+        """
+        Create the ternary figure.
+
+        It is recommended to use the plot or plot_web methode to create the plot figure not this function.
+
+        Parameters
+        ----------
+        do_size : boolean, optional
+            Should the size of the dots represent the share the dot represents?
+            The default is False.
+        width : int, optional
+            The width of the figure.
+            The default is 1000.
+        marker_sizemin : int, optional
+            The Minimum size of the dots. Only relevant if do_size=True.
+            The default is 2.5.
+        marker_sizecoef : TYPE, optional
+            The coefficient to use to scale the size of the dots.
+            Only relevant if do_size=True.
+            The default is 0.04.
+
+        Returns
+        -------
+        plotly.graph_objs.Figure
+            The plotly figure object of the plot.
+        """
+        # plot code
+        # ----------
+        # create dataframe
+        res_3_ternary = self.res_sim.copy()
+        naturwb_ternary = self.naturwb_ref.copy()
+
+        paras = ["runoff", "tp", "et"]
+        for para in paras:
+            res_3_ternary[para + "_part"] = \
+                res_3_ternary[para] / res_3_ternary[paras].sum(axis=1)
+            naturwb_ternary[para + "_part"] = \
+                naturwb_ternary[para] / naturwb_ternary[paras].sum()
+
+        res_3_ternary = res_3_ternary.join(self.coef_gen * self.coef_sim)
+
+        # add legend information to the dataframe
+        with self.db_engine.connect() as con:
+            ternary_leg = pd.read_sql(
+                sql=prepare(con, "ternary_leg"),
+                con=con,
+                params=dict(sim_ids=ids(
+                    res_3_ternary.index.get_level_values("sim_id"))),
+                index_col="sim_id")
+            res_3_ternary = res_3_ternary.join(ternary_leg)
+
+        # initiate the figure
+        fig = go.Figure()
+
+        # plot the different soil
+        for (genid, color), df in res_3_ternary.groupby(["gen_id", "color"]):
+            # create marker dict depending if the size should be dependent
+            if do_size:
+                marker_dict = dict(
+                    opacity=0.7, color=color,
+                    size=df["coef"],
+                    sizeref=marker_sizecoef * res_3_ternary["coef"].max(),
+                    sizemin=marker_sizemin)
+            else:
+                marker_dict = dict(color=color)
+
+            # wrap the labels
+            df["leg_txt"] = df["leg_txt"].apply(
+                lambda x: "<br>".join(wrap(x, 30)))
+
+            # add the traces
+            fig.add_trace(
+                go.Scatterternary(
+                    a=df["runoff_part"],
+                    b=df["tp_part"],
+                    c=df["et_part"],
+                    mode="markers",
+                    hovertemplate=(
+                        "ET:        %{c:.1%} (%{customdata[0]:.0f} mm/a)<br>" +
+                        "Q:          %{a:.1%} (%{customdata[1]:.0f} mm/a)<br>" +
+                        "GWNB: %{b:.1%} (%{customdata[2]:.0f} mm/a)<br><br>" +
+                        "Anteil an NatUrWB-Zielwert: %{customdata[3]:.2%}" +
+                        "<extra>GEN_ID: %{meta[0]}<br>%{customdata[4]}" +
+                        "</extra>"
+                    ),
+                    meta=[genid],
+                    customdata=df[
+                        ["et", "runoff", "tp", "coef", "leg_txt"]],
+                    name=str(genid),  # "<br>".join(wrap(leg_kurz, 20)),
+                    legendgroup="Bodengesellschaft",
+                    marker=marker_dict,
+                    cliponaxis=False
+                )
+            )
+
+        # plot the naturwb-reference
+        fig.add_trace(
+            go.Scatterternary(
+                a=naturwb_ternary[["runoff_part"]],
+                b=naturwb_ternary[["tp_part"]],
+                c=naturwb_ternary[["et_part"]],
+                mode="markers",
+                hovertemplate=(
+                    "ET:        %{c:.1%} (%{meta[0]:,.0f} mm/a)<br>" +
+                    "Q:          %{a:.1%} (%{meta[1]:,.0f} mm/a)<br>" +
+                    "GWNB: %{b:.1%} (%{meta[2]:,.0f} mm/a)" +
+                    "<extra>NatUrWB-Zielwert</extra>"),
+                meta=[naturwb_ternary[["et", "runoff", "tp"]]],
+                name="NatUrWB-Zielwert",
+                legendgroup="Zielwert",
+                hoverinfo="text",
+                marker=dict(
+                    symbol=17, size=20, color="#007bff",
+                    line_color="#000000", line_width=1.5),
+                cliponaxis=False
+            )
+        )
+
+        # update layout
+        tickvals = np.arange(0, 1.2, 0.2)
+        ticktext = list(map(lambda x: x + " %",
+                            np.arange(0, 120, 20).astype(str)))
+        width = min(1500, max(800, width))
+        height = width - 250
+
+        fig.update_layout(
+            legend=dict(
+                title=dict(
+                    text="Bodengesellschafts ID",
+                    font=dict(size=16)),
+                tracegroupgap=35
+            ),
+            ternary=dict(
+                aaxis=dict(
+                    title="",
+                    color="#4B8A08",
+                    ticks="outside",
+                    tickangle=0,
+                    tickvals=tickvals, ticktext=ticktext,
+                    showline=True, linecolor="#4B8A08",
+                    showgrid=True, gridcolor="#4B8A08"),
+                baxis=dict(
+                    title="", color="#8A2908",
+                    ticks="outside", tickangle=60,
+                    tickvals=tickvals, ticktext=ticktext,
+                    showline=True, linecolor="#8A2908",
+                    showgrid=True, gridcolor="#8A2908"),
+                caxis=dict(
+                    title="",  color="#0B2161",
+                    ticks="outside", tickangle=-60,
+                    tickvals=tickvals, ticktext=ticktext,
+                    showline=True, linecolor="#0B2161",
+                    showgrid=True, gridcolor="#0B2161",
+                    hoverformat="ET: %{a:2}")
+            ),
+            annotations=[
+                dict(text="Abfluss",
+                     x=0.07, xref="paper",
+                     y=0.5, yref="paper",
+                     textangle=-60,
+                     font=dict(color="#4B8A08", size=16),
+                     align="left", showarrow=False),
+                dict(text="Grundwasserneubildung",
+                     x=0.5, xref="paper",
+                     y=0.00018571*height-0.31214, yref="paper",
+                     font=dict(color="#8A2908", size=16),
+                     align="left", showarrow=False),
+                dict(text="Evapotranspiration",
+                     x=0.97, xref="paper",
+                     y=0.5, yref="paper",
+                     textangle=60,
+                     font=dict(color="#0B2161", size=16),
+                     align="left", showarrow=False)
+            ],
+            clickmode="event+select",
+            hovermode="closest",
+            width=width,
+            height=height,
+            font_size=16,
+            hoverlabel=dict(font=dict(size=14)),
+            margin=dict(b=120, r=120)
+        )
+
+        if do_size:
+            fig.update_layout(
+                legend=dict(
+                    itemsizing="constant"))
+
+        # save fig to object
+        # -------------------
+        self.fig_ternary = fig
+
+    def _make_plot_bar(self):
+        """Create the Bar figure.
+
+        It is recommended to use the plot or plot_web methode to create the plot figure not this function.
+        """
+        # create dfs
+        res_bar = self.res_gen.copy()
+        naturwb_bar = self.naturwb_ref.copy()
+        paras = ["runoff", "tp", "et"]
+        for para in paras:
+            res_bar[para + "_part"] = \
+                res_bar[para] / res_bar[paras].sum(axis=1)
+            naturwb_bar[para + "_part"] = \
+                naturwb_bar[para] / naturwb_bar[paras].sum()
+
+        # create dicts for the plot labels
+        name_dict = {
+            "legend": {
+                "et_part": "Evaoptranspiration (ET)",
+                "runoff_part": "Abfluss (Q)",
+                "tp_part": "Grundwasserneubildung (GWNB)"},
+            "short": {
+                "et_part": "ET",
+                "runoff_part": "Q",
+                "tp_part": "GWNB"
+            }
+        }
+        col_dict = {
+            "et_part": "blue",
+            "runoff_part": "green",
+            "tp_part": "brown"}
+
+        # create the plot
+        fig = go.Figure()
+
+        # add naturwb bar
+        for col in ["tp_part", "runoff_part", "et_part"]:
+            fig.add_trace(
+                go.Bar(
+                    x=['NatUrWB-Referenz'],
+                    y=naturwb_bar[[col]]*100,
+                    text=name_dict["legend"][col],
+                    hovertemplate='%{y:.2f}%<br>%{meta}<extra>%{x}</extra>',
+                    meta=name_dict["short"][col],
+                    name=name_dict["legend"][col],
+                    marker=dict(color=col_dict[col])
+                )
+            )
+
+        # add other soils
+        start = 2
+        for genid, df in res_bar.groupby("gen_id"):
+            for col in ["tp_part", "runoff_part", "et_part", ]:
+                fig.add_trace(
+                    go.Bar(
+                        x=[genid],
+                        text=genid,
+                        y=df[col]*100,
+                        hovertemplate=(
+                            '%{label:.2f}%<br>%{meta}<extra>%{x}</extra>'),
+                        meta=[name_dict["short"][col], ],
+                        name=name_dict["legend"][col],
+                        marker=dict(color=col_dict[col]),
+                        showlegend=False,
+                        opacity=0.7
+                    )
+                )
+            start += len(df) + 1
+
+        # update the layout
+        fig.update_layout(
+            barmode='stack',
+            xaxis=dict(
+                type='category',
+                categoryorder='array',
+                categoryarray=['NatUrWB-Referenz', ""]),
+            yaxis=dict(
+                title='Anteil am Niederschlag<br>und kapillaren Aufstieg in %'),
+            annotations=[
+                dict(text="Bodengesellschafts-ID",
+                     x=0.6, y=-0.2, xref="paper", yref="paper",
+                     align="left", showarrow=False)
+            ],
+            font_size=16,
+            hoverlabel=dict(font=dict(size=14))
+        )
+
+        # save fig to object
+        # -------------------
+        self.fig_bar = fig
+
+    def _make_plot_sankey(self, figsize=(15, 15), cex=1, add_pet=True):
+        """
+        Create the Sankey figure.
+
+        It is recommended to use the plot or plot_web methode to create the plot figure not this function.
+
+        Parameters
+        ----------
+        figsize : tuple of 2 int, optional
+            The size of the figure.
+            The default is (15, 15).
+        cex : float, optional
+            The factor to change the size of the labels.
+            The default is 1.
+        add_pet : bool, optional
+            Should the potential evapotranspiration be added to the plot?
+            The default is True.
+
+        Returns
+        -------
+        matplotlib.figure.Figure.
+
+        """
+        # define variables to be able to copy the plot syntax from Notebook 5.2
+        # -----------------
+        df_sankey = self.naturwb_ref.copy()
+
+        # plot code
+        # ----------
+        df_sankey["za_oa"] = df_sankey["za"] - df_sankey["za_gwnah"]
+
+        with pkg_resources.open_binary(
+            data, "Wasserbilanz_raw.jpg") as f:
+            bg = imread(f)
+
+        scale = 1/df_sankey[["n", "kap.A."]].sum()*140
+        gap = 20
+        color = (0.12156862745098039, 0.4666666666666667,  0.7058823529411765,
+                 0.8)
+        radius = 20
+        x_offset = 320
+        et_width = df_sankey["et"] * scale
+        tot_width = df_sankey[["n", "kap.A."]].sum() * scale
+        oa_width = df_sankey["oa"] * scale
+        tp_width = df_sankey["tp"] * scale
+        zagw_width = df_sankey["za_gwnah"] * scale
+        soil_width = 313
+        x_abf_mid = 780
+        y_abf_ground = -41
+        y_offset = max(tot_width/2 - et_width + 2*radius + oa_width/2,
+                       tot_width/2 - 1/3 * et_width)
+        extent = (-bg.shape[1]/2+x_offset, bg.shape[1]/2+x_offset,
+                  -bg.shape[0]/2+y_offset, bg.shape[0]/2+y_offset)
+
+        fig, ax = _new_figure(figsize=figsize)
+
+        ax.imshow(bg, extent=extent)
+
+        # create Sankey diagramm
+        sk = _SankeyNWB(ax=ax, unit=" mm/a", scale=scale,
+                        shoulder=0, gap=gap, radius=radius, margin=20,
+                        offset=-80, format="%.1F")
+
+        # main Sankey
+        #############
+        len_tp = soil_width - y_offset - tot_width/2 - radius - tp_width/2
+        # remove flows with 0
+        flows_sk1=pd.concat([
+                df_sankey[["n", "kap.A."]],
+                -df_sankey[["et", "oa"]],
+                -df_sankey[["za", "tp"]]]
+            ).to_list()
+        labels_sk1=["Niederschlag", "kapillarer Aufstieg",
+                "Evapotranspiration", "Oberflächenabfluss",
+                "Zwischenabfluss", "Tiefenperkolation"]
+        orientations_sk1=[1,-1,
+                    1, 1,
+                    0, -1]
+        pathlengths_sk1=[100+y_offset, 245-y_offset-radius,
+                    150+y_offset, 20,
+                    50, len_tp]
+        pops_count_sk1 = 0
+        for i, flow in enumerate(flows_sk1):
+            if flow == 0:
+                j = i - pops_count_sk1
+                flows_sk1.pop(j)
+                labels_sk1.pop(j)
+                orientations_sk1.pop(j)
+                pathlengths_sk1.pop(j)
+                pops_count_sk1 += 1
+        sk.add(patchlabel="",
+            flows=flows_sk1,
+            labels=labels_sk1,
+            orientations=orientations_sk1,
+            trunklength=180, alpha=0.8,
+            pathlengths=pathlengths_sk1
+            )
+
+        # ZA-Sankey
+        ###########
+        if df_sankey["za"] != 0:
+            # remove flows with 0
+            flows_sk2=pd.concat([
+                df_sankey[["za"]],
+                -df_sankey[["za_oa", "za_gwnah"]]]).to_list()
+            labels_sk2=["delete",
+                    "Zwischenabfluss\nzum Abfluss",
+                    "Zwischenabfluss\nbei hohem Grundwasser"]
+            orientations_sk2=[0, 0, -1]
+            len_zagw = soil_width - y_offset - tot_width/2 + tp_width - radius * 2 - zagw_width * 3/2
+            pathlengths_sk2=[50,
+                        635-x_offset-gap-zagw_width, #998
+                        len_zagw ]
+            pops_count_sk2 = 0
+            for i, flow in enumerate(flows_sk2):
+                if flow == 0:
+                    j = i - pops_count_sk2
+                    flows_sk2.pop(j)
+                    labels_sk2.pop(j)
+                    orientations_sk2.pop(j)
+                    pathlengths_sk2.pop(j)
+                    pops_count_sk2 += 1
+            sk.add(patchlabel="",
+                flows=flows_sk2,
+                labels=labels_sk2,
+                orientations=orientations_sk2,
+                trunklength=130, alpha=0.8,
+                pathlengths=pathlengths_sk2,
+                prior=0,
+                connect=(labels_sk1.index("Zwischenabfluss"),0)
+                )
+
+        # aditional arrows
+        ##################
+        skouts = sk.finish()
+        self.skouts = skouts
+
+        # add potential evapotranspiration
+        if add_pet:
+            et_label = skouts[0].texts[labels_sk1.index("Evapotranspiration")]
+            et_label.set_text(et_label.get_text()+
+                            f"\n(pot. ET: {self.naturwb_ref['pet'].round():.0f} mm/a)")
+
+        # add Path for OA
+        if oa_width != 0:
+            oa_tip = skouts[0].tips[labels_sk1.index("Oberflächenabfluss")]
+            oapath_raw = [
+                (mplPath.MOVETO, oa_tip),
+                (mplPath.LINETO, oa_tip - [oa_width / 2, oa_width / 2]),
+                (mplPath.LINETO, (oa_tip[0] - oa_width / 2,
+                                y_offset - radius - oa_width))]
+            oapath_raw.extend(
+                sk._arc(quadrant=1, cw=False,
+                        radius=radius + oa_width,
+                        center=(oa_tip[0] + oa_width / 2 + radius,
+                                y_offset - radius)))
+            oapath_raw.extend([
+                (mplPath.LINETO, (670, y_offset + oa_width)),
+                (mplPath.LINETO, (670 + oa_width/2, y_offset + oa_width/2)),
+                (mplPath.LINETO, (670, y_offset)),
+                (mplPath.LINETO, (oa_tip[0] + oa_width/2 + radius, y_offset))])
+            oapath_raw.extend(
+                sk._arc(quadrant=1, cw=True,
+                        radius=radius,
+                        center=(oa_tip[0] + oa_width / 2 + radius,
+                                y_offset - radius)))
+            oapath_raw.extend([
+                (mplPath.LINETO, oa_tip + [oa_width / 2, + oa_width / 2])])
+
+            codes, vertices = zip(*oapath_raw)
+            oapath = mplPath(vertices=vertices, codes=codes, closed=True)
+            ax.add_artist(PathPatch(oapath, color=color))
+
+        # add Path for ZA GWNAH
+        if zagw_width != 0:
+            # hinweg
+            zagw_tip = skouts[1].tips[labels_sk2.index("Zwischenabfluss\nbei hohem Grundwasser")]
+            zagw_path_raw = [(mplPath.MOVETO, zagw_tip),
+                            (mplPath.LINETO, zagw_tip + [zagw_width / 2, zagw_width / 2]),
+                            (mplPath.LINETO, (zagw_tip[0] + zagw_width / 2,
+                                            zagw_tip[1]))
+                            ]
+            zagw_path_raw.extend(sk._arc(quadrant=2, cw=True, radius=radius,
+                                        center=(zagw_tip[0] + zagw_width / 2 + radius,
+                                                zagw_tip[1])))
+            zagw_path_raw.extend(sk._arc(quadrant=3, cw=True, radius=radius,
+                                        center=(x_abf_mid - radius - zagw_width/2,
+                                                zagw_tip[1] )))
+            zagw_path_raw.extend([
+                (mplPath.LINETO, (x_abf_mid - zagw_width/2, y_abf_ground - zagw_width/2)),
+                (mplPath.LINETO, (x_abf_mid, y_abf_ground))])
+
+            # rückweg
+            zagw_path_raw.extend([
+                (mplPath.LINETO, (x_abf_mid + zagw_width/2, y_abf_ground - zagw_width/2)),
+                (mplPath.LINETO, (x_abf_mid + zagw_width/2, zagw_tip[1] + zagw_width/2)),
+            ])
+            zagw_path_raw.extend(sk._arc(quadrant=3, cw=False, radius=radius + zagw_width,
+                                        center=(x_abf_mid - radius - zagw_width/2,
+                                                zagw_tip[1] )))
+            zagw_path_raw.extend(sk._arc(quadrant=2, cw=False,
+                                        radius=radius + zagw_width,
+                                        center=(zagw_tip[0] + zagw_width / 2 + radius,
+                                                zagw_tip[1])))
+            zagw_path_raw.extend([
+                (mplPath.LINETO, zagw_tip + [-zagw_width / 2, zagw_width / 2])])
+
+            codes, vertices = zip(*zagw_path_raw)
+            zagwpath = mplPath(vertices=vertices, codes=codes, closed=True)
+            ax.add_artist(PathPatch(zagwpath, color=color))
+
+            # add Information Textbox
+            ax.text(x=x_abf_mid, y=y_abf_ground - 100,
+                    s="Dieser Anteil wird hier \ndem Abfluss zugeordnet.\nWenn möglich selbst entscheiden.",
+                    ha='center', va='center',
+                    fontsize=skouts[0].texts[0].get_fontsize()*cex,
+                    backgroundcolor="#FFFFFF")
+
+        # change label background and patch color
+        for skout in skouts:
+            skout.patch.set_color(color)
+            for text in skout.texts:
+                text.set_backgroundcolor("#FFFFFF")
+
+        # change labels position
+        if "Zwischenabfluss" in labels_sk1:
+            ind_za = labels_sk1.index("Zwischenabfluss")
+            skouts[0].texts[ind_za].set_x(
+                skouts[0].texts[ind_za].get_position()[0] + 130)
+        if "Oberflächenabfluss" in labels_sk1:
+            ind_oa = labels_sk1.index("Oberflächenabfluss")
+            if "Zwischenabfluss" in labels_sk1:
+                pos_za = skouts[0].texts[labels_sk1.index("Zwischenabfluss")].get_position()
+                pos_oa = (pos_za[0] , y_offset + + oa_width/2)
+            else:
+                pos_oa = (300, y_offset + oa_width/2)
+            skouts[0].texts[ind_oa].set_position(pos_oa)
+        if "Zwischenabfluss\nzum Abfluss" in labels_sk2:
+            ind_zagw = labels_sk2.index("Zwischenabfluss\nzum Abfluss")
+            skouts[1].texts[ind_zagw].set_x(
+                skouts[1].texts[ind_zagw].get_position()[0] - 50)
+
+        skouts[1].texts[0].remove()
+
+        # change labels fontsize
+        for skout in skouts:
+            for text in skout.texts:
+                text.set_fontsize(text.get_fontsize() * cex)
+
+        # layout
+        ax.set_axis_off()
+        fig.set_tight_layout(True)
+
+        # save fig to object
+        # -------------------
+        self.fig_sankey = fig
@@ -0,0 +1,561 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""The SQL statements of the NatUrWB queries as server-side prepared statements.
+
+Every statement gets prepared once per pooled database connection
+and is afterwards only executed with bound parameters.
+Geometries are handed over as WKB and id lists as integer arrays,
+so the statement text never changes and PostgreSQL can cache the plan.
+
+Use it like this:
+
+    with db_engine.connect() as con:
+        df = pd.read_sql(
+            sql=prepare(con, "ref_lanus"), con=con,
+            params=dict(gen_ids=ids(gen_ids), nat_ids=ids(nat_ids)))
+"""
+
+# libraries
+import sqlalchemy
+import pandas as pd
+import weakref
+
+# the statements
+# --------------
+# the landuse areas and coefficients per soil group (gen_id) and NRE (nat_id)
+# of the natural lookup polygons. This only depends on the static lookup data,
+# so it is materialized in the view REF_LANUS_VIEW by the lanu_coefs command.
+REF_LANUS_VIEW = "mv_ref_lanus"
+REF_LANUS_SQL = """
+    SELECT gen_id, nat_id, tlp.lanu_id, SUM (area) AS area,
+        ll.name as lanu_name,
+        SUM (area) / SUM (SUM (area)) OVER (PARTITION BY gen_id, nat_id)
+            AS coef
+    FROM tbl_lookup_polygons tlp
+    JOIN leg_lanuid ll ON ll.lanu_id=tlp.lanu_id
+    WHERE NOT is_urban
+    GROUP BY gen_id, nat_id, tlp.lanu_id, ll.name"""
+
+# the distance bands in km to search for landuses on the same soil,
+# if a soil group has no natural landuse in the same NRE
+NOLANU_DISTS = [30, 60, 90, 120]
+
+# the landuse areas of the soil groups in the distance bands
+# around the cells of a coarse grid (NOLANU_GRID_SIZE in m).
+# Only the soil groups of the simulation polygons in the cell are stored.
+# Every lookup polygon is in the smallest band that reaches it from the cell.
+# The queries only look up the cell with the point on the surface
+# of the urban polygon, so for urban polygons spanning several cells
+# the bands are an approximation of the exact ones (ref_nolanu).
+REF_NOLANU_VIEW = "mv_ref_nolanu"
+NOLANU_GRID_SIZE = 10000
+REF_NOLANU_SQL = """
+    WITH ext AS (
+        SELECT ST_Extent(geom) AS box FROM tbl_nre
+    ), cells AS (
+        SELECT cell_x, cell_y,
+            ST_MakeEnvelope(cell_x * {size}, cell_y * {size},
+                            (cell_x + 1) * {size}, (cell_y + 1) * {size},
+                            25832) AS geom
+        FROM ext,
+            generate_series(floor(ST_XMin(box) / {size})::integer,
+                            floor(ST_XMax(box) / {size})::integer) cell_x,
+            generate_series(floor(ST_YMin(box) / {size})::integer,
+                            floor(ST_YMax(box) / {size})::integer) cell_y
+    ), cell_gens AS (
+        SELECT DISTINCT cells.cell_x, cells.cell_y, tsp.gen_id
+        FROM cells
+        JOIN tbl_simulation_polygons tsp ON ST_Intersects(cells.geom, tsp.geom)
+    )
+    SELECT cg.cell_x, cg.cell_y, tlp.gen_id, tlp.lanu_id,
+        (SELECT MIN(dist) FROM unnest(ARRAY[{dists}]) dist
+         WHERE ST_DWithin(tlp.geom, cells.geom, dist)) AS nolanu_dist,
+        SUM(tlp.area) AS area
+    FROM cell_gens cg
+    JOIN cells ON cells.cell_x = cg.cell_x AND cells.cell_y = cg.cell_y
+    JOIN tbl_lookup_polygons tlp
+        ON tlp.gen_id = cg.gen_id
+        AND ST_DWithin(tlp.geom, cells.geom, {max_dist})
+        AND NOT tlp.is_urban
+    GROUP BY cg.cell_x, cg.cell_y, tlp.gen_id, tlp.lanu_id, nolanu_dist""".format(
+        size=NOLANU_GRID_SIZE,
+        dists=", ".join([str(dist * 1000) for dist in NOLANU_DISTS]),
+        max_dist=max(NOLANU_DISTS) * 1000)
+
+# the materialized views with their unique index and value columns,
+# they get built and refreshed with the lanu_coefs command
+MATERIALIZED_VIEWS = {
+    REF_LANUS_VIEW: dict(
+        sql=REF_LANUS_SQL,
+        index=["gen_id", "nat_id", "lanu_id"],
+        values=["area", "coef"]),
+    REF_NOLANU_VIEW: dict(
+        sql=REF_NOLANU_SQL,
+        index=["cell_x", "cell_y", "gen_id", "lanu_id", "nolanu_dist"],
+        values=["area"])
+}
+
+_BASICS_SQL = """
+            WITH urban_geom AS (
+                    SELECT ST_GeomFromWKB($1, 25832) as geom
+                ), clip_sim AS (
+                    SELECT sim_id, gen_id, sym_nr, tkle_nr,
+                        ST_Intersection(geom, (SELECT geom from urban_geom)) as geom
+                    FROM tbl_simulation_polygons
+                    WHERE ST_Intersects(geom, (SELECT geom from urban_geom))
+                ), inters AS (
+                    SELECT sim_id, gen_id, sym_nr, tkle_nr,
+                        tn.nat_id,
+                        ST_Intersection(cs.geom, tn.geom) as geom
+                    FROM clip_sim cs
+                    JOIN tbl_nre tn
+                    ON ST_Intersects(cs.geom, tn.geom)
+                ), clip AS (
+                    SELECT inters.sim_id, inters.gen_id, inters.nat_id,
+                        ST_UNION(geom) as geometry,
+                        SUM(ST_AREA(geom)) AS area,
+                        lbc.color , ltn.txt as leg_tkle_txt,
+                        ltn.kurz as leg_tkle_kurz
+                    FROM inters
+                    JOIN leg_buek_col lbc ON lbc.sym_nr=inters.sym_nr
+                    JOIN leg_tklenr ltn ON ltn.tkle_nr=inters.tkle_nr
+                    WHERE ST_Dimension(inters.geom)=2
+                    GROUP BY inters.sim_id, inters.gen_id, inters.nat_id,
+                            lbc.color, ltn.txt, ltn.kurz
+                ), ref_lanus AS (
+                    SELECT gen_id, nat_id, lanu_id, area, lanu_name, coef
+                    FROM ({ref_lanus}) rl
+                    WHERE gen_id IN (SELECT DISTINCT gen_id FROM clip)
+                        AND nat_id IN (SELECT DISTINCT nat_id FROM clip)
+                ), results AS (
+                    SELECT tr.sim_id, tsp.gen_id, tr.lanu_id, tr.bf_id,
+                        n, "kap.A.", et, oa, za, bfid_area, inf, tp, wea_et as pet,
+                        za_gwnah_flag
+                    FROM tbl_simulation_polygons tsp
+                    INNER JOIN tbl_results tr on tsp.sim_id = tr.sim_id
+                    INNER JOIN tbl_soils ts on tr.bf_id = ts.bf_id
+                    WHERE tsp.sim_id IN (SELECT DISTINCT sim_id FROM clip)
+                ), sim_infos AS (
+                    SELECT sim_id, stat_id, buek_flag, bfid_undef,
+                        lanu_flag, wea_flag, wea_dist, wea_flag_n, wea_dist_n,
+                        sl_flag, sl_dist, sl_std, sun_flag, sun_dist, rs_std,
+                        wea_t_std, wea_et_std, wea_n_wihj_std, wea_n_sohj_std
+                    FROM tbl_simulation_polygons tsp
+                        JOIN tbl_soils ts ON ts.gen_id=tsp.gen_id
+                    WHERE sim_id IN (SELECT DISTINCT sim_id FROM clip)
+                    GROUP BY sim_id, buek_flag, lanu_flag, wea_flag, wea_dist,
+                            sl_flag, sl_dist, sun_flag, sun_dist, bfid_undef
+                )
+            SELECT
+                (SELECT json_agg(c) FROM (
+                    SELECT sim_id, gen_id, nat_id,
+                        encode(ST_AsBinary(geometry), 'hex') AS geometry,
+                        area, color, leg_tkle_txt, leg_tkle_kurz
+                    FROM clip) c) AS clip,
+                (SELECT json_agg(rl) FROM ref_lanus rl) AS ref_lanus,
+                (SELECT json_agg(r) FROM results r) AS results,
+                (SELECT json_agg(si) FROM sim_infos si) AS sim_infos"""
+
+_REF_LANUS_IDS_SQL = """
+            SELECT gen_id, nat_id, lanu_id, area, lanu_name, coef
+            FROM ({ref_lanus}) rl
+            WHERE gen_id = ANY($1) AND nat_id = ANY($2)"""
+
+# the vector tile (mapbox vector tile, MVT) of the soil groups and NRE
+# with the layers "soils" and "nre", in web mercator (EPSG:3857).
+# The NRE get the colors of the matplotlib Set1 colormap.
+TILE_EXTENT = 4096
+NRE_COLORS = ["#e41a1c", "#377eb8", "#4daf4a", "#984ea3", "#ff7f00",
+              "#ffff33", "#a65628", "#f781bf", "#999999"]
+TILE_SQL = """
+    WITH bounds AS (
+        SELECT ST_TileEnvelope($1, $2, $3) AS geom_3857,
+            ST_Transform(ST_TileEnvelope($1, $2, $3), 25832) AS geom
+    ), soils AS (
+        SELECT tsp.gen_id, lbc.color, ltn.kurz AS leg_tkle_kurz,
+            ST_AsMVTGeom(
+                ST_Transform(tsp.geom, 3857), bounds.geom_3857,
+                {extent}, 64, true) AS geom
+        FROM tbl_simulation_polygons tsp
+        JOIN bounds ON tsp.geom && bounds.geom
+        JOIN leg_buek_col lbc ON lbc.sym_nr=tsp.sym_nr
+        JOIN leg_tklenr ltn ON ltn.tkle_nr=tsp.tkle_nr
+    ), nre AS (
+        SELECT tn.nat_id, tn.name,
+            (ARRAY['{nre_colors}'])[mod(tn.nat_id, {n_colors}) + 1] AS color,
+            ST_AsMVTGeom(
+                ST_Transform(tn.geom, 3857), bounds.geom_3857,
+                {extent}, 64, true) AS geom
+        FROM tbl_nre tn
+        JOIN bounds ON tn.geom && bounds.geom
+    )
+    SELECT COALESCE(
+            (SELECT ST_AsMVT(soils, 'soils', {extent}, 'geom') FROM soils
+             WHERE geom IS NOT NULL), ''::bytea) ||
+        COALESCE(
+            (SELECT ST_AsMVT(nre, 'nre', {extent}, 'geom') FROM nre
+             WHERE geom IS NOT NULL), ''::bytea)""".format(
+    extent=TILE_EXTENT, nre_colors="', '".join(NRE_COLORS),
+    n_colors=len(NRE_COLORS))
+
+# every statement has a list of its parameters as (name, type),
+# in the order of their $n placeholders in the sql.
+# The statements with the ending "_live" compute the landuse coefficients
+# on the fly instead of reading them from the materialized view.
+STATEMENTS = {
+    "basics": dict(
+        params=[("urban_wkb", "bytea")],
+        sql=_BASICS_SQL.format(
+            ref_lanus="SELECT * FROM " + REF_LANUS_VIEW)),
+    "basics_live": dict(
+        params=[("urban_wkb", "bytea")],
+        sql=_BASICS_SQL.format(ref_lanus=REF_LANUS_SQL)),
+    "clip": dict(
+        params=[("urban_wkb", "bytea")],
+        sql="""
+            WITH urban_geom AS (
+                    SELECT ST_GeomFromWKB($1, 25832) as geom
+                ), clip_sim AS (
+                    SELECT sim_id, gen_id, sym_nr, tkle_nr,
+                        ST_Intersection(geom, (SELECT geom from urban_geom)) as geom
+                    FROM tbl_simulation_polygons
+                    WHERE ST_Intersects(geom, (SELECT geom from urban_geom))
+                ), inters AS (
+                    SELECT sim_id, gen_id, sym_nr, tkle_nr,
+                        tn.nat_id,
+                        ST_Intersection(cs.geom, tn.geom) as geom
+                    FROM clip_sim cs
+                    JOIN tbl_nre tn
+                    ON ST_Intersects(cs.geom, tn.geom)
+            )
+            SELECT inters.sim_id, inters.gen_id, inters.nat_id,
+                    ST_UNION(geom) as geometry,
+                    SUM(ST_AREA(geom)) AS area,
+                    lbc.color , ltn.txt as leg_tkle_txt,
+                    ltn.kurz as leg_tkle_kurz
+                FROM inters
+                JOIN leg_buek_col lbc ON lbc.sym_nr=inters.sym_nr
+                JOIN leg_tklenr ltn ON ltn.tkle_nr=inters.tkle_nr
+                WHERE ST_Dimension(inters.geom)=2
+                GROUP BY inters.sim_id, inters.gen_id, inters.nat_id,
+                        lbc.color, ltn.txt, ltn.kurz"""),
+    "ref_lanus": dict(
+        params=[("gen_ids", "integer[]"), ("nat_ids", "integer[]")],
+        sql=_REF_LANUS_IDS_SQL.format(
+            ref_lanus="SELECT * FROM " + REF_LANUS_VIEW)),
+    "ref_lanus_live": dict(
+        params=[("gen_ids", "integer[]"), ("nat_ids", "integer[]")],
+        sql=_REF_LANUS_IDS_SQL.format(ref_lanus=REF_LANUS_SQL)),
+    "results": dict(
+        params=[("sim_ids", "integer[]")],
+        sql="""
+            SELECT tr.sim_id, tsp.gen_id, tr.lanu_id, tr.bf_id,
+                    n, "kap.A.", et, oa, za, bfid_area, inf, tp, wea_et as pet,
+                    za_gwnah_flag
+            FROM tbl_simulation_polygons tsp
+            INNER JOIN tbl_results tr on tsp.sim_id = tr.sim_id
+            INNER JOIN tbl_soils ts on tr.bf_id = ts.bf_id
+            WHERE tsp.sim_id = ANY($1)"""),
+    "sim_infos": dict(
+        params=[("sim_ids", "integer[]")],
+        sql="""
+            SELECT sim_id, stat_id, buek_flag, bfid_undef,
+                   lanu_flag, wea_flag, wea_dist, wea_flag_n, wea_dist_n,
+                   sl_flag, sl_dist, sl_std, sun_flag, sun_dist, rs_std,
+                   wea_t_std, wea_et_std, wea_n_wihj_std, wea_n_sohj_std
+            FROM tbl_simulation_polygons tsp
+                JOIN tbl_soils ts ON ts.gen_id=tsp.gen_id
+            WHERE sim_id = ANY($1)
+            GROUP BY sim_id, buek_flag, lanu_flag, wea_flag, wea_dist,
+                     sl_flag, sl_dist, sun_flag, sun_dist, bfid_undef"""),
+    "ref_nolanu": dict(
+        params=[("urban_wkb", "bytea"), ("dists", "double precision[]"),
+                ("gen_ids", "integer[]")],
+        sql="""
+            WITH urban AS (
+                SELECT ST_GeomFromWKB($1, 25832) AS geom),
+            polys AS (
+                SELECT tlp.gen_id, tlp.lanu_id, tlp.area,
+                    (SELECT MIN(dist) FROM unnest($2) dist
+                     WHERE ST_DWithin(tlp.geom, urban.geom, dist)) AS band
+                FROM tbl_lookup_polygons tlp, urban
+                WHERE ST_DWithin(tlp.geom, urban.geom,
+                                 (SELECT MAX(dist) FROM unnest($2) dist))
+                    AND tlp.gen_id = ANY($3)
+                    AND not tlp.is_urban),
+            bands AS (
+                SELECT gen_id, MIN(band) AS band
+                FROM polys
+                GROUP BY gen_id)
+            SELECT polys.gen_id, polys.lanu_id,
+                bands.band AS nolanu_dist, SUM(polys.area) AS area
+            FROM polys
+            JOIN bands ON bands.gen_id = polys.gen_id
+                AND polys.band <= bands.band
+            GROUP BY polys.gen_id, polys.lanu_id, bands.band"""),
+    "ref_nolanu_grid": dict(
+        params=[("urban_wkb", "bytea"), ("gen_ids", "integer[]")],
+        sql="""
+            WITH cell AS (
+                SELECT floor(ST_X(pt) / {size})::integer AS cell_x,
+                    floor(ST_Y(pt) / {size})::integer AS cell_y
+                FROM ST_PointOnSurface(ST_GeomFromWKB($1, 25832)) pt),
+            polys AS (
+                SELECT grid.gen_id, grid.lanu_id, grid.nolanu_dist, grid.area
+                FROM {view} grid
+                JOIN cell ON grid.cell_x = cell.cell_x
+                    AND grid.cell_y = cell.cell_y
+                WHERE grid.gen_id = ANY($2)),
+            bands AS (
+                SELECT gen_id, MIN(nolanu_dist) AS band
+                FROM polys
+                GROUP BY gen_id)
+            SELECT polys.gen_id, polys.lanu_id,
+                bands.band AS nolanu_dist, SUM(polys.area) AS area
+            FROM polys
+            JOIN bands ON bands.gen_id = polys.gen_id
+                AND polys.nolanu_dist <= bands.band
+            GROUP BY polys.gen_id, polys.lanu_id, bands.band""".format(
+                size=NOLANU_GRID_SIZE, view=REF_NOLANU_VIEW)),
+    "ref_polys": dict(
+        params=[("gen_ids", "integer[]"), ("nat_ids", "integer[]")],
+        sql="""
+            SELECT gen_id, nat_id, tlp.lanu_id, area,
+                ll.name as lanu_name, geom as geometry
+            FROM tbl_lookup_polygons tlp
+            JOIN leg_lanuid ll ON ll.lanu_id=tlp.lanu_id
+            WHERE gen_id = ANY($1) AND nat_id = ANY($2)
+                AND not is_urban"""),
+    "nre": dict(
+        params=[("nat_ids", "integer[]")],
+        sql="""
+            SELECT nat_id, name,
+                   ST_Transform(geom, 4326) geometry
+            FROM tbl_nre
+            WHERE tbl_nre.nat_id = ANY($1)"""),
+    "nre_clip": dict(
+        params=[("nat_ids", "integer[]")],
+        sql="""
+            SELECT tbl_nre.nat_id, name, geom
+            FROM tbl_nre
+            WHERE tbl_nre.nat_id = ANY($1)"""),
+    "leg": dict(
+        params=[("lanu_ids", "integer[]")],
+        sql="""
+            SELECT lanu_id, name FROM leg_lanuid
+            WHERE lanu_id = ANY($1)"""),
+    "ternary_leg": dict(
+        params=[("sim_ids", "integer[]")],
+        sql="""
+            SELECT tsp.sim_id, txt as leg_txt, kurz as leg_kurz, color
+            FROM tbl_simulation_polygons tsp
+            JOIN leg_tklenr lt ON lt.tkle_nr=tsp.tkle_nr
+            JOIN leg_buek_col lbc ON lbc.sym_nr=tsp.sym_nr
+            WHERE tsp.sim_id = ANY($1)"""),
+    "input_paras": dict(
+        params=[("sim_ids", "integer[]"), ("lanu_ids", "integer[]")],
+        sql="""
+            SELECT * FROM view_simulation_paras
+            WHERE sim_id = ANY($1) AND lanu_id = ANY($2)"""),
+    "sim_polygons": dict(
+        params=[("sim_ids", "integer[]")],
+        sql="""
+            SELECT sim_id, geom FROM tbl_simulation_polygons
+            WHERE sim_id = ANY($1)"""),
+    "sim_paras": dict(
+        params=[("sim_ids", "integer[]")],
+        sql="""
+            SELECT * FROM view_simulation_paras
+            WHERE sim_id = ANY($1)"""),
+    "view_exists": dict(
+        params=[("view", "name")],
+        sql="""
+            SELECT count(*) > 0 FROM pg_matviews WHERE matviewname = $1"""),
+    "sim_checksums": dict(
+        params=[("size", "integer")],
+        sql="""
+            SELECT p.sim_id / $1 AS part,
+                   md5(string_agg(
+                       concat_ws(':', p.sim_id, md5(ST_AsEWKB(p.geom)),
+                                 md5(v::text)),
+                       ',' ORDER BY p.sim_id, v::text)) AS checksum
+            FROM tbl_simulation_polygons p
+            LEFT JOIN view_simulation_paras v ON v.sim_id = p.sim_id
+            GROUP BY 1
+            ORDER BY 1"""),
+    "sim_id_range": dict(
+        params=[],
+        sql="""
+            SELECT min(sim_id), max(sim_id) FROM tbl_simulation_polygons"""),
+    "sim_polygons_range": dict(
+        params=[("start_id", "integer"), ("end_id", "integer")],
+        sql="""
+            SELECT sim_id, geom FROM tbl_simulation_polygons
+            WHERE sim_id >= $1 AND sim_id < $2
+            ORDER BY sim_id"""),
+    "sim_paras_range": dict(
+        params=[("start_id", "integer"), ("end_id", "integer")],
+        sql="""
+            SELECT * FROM view_simulation_paras
+            WHERE sim_id >= $1 AND sim_id < $2
+            ORDER BY sim_id"""),
+    "results_to_db": dict(
+        params=[("urban_wkb", "bytea"), ("n", "double precision"),
+                ("et", "double precision"), ("runoff", "double precision"),
+                ("tp", "double precision"), ("kap", "double precision")] +
+               [("lanu_{}".format(lanu_id), "double precision")
+                for lanu_id in [0] + list(range(2, 14))],
+        sql="""
+            INSERT INTO naturwb_results_saved
+                (urban_shp, centroid, n, et, runoff, gwnb, "kap.A.",
+                 lanu_0, lanu_2, lanu_3, lanu_4, lanu_5, lanu_6, lanu_7,
+                 lanu_8, lanu_9, lanu_10, lanu_11, lanu_12, lanu_13)
+            VALUES (ST_GeomFromWKB($1, 4326), ST_Centroid(ST_GeomFromWKB($1, 4326)),
+                    $2, $3, $4, $5, $6,
+                    $7, $8, $9, $10, $11, $12, $13,
+                    $14, $15, $16, $17, $18, $19)"""),
+    "delete_saved_results": dict(
+        params=[],
+        sql="""
+            DELETE FROM naturwb_results_saved
+            WHERE timestamp < (now() - INTERVAL '2 HOUR')"""),
+    "tile": dict(
+        params=[("z", "integer"), ("x", "integer"), ("y", "integer")],
+        sql=TILE_SQL),
+}
+
+
+# functions
+# ---------
+# the names of the prepared statements of every DBAPI connection,
+# they are forgotten with the connection
+_prepared = weakref.WeakKeyDictionary()
+
+
+def _dbapi_connection(con):
+    """Get the DBAPI connection of the database session.
+
+    aldjemy's pool wraps the connection of django anew on every checkout,
+    with an empty info dictionary, but it is the same database session.
+    The cursor refers to the DBAPI connection itself.
+    """
+    cursor = con.connection.cursor()
+    try:
+        return cursor.connection
+    finally:
+        cursor.close()
+
+
+def prepare(con, name):
+    """Prepare a statement on the connection and get the clause to execute it.
+
+    The statement is only prepared once for every database session.
+    The names of the prepared statements are saved for the DBAPI connection,
+    so a new connection prepares them again.
+
+    Parameters
+    ----------
+    con : sqlalchemy.engine.Connection
+        The open connection to the NatUrWB database.
+    name : str
+        The name of the statement in STATEMENTS.
+
+    Returns
+    -------
+    sqlalchemy.sql.expression.TextClause
+        The EXECUTE clause with the bound parameters of the statement.
+        Hand over the parameters as dictionary
+        e.g. with the params argument of pandas.read_sql.
+    """
+    stmt = STATEMENTS[name]
+    prep_name = "naturwb_" + name
+    prepared = _prepared.setdefault(_dbapi_connection(con), set())
+    if name not in prepared:
+        if len(stmt["params"]) > 0:
+            types = " ({})".format(
+                ", ".join([typ for _, typ in stmt["params"]]))
+        else:
+            types = ""
+        con.execute("PREPARE {name}{types} AS {sql};".format(
+            name=prep_name, types=types, sql=stmt["sql"]))
+        prepared.add(name)
+
+    if len(stmt["params"]) > 0:
+        return sqlalchemy.text("EXECUTE {name} ({params});".format(
+            name=prep_name,
+            params=", ".join([":" + para for para, _ in stmt["params"]])))
+    else:
+        return sqlalchemy.text("EXECUTE {name};".format(name=prep_name))
+
+
+def unprepared(name):
+    """Get the statement as plain SQL clause with bound parameters.
+
+    A server-side cursor (stream_results) can't execute a prepared statement,
+    as PostgreSQL only declares cursors for SELECT or VALUES queries.
+
+    Parameters
+    ----------
+    name : str
+        The name of the statement in STATEMENTS.
+
+    Returns
+    -------
+    sqlalchemy.sql.expression.TextClause
+        The SQL of the statement with the parameters bound by their name.
+    """
+    stmt = STATEMENTS[name]
+    sql = stmt["sql"]
+    # replace $10 before $1
+    for i, (para, typ) in reversed(list(enumerate(stmt["params"], start=1))):
+        sql = sql.replace("${}".format(i), "CAST(:{para} AS {typ})".format(
+            para=para, typ=typ))
+    return sqlalchemy.text(sql)
+
+
+# the materialized views, that were found in the database
+_existing_views = set()
+
+
+def view_exists(con, view):
+    """Check if the materialized view is built in the database.
+
+    Only the existing views are remembered for this process,
+    so a view that gets built later is used without a restart,
+    e.g. on a fresh database before "python manage.py lanu_coefs build".
+
+    Parameters
+    ----------
+    con : sqlalchemy.engine.Connection
+        The open connection to the NatUrWB database.
+    view : str
+        The name of the view, e.g. REF_LANUS_VIEW.
+
+    Returns
+    -------
+    bool
+        True if the view exists.
+    """
+    if view not in _existing_views:
+        exists = con.execute(
+            prepare(con, "view_exists"), dict(view=view)).scalar()
+        if not exists:
+            return False
+        _existing_views.add(view)
+    return True
+
+
+def ids(values):
+    """Convert the values of an index to a list of unique python integers.
+
+    Parameters
+    ----------
+    values : array-like
+        The ids e.g. index.get_level_values("sim_id").
+
+    Returns
+    -------
+    list of int
+        The unique ids, ready to get bound as integer array.
+    """
+    return [int(value) for value in pd.unique(pd.Series(values))]
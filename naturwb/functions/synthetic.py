@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""A synthetic NatUrWB query for the tests and the benchmarks.
+
+The tables of the query are random, but have the structure
+of the database tables, so no database is needed.
+"""
+
+# libraries
+import numpy as np
+import pandas as pd
+try:
+    from .naturwb import Query as NWBQuery
+except ImportError:
+    from naturwb import Query as NWBQuery
+
+
+def make_synthetic_query(n_sim=200, n_gen=20, n_nat=5, n_flagged=0, seed=0):
+    """Create a Query object with synthetic tables instead of the database.
+
+    Every soil group (gen_id) has 1-3 soil profiles (bf_id) and 2-5 landuses.
+    Every simulation polygon is in 1-3 NRE.
+    The n_flagged simulation polygons get a rock profile (lanu_flag=2),
+    that only has the landuse 0.
+    """
+    rng = np.random.default_rng(seed)
+    gen_lanus = {
+        gen: np.sort(rng.choice(np.arange(2, 14), rng.integers(2, 6),
+                                replace=False))
+        for gen in range(n_gen)}
+    gen_bfs = {gen: np.arange(gen * 10, gen * 10 + rng.integers(1, 4))
+               for gen in range(n_gen)}
+    sim_gens = rng.integers(0, n_gen, n_sim)
+    flagged = set(rng.choice(n_sim, n_flagged, replace=False))
+
+    clip, results, sim_infos = [], [], []
+    for sim, gen in enumerate(sim_gens):
+        for nat in rng.choice(n_nat, rng.integers(1, 4), replace=False):
+            clip.append((sim, gen, nat, rng.uniform(1, 1000)))
+        n = rng.uniform(500, 1000)
+        bfs = gen_bfs[gen]
+        is_flagged = sim in flagged and len(bfs) > 1
+        for lanu in gen_lanus[gen]:
+            shares = rng.dirichlet(np.ones(len(bfs))) * 100
+            for bf, share in zip(bfs, shares):
+                if is_flagged and bf == bfs[0]:
+                    continue
+                results.append((
+                    sim, gen, bf, lanu, n, rng.uniform(0, 5),
+                    rng.uniform(0, n), rng.uniform(0, 50), rng.uniform(0, 50),
+                    share, 0., rng.uniform(0, 200), 600., rng.integers(0, 2)))
+        if is_flagged:
+            results.append((sim, gen, bfs[0], 0, n, 0., 0., n, 0.,
+                            30., 0., 0., 600., 0))
+        sim_infos.append((sim, 2 if is_flagged else 0))
+
+    query = NWBQuery.__new__(NWBQuery)
+    query.db_engine = None
+    query.sim_shps_clip = pd.DataFrame(
+        clip, columns=["sim_id", "gen_id", "nat_id", "area"]
+        ).groupby(["sim_id", "gen_id", "nat_id"]).sum()
+    query.results = pd.DataFrame(
+        results,
+        columns=["sim_id", "gen_id", "bf_id", "lanu_id", "n", "kap.A.",
+                 "et", "oa", "za", "bfid_area", "inf", "tp", "pet",
+                 "za_gwnah_flag"]
+        ).set_index(["sim_id", "gen_id", "bf_id", "lanu_id"])
+    query.sim_infos = pd.DataFrame(
+        sim_infos, columns=["sim_id", "lanu_flag"]).set_index("sim_id")
+
+    # every soil group in every NRE has at least one natural landuse
+    ref_lanus = []
+    for gen, nat in query.sim_shps_clip.index.droplevel("sim_id").unique():
+        for i, lanu in enumerate(gen_lanus[gen]):
+            if i == 0 or rng.random() < 0.8:
+                ref_lanus.append((gen, nat, lanu, rng.uniform(1, 100), ""))
+    query.ref_lanus = pd.DataFrame(
+        ref_lanus, columns=["gen_id", "nat_id", "lanu_id", "area", "lanu_name"]
+        ).set_index(["gen_id", "nat_id", "lanu_id"])
+    query.ref_lanus["coef"] = (
+        query.ref_lanus["area"] /
+        query.ref_lanus["area"].groupby(["gen_id", "nat_id"]).transform("sum"))
+
+    return query
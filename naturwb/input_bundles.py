@@ -0,0 +1,332 @@
+"""The prebuilt input files of the simulations for the result download.
+
+The input folder of the download holds the simulation polygons
+and their parameters. Instead of querying and encoding them for every
+download, they are saved once by the input_bundles command as parquet files,
+partitioned by ranges of NATURWB_INPUT_BUNDLE_SIZE sim_ids:
+
+    <NATURWB_INPUT_BUNDLE_DIR>/
+        manifest.json
+        polygons/part=<n>.parquet  # GeoParquet with sim_id and geom
+        paras/part=<n>.parquet     # sim_id and the encoded CSV row
+
+The download only reads the partitions of its sim_ids
+and concatenates the already encoded CSV rows.
+Build the bundles again after every update of the simulation polygons
+or parameters, the manifest holds a checksum of every partition
+to validate the bundles against the database.
+"""
+from django.conf import settings
+from aldjemy.core import get_engine
+import geopandas as gpd
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from pathlib import Path
+import datetime
+import json
+import shutil
+
+from .functions.naturwb_sql import prepare
+
+INPUT_BUNDLE_DIR = Path(getattr(
+    settings, "NATURWB_INPUT_BUNDLE_DIR",
+    Path(__file__).parent.joinpath("data/input_bundles")))
+INPUT_BUNDLE_SIZE = getattr(settings, "NATURWB_INPUT_BUNDLE_SIZE", 2000)
+INPUT_BUNDLE_VERSION = 3
+
+# the separator to split the encoded CSV into its rows,
+# it never appears in the parameters
+_ROW_SEP = "\x1e"
+
+
+def _part_path(bundle_dir, kind, part):
+    return Path(bundle_dir).joinpath(kind, "part={part}.parquet".format(
+        part=part))
+
+
+def _parts(sim_ids, size):
+    """Group the sim_ids by their partition."""
+    parts = {}
+    for sim_id in sim_ids:
+        parts.setdefault(sim_id // size, []).append(sim_id)
+    return parts
+
+
+def encode_csv_rows(df):
+    """Encode every row of the DataFrame as CSV line.
+
+    Returns
+    -------
+    tuple of bytes and list of bytes
+        The header and the lines, like in DataFrame.to_csv(index=False).
+    """
+    rows = df.to_csv(
+        header=False, index=False, lineterminator=_ROW_SEP
+        ).split(_ROW_SEP)[:-1]
+    header = df.head(0).to_csv(index=False)
+    return header.encode("utf8"), [(row + "\n").encode("utf8") for row in rows]
+
+
+def _new_manifest(bundle_dir, size):
+    """Create the folders of new bundles and get their empty manifest."""
+    for kind in ["polygons", "paras"]:
+        Path(bundle_dir).joinpath(kind).mkdir(parents=True)
+    return dict(
+        version=INPUT_BUNDLE_VERSION, size=size, parts=[], paras_parts=[],
+        n_sims=0, paras_header="", checksums={},
+        built=datetime.datetime.now(datetime.timezone.utc).isoformat())
+
+
+def _write_part(bundle_dir, part, manifest, polygons, paras):
+    """Save the simulation polygons and parameters of one partition."""
+    if len(polygons) > 0:
+        polygons.to_parquet(
+            _part_path(bundle_dir, "polygons", part),
+            compression="zstd", index=False)
+        manifest["parts"].append(part)
+        manifest["n_sims"] += len(polygons)
+
+    if len(paras) > 0:
+        header, rows = encode_csv_rows(paras)
+        manifest["paras_header"] = header.decode("utf8")
+        pq.write_table(
+            pa.table({"sim_id": paras["sim_id"].to_numpy(),
+                      "csv": pa.array(rows, pa.binary())}),
+            _part_path(bundle_dir, "paras", part),
+            compression="zstd")
+        manifest["paras_parts"].append(part)
+
+
+def _write_manifest(bundle_dir, manifest):
+    """Save the manifest, the bundles are complete afterwards."""
+    manifest_fp = Path(bundle_dir).joinpath("manifest.json")
+    tmp_fp = manifest_fp.with_name(manifest_fp.name + ".tmp")
+    with open(tmp_fp, "w") as f:
+        json.dump(manifest, f)
+    tmp_fp.replace(manifest_fp)
+
+
+def read_manifest(bundle_dir=None):
+    """Get the manifest of the input bundles.
+
+    Returns
+    -------
+    dict or None
+        The manifest or None if the bundles are not built,
+        are built by another version or are just getting swapped.
+    """
+    manifest_fp = Path(bundle_dir or INPUT_BUNDLE_DIR).joinpath("manifest.json")
+    try:
+        with open(manifest_fp) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if (not isinstance(manifest, dict) or
+            manifest.get("version") != INPUT_BUNDLE_VERSION or
+            not isinstance(manifest.get("size"), int)):
+        return None
+    return manifest
+
+
+def sim_checksums(con, size):
+    """Get the checksum of every partition from the database.
+
+    The checksum covers the sim_ids, the polygons and the parameters,
+    so it changes with every update of a partition.
+
+    Parameters
+    ----------
+    con : sqlalchemy.engine.Connection
+        The connection to the NatUrWB database.
+    size : int
+        The number of sim_ids per partition.
+
+    Returns
+    -------
+    dict of str
+        The checksums with the partitions as keys,
+        as strings like in the manifest.
+    """
+    return {str(part): checksum for part, checksum in con.execute(
+        prepare(con, "sim_checksums"), size=size)}
+
+
+def has_input_bundles(bundle_dir=None):
+    """Check if the input bundles are built."""
+    return read_manifest(bundle_dir) is not None
+
+
+def build_input_bundles(db_engine=None, bundle_dir=None, size=None,
+                        progress=None):
+    """Save the simulation polygons and parameters as input bundles.
+
+    The bundles are written into a new folder,
+    that replaces the old one at the end,
+    so the running downloads never read half built bundles.
+
+    Parameters
+    ----------
+    db_engine : sqlalchemy.engine, optional.
+        The database engine to the NatUrWB database.
+        The default is None, which uses the engine of the django database.
+    bundle_dir : str or Path, optional
+        The folder of the bundles.
+        The default is None, which uses NATURWB_INPUT_BUNDLE_DIR.
+    size : int, optional
+        The number of sim_ids per partition.
+        The default is None, which uses NATURWB_INPUT_BUNDLE_SIZE.
+    progress : callable, optional
+        Gets called with the number of done and all partitions.
+        The default is None.
+
+    Returns
+    -------
+    dict
+        The manifest of the bundles.
+    """
+    if db_engine is None:
+        db_engine = get_engine()
+    bundle_dir = Path(bundle_dir or INPUT_BUNDLE_DIR)
+    size = size or INPUT_BUNDLE_SIZE
+
+    new_dir = bundle_dir.with_name(bundle_dir.name + ".new")
+    if new_dir.exists():
+        shutil.rmtree(new_dir)
+    manifest = _new_manifest(new_dir, size)
+    with db_engine.connect() as con:
+        # before the partitions, so updates while building make them outdated
+        manifest["checksums"] = sim_checksums(con, size)
+        min_id, max_id = con.execute(prepare(con, "sim_id_range")).first()
+        parts = range(min_id // size, max_id // size + 1)
+        for i, part in enumerate(parts):
+            range_params = dict(start_id=part * size, end_id=(part + 1) * size)
+            _write_part(
+                new_dir, part, manifest,
+                polygons=gpd.read_postgis(
+                    prepare(con, "sim_polygons_range"),
+                    con=con,
+                    params=range_params,
+                    crs=25832,
+                    geom_col="geom"),
+                paras=pd.read_sql(
+                    prepare(con, "sim_paras_range"),
+                    con=con,
+                    params=range_params))
+            if progress is not None:
+                progress(i + 1, len(parts))
+
+    _write_manifest(new_dir, manifest)
+
+    # swap the folders
+    old_dir = bundle_dir.with_name(bundle_dir.name + ".old")
+    if bundle_dir.exists():
+        bundle_dir.rename(old_dir)
+    new_dir.rename(bundle_dir)
+    if old_dir.exists():
+        shutil.rmtree(old_dir)
+
+    return manifest
+
+
+def read_sim_polygons(sim_ids, bundle_dir=None):
+    """Get the simulation polygons from the input bundles.
+
+    Parameters
+    ----------
+    sim_ids : list of int
+        The ids of the simulations, e.g. from naturwb_sql.ids.
+    bundle_dir : str or Path, optional
+        The folder of the bundles.
+        The default is None, which uses NATURWB_INPUT_BUNDLE_DIR.
+
+    Returns
+    -------
+    geopandas.GeoDataFrame or None
+        The sim_id and geom of the simulation polygons in EPSG:25832,
+        like the sim_polygons statement.
+        None if the bundles are not available, see read_manifest.
+
+    Raises
+    ------
+    FileNotFoundError
+        If a partition of the manifest is missing,
+        e.g. because the bundles got swapped while reading.
+    """
+    bundle_dir = bundle_dir or INPUT_BUNDLE_DIR
+    manifest = read_manifest(bundle_dir)
+    if manifest is None:
+        return None
+    gdfs = [
+        gpd.read_parquet(
+            _part_path(bundle_dir, "polygons", part),
+            filters=[("sim_id", "in", part_ids)])
+        for part, part_ids in _listed_parts(sim_ids, manifest, "parts")]
+    if len(gdfs) == 0:
+        return gpd.GeoDataFrame(
+            columns=["sim_id", "geom"], geometry="geom", crs=25832)
+    return pd.concat(gdfs, ignore_index=True)
+
+
+def sim_paras_csv_chunks(sim_ids, bundle_dir=None):
+    """Get the CSV file of the simulation parameters from the input bundles.
+
+    The partitions are opened at once,
+    so the chunks are complete even if the bundles get swapped meanwhile.
+
+    Parameters
+    ----------
+    sim_ids : list of int
+        The ids of the simulations, e.g. from naturwb_sql.ids.
+    bundle_dir : str or Path, optional
+        The folder of the bundles.
+        The default is None, which uses NATURWB_INPUT_BUNDLE_DIR.
+
+    Returns
+    -------
+    generator of bytes or None
+        The header and then the encoded rows of every partition.
+        None if the bundles are not available, see read_manifest.
+
+    Raises
+    ------
+    FileNotFoundError
+        If a partition of the manifest is missing.
+    """
+    bundle_dir = bundle_dir or INPUT_BUNDLE_DIR
+    manifest = read_manifest(bundle_dir)
+    if manifest is None:
+        return None
+    part_files = []
+    try:
+        for part, part_ids in _listed_parts(sim_ids, manifest, "paras_parts"):
+            part_files.append((
+                pq.ParquetFile(_part_path(bundle_dir, "paras", part)),
+                part_ids))
+    except OSError:
+        for part_file, _ in part_files:
+            part_file.close()
+        raise
+    return _paras_chunks(manifest["paras_header"], part_files)
+
+
+def _listed_parts(sim_ids, manifest, key):
+    """Get the partitions of the sim_ids, that are in the manifest."""
+    listed = set(manifest[key])
+    parts = _parts(sim_ids, manifest["size"])
+    return [(part, part_ids) for part, part_ids in sorted(parts.items())
+            if part in listed]
+
+
+def _paras_chunks(header, part_files):
+    try:
+        yield header.encode("utf8")
+        for part_file, part_ids in part_files:
+            table = part_file.read(columns=["sim_id", "csv"])
+            sim_id = table.column("sim_id")
+            mask = pc.is_in(sim_id, value_set=pa.array(part_ids, sim_id.type))
+            yield b"".join(table.filter(mask).column("csv").to_pylist())
+    finally:
+        for part_file, _ in part_files:
+            part_file.close()
@@ -0,0 +1,81 @@
+"""The asynchronous computation of the result page in the django-q cluster.
+
+A big urban polygon takes tens of seconds for the query and the plots.
+With the async_result setting, result_view only submits a job to the
+task queue and the result page polls the status of the job.
+The status and the context of the finished result page are saved
+in the result cache, so the web and the cluster processes share them.
+"""
+from django.core.cache import caches
+from django.contrib.gis.geos import GEOSGeometry
+from django_q.tasks import async_task
+from shapely.wkt import loads as wkt_loads
+import traceback
+import uuid
+
+from .result_cache import RESULT_CACHE
+
+# the stages of a job with their names for the status display
+JOB_STAGES = {
+    "queued": "In der Warteschlange",
+    "sql": "Abfrage der Datenbank",
+    "aggregation": "Aggregation der Ergebnisse",
+    "plots": "Erstellung der Grafiken",
+    "done": "Fertig",
+    "failed": "Fehlgeschlagen"}
+JOB_TTL = 60*60  # in seconds
+
+
+def _job_key(job_id):
+    return "naturwb_job:" + str(job_id)
+
+
+def set_job(job_id, stage, context=None):
+    """Save the stage and the context of the result page of a job."""
+    caches[RESULT_CACHE].set(
+        _job_key(job_id), dict(stage=stage, context=context), timeout=JOB_TTL)
+
+
+def get_job(job_id):
+    """Get the stage and the context of a job or None if unknown."""
+    return caches[RESULT_CACHE].get(_job_key(job_id))
+
+
+def submit_result_job(urban_geom):
+    """Submit the computation of a result page to the task queue.
+
+    Parameters
+    ----------
+    urban_geom : str
+        The urban polygon as sent by the form, in EPSG:4326.
+
+    Returns
+    -------
+    str
+        The id of the job.
+    """
+    job_id = uuid.uuid4().hex
+    set_job(job_id, "queued")
+    async_task("naturwb.jobs.run_result_job", job_id, urban_geom,
+               task_name="result_" + job_id)
+    return job_id
+
+
+def run_result_job(job_id, urban_geom):
+    """Compute the context of a result page, this runs in the cluster."""
+    # imported here, as the views import this module
+    from .views import make_query, get_result_context, save_result
+
+    try:
+        nwbquery = make_query(
+            wkt_loads(GEOSGeometry(urban_geom, 4326).wkt),
+            progress=lambda stage: set_job(job_id, stage))
+        set_job(job_id, "plots")
+        context = get_result_context(nwbquery, urban_geom)
+        save_result(nwbquery, context)
+        set_job(job_id, "done", context)
+    except Exception as ex:
+        # don't raise, so the cluster doesn't retry the job
+        print(ex)
+        print(traceback.format_exc())
+        set_job(job_id, "failed", {"success": False})
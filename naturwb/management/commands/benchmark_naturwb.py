@@ -0,0 +1,389 @@
+"""Benchmarks of the NatUrWB query pipeline.
+
+Run with ``python manage.py benchmark_naturwb <case>``.
+The polygons are taken from the recorded queries in the
+naturwb_results_saved table or from a file with one WKT (EPSG:4326) per line.
+The cases without database use the synthetic fixture of the tests.
+"""
+from django.core.management.base import BaseCommand, CommandError
+from aldjemy.core import get_engine
+from shapely.wkt import loads as wkt_loads
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import os
+import pickle
+import subprocess
+import sys
+import tempfile
+import time
+import zipfile
+import zlib
+from pathlib import Path
+
+from naturwb.functions.naturwb import Query as NWBQuery
+from naturwb.functions.naturwb_agg import (
+    renormalise_bfid_area, renormalise_bfid_area_loop)
+from naturwb.functions.naturwb import (
+    PLOT_WORKERS, MAP_SIMPLIFY_PX, MAP_DECIMALS)
+from naturwb.functions.naturwb_plot import (
+    MPL_WEB_FORMATS, _mpl_fig_to_graphic)
+from naturwb.models import gdf_to_parquet, parquet_to_gdf
+from naturwb.views import WEATHER_ZIP_DIR
+from naturwb.zip_stream import (
+    stream_zip, file_chunks, geo_members, GEO_FORMATS)
+from naturwb.functions.synthetic import make_synthetic_query
+
+
+def _timeit(func, repeat=3):
+    """Run the function several times and return the timings in seconds."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - start)
+    return np.array(timings), result
+
+def _rss():
+    """Get the resident set size of this process in MB (Linux only)."""
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1e6
+
+
+class Command(BaseCommand):
+    help = "Benchmark different implementations of the NatUrWB pipeline."
+    cases = ["query_mode", "forced_landuse", "cache_format", "plots",
+             "plot_formats", "map_size", "import_time", "plot_memory",
+             "weather_zip", "download_format"]
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "case", choices=self.cases,
+            help="The benchmark to run.")
+        parser.add_argument(
+            "--n", type=int, default=10,
+            help="The number of recorded polygons to use.")
+        parser.add_argument(
+            "--repeat", type=int, default=3,
+            help="How many times every polygon is queried per variant.")
+        parser.add_argument(
+            "--wkt-file", default=None,
+            help="A file with one WKT polygon (EPSG:4326) per line " +
+                 "to use instead of the recorded polygons.")
+        parser.add_argument(
+            "--n-sim", type=int, default=3000,
+            help="The number of simulation polygons of the synthetic fixture.")
+        parser.add_argument(
+            "--renders", type=int, default=1000,
+            help="The number of plots to render in the plot_memory case.")
+        parser.add_argument(
+            "--n-stations", type=int, default=200,
+            help="The number of weather stations in the weather_zip case.")
+
+    def handle(self, *args, case, **options):
+        getattr(self, "_bench_" + case)(**options)
+
+    def _get_polygons(self, n, wkt_file=None, **kwargs):
+        """Get the recorded urban polygons as shapely geometries in EPSG:4326."""
+        if wkt_file is not None:
+            with open(wkt_file) as f:
+                wkts = [line.strip() for line in f if line.strip()][:n]
+        else:
+            with get_engine().connect() as con:
+                wkts = [row[0] for row in con.execute(
+                    "SELECT ST_AsText(ST_Transform(urban_shp, 4326)) " +
+                    "FROM naturwb_results_saved " +
+                    "ORDER BY timestamp DESC LIMIT {n};".format(n=int(n)))]
+        if len(wkts) == 0:
+            raise CommandError("No recorded polygons found.")
+        return [wkt_loads(wkt) for wkt in wkts]
+
+    def _bench_query_mode(self, repeat, **options):
+        """Compare the single round trip query with the four separate queries."""
+        engine = get_engine()
+        totals = {True: 0, False: 0}
+        for i, urban_shp in enumerate(self._get_polygons(**options)):
+            refs = {}
+            for single_query in [True, False]:
+                timings, query = _timeit(
+                    lambda: NWBQuery(urban_shp=urban_shp, db_engine=engine,
+                                     single_query=single_query),
+                    repeat=repeat)
+                totals[single_query] += np.median(timings)
+                refs[single_query] = query.naturwb_ref
+                self.stdout.write(
+                    "polygon {i}: single_query={single:<5} median {med:.3f} s, min {min:.3f} s".format(
+                        i=i, single=str(single_query),
+                        med=np.median(timings), min=timings.min()))
+            if not np.allclose(refs[True], refs[False]):
+                self.stderr.write(
+                    "polygon {i}: the results of both query modes differ!".format(i=i))
+
+        self.stdout.write(
+            "total median: single query {0:.3f} s, separate queries {1:.3f} s".format(
+                totals[True], totals[False]))
+
+    def _bench_forced_landuse(self, repeat, n_sim, **options):
+        """Compare the renormalisation of forced landuses with the old loop."""
+        query = make_synthetic_query(
+            n_sim=n_sim, n_gen=200, n_flagged=n_sim // 2)
+        bfid_area = query.results["bfid_area"]
+        self.stdout.write("{n} simulation polygons, {n_flag} flagged".format(
+            n=n_sim, n_flag=(query.sim_infos["lanu_flag"] == 2).sum()))
+
+        results = {}
+        for name, func in [("loop", renormalise_bfid_area_loop),
+                           ("transform", renormalise_bfid_area)]:
+            timings, results[name] = _timeit(
+                lambda: func(bfid_area), repeat=repeat)
+            self.stdout.write(
+                "{name:<9} median {med:.3f} s, min {min:.3f} s".format(
+                    name=name, med=np.median(timings), min=timings.min()))
+
+        if not np.allclose(results["loop"], results["transform"]):
+            self.stderr.write("the results of both variants differ!")
+
+    def _bench_cache_format(self, repeat, **options):
+        """Compare the size and round trip time of the cache formats."""
+        engine = get_engine()
+        formats = {
+            "pickle+zlib": (
+                lambda gdf: zlib.compress(pickle.dumps(gdf)),
+                lambda blob: pickle.loads(zlib.decompress(blob))),
+            "parquet zstd": (
+                lambda gdf: gdf_to_parquet(gdf, compression="zstd"),
+                parquet_to_gdf),
+            "parquet lz4": (
+                lambda gdf: gdf_to_parquet(
+                    gdf, compression="lz4", compression_level=None),
+                parquet_to_gdf)}
+        totals = {name: np.zeros(3) for name in formats}
+        for i, urban_shp in enumerate(self._get_polygons(**options)):
+            res_gen = NWBQuery(
+                urban_shp=urban_shp, db_engine=engine).get_results_genid()
+            for name, (dump, load) in formats.items():
+                t_dump, blob = _timeit(lambda: dump(res_gen), repeat=repeat)
+                t_load, _ = _timeit(lambda: load(blob), repeat=repeat)
+                totals[name] += [len(blob), np.median(t_dump), np.median(t_load)]
+                self.stdout.write(
+                    "polygon {i} ({n} rows): {name:<12} {size:>9} bytes, "
+                    "write {dump:.4f} s, read {load:.4f} s".format(
+                        i=i, n=len(res_gen), name=name, size=len(blob),
+                        dump=np.median(t_dump), load=np.median(t_load)))
+
+        for name, (size, t_dump, t_load) in totals.items():
+            self.stdout.write(
+                "total {name:<12} {size:>10.0f} bytes, "
+                "write {dump:.3f} s, read {load:.3f} s".format(
+                    name=name, size=size, dump=t_dump, load=t_load))
+
+    def _bench_plots(self, repeat, **options):
+        """Compare the sequential with the concurrent rendering of the plots."""
+        engine = get_engine()
+        plots = {
+            "sim_shps_clip_plotly": ("sim_shps_clip_plotly", {}),
+            "pie_plotly": ("pie_plotly", {}),
+            "sankey": ("sankey", dict(figsize=(17,17), cex=1.5)),
+            "ternary": ("ternary", dict(width=1000, do_size=True)),
+            "pie_landuse": ("pie_landuse", {})}
+        for i, urban_shp in enumerate(self._get_polygons(**options)):
+            query = NWBQuery(urban_shp=urban_shp, db_engine=engine)
+            t_seq, _ = _timeit(
+                lambda: {name: query.plot_web(kind, **kwargs)
+                         for name, (kind, kwargs) in plots.items()},
+                repeat=repeat)
+            t_par, (_, timings) = _timeit(
+                lambda: query.plot_web_many(plots), repeat=repeat)
+            self.stdout.write(
+                "polygon {i}: sequential {seq:.2f} s, "
+                "concurrent {par:.2f} s ({workers} workers), per plot: {per}"
+                .format(i=i, seq=np.median(t_seq), par=np.median(t_par),
+                        workers=PLOT_WORKERS,
+                        per=", ".join(["{0} {1:.2f} s".format(name, time)
+                                       for name, time in timings.items()])))
+
+    def _bench_plot_formats(self, repeat, **options):
+        """Compare the output formats of the matplotlib plots for the web."""
+        query = make_synthetic_query()
+        query._aggregate_results()
+        for kind, kwargs in [("sankey", dict(figsize=(17,17), cex=1.5)),
+                             ("pie", dict(figsize=(7, 7)))]:
+            fig = query.plot(kind, **kwargs)
+            for fmt in MPL_WEB_FORMATS:
+                for bbox_inches in ["tight", None]:
+                    timings, graphic = _timeit(
+                        lambda: _mpl_fig_to_graphic(
+                            fig, dpi=75, fmt=fmt, bbox_inches=bbox_inches),
+                        repeat=repeat)
+                    self.stdout.write(
+                        "{kind:<6} {fmt:<4} bbox_inches={bbox:<5}: "
+                        "{size:>9} bytes base64, encode {t:.3f} s".format(
+                            kind=kind, fmt=fmt, bbox=str(bbox_inches),
+                            size=len(graphic), t=np.median(timings)))
+
+    def _bench_map_size(self, repeat, **options):
+        """Compare the size of the map with simplified and rounded polygons."""
+        engine = get_engine()
+        variants = {
+            "full": dict(simplify_px=None, decimals=None),
+            "rounded": dict(simplify_px=None, decimals=MAP_DECIMALS),
+            "default": dict(simplify_px=MAP_SIMPLIFY_PX, decimals=MAP_DECIMALS),
+            "coarse": dict(simplify_px=2, decimals=5)}
+        totals = {name: np.zeros(2) for name in variants}
+        for i, urban_shp in enumerate(self._get_polygons(**options)):
+            query = NWBQuery(urban_shp=urban_shp, db_engine=engine)
+            query._sql_nre()
+            for name, kwargs in variants.items():
+                timings, html = _timeit(
+                    lambda: query.plot_web("sim_shps_clip_plotly", **kwargs),
+                    repeat=repeat)
+                totals[name] += [len(html.encode()), np.median(timings)]
+                self.stdout.write(
+                    "polygon {i}: {name:<8} {size:>10} bytes, {t:.3f} s".format(
+                        i=i, name=name, size=len(html.encode()),
+                        t=np.median(timings)))
+
+        for name, (size, t) in totals.items():
+            self.stdout.write(
+                "total {name:<8} {size:>12.0f} bytes, {t:.2f} s".format(
+                    name=name, size=size, t=t))
+
+    def _bench_import_time(self, repeat, **options):
+        """Measure the import time of the core and the plot module.
+
+        Every import runs in a fresh interpreter with python -X importtime.
+        """
+        for module in ["naturwb.functions.naturwb",
+                       "naturwb.functions.naturwb_plot"]:
+            totals = []
+            for _ in range(repeat):
+                stderr = subprocess.run(
+                    [sys.executable, "-X", "importtime", "-c",
+                     "import " + module],
+                    capture_output=True, text=True, check=True).stderr
+                # the lines are "import time: self | cumulative | name"
+                times = {}
+                for line in stderr.splitlines():
+                    if not line.startswith("import time:") or "self [us]" in line:
+                        continue
+                    _, cumulative, name = line[len("import time:"):].split("|")
+                    # the nested imports are indented by further spaces
+                    times[name[1:].rstrip()] = int(cumulative) / 1e6
+                totals.append(times[module])
+            # the direct imports of the module are indented by 2 spaces
+            top_level = sorted(
+                [(time, name.strip()) for name, time in times.items()
+                 if name.startswith("  ") and not name.startswith("   ")],
+                reverse=True)[:5]
+            self.stdout.write(
+                "{module}: median {med:.2f} s, heaviest: {top}".format(
+                    module=module, med=np.median(totals),
+                    top=", ".join(["{0} {1:.2f} s".format(name, time)
+                                   for time, name in top_level])))
+
+    def _bench_plot_memory(self, renders, **options):
+        """Check that the memory stays flat when rendering many plots.
+
+        The sankey and the pie figure are rendered alternately
+        like in a long running worker.
+        The growth is taken from the first tenth of the renders to the end,
+        as the allocator and the caches of matplotlib need some renders
+        to reach their size.
+        """
+        query = make_synthetic_query()
+        query._aggregate_results()
+        plots = [("sankey", dict(figsize=(17,17), cex=1.5)),
+                 ("pie", dict(figsize=(7, 7)))]
+        # the first renders load the fonts and the background image
+        for kind, kwargs in plots:
+            query.plot_web(kind, **kwargs)
+        self.stdout.write("start: {rss:.1f} MB".format(rss=_rss()))
+
+        step = max(renders // 10, 1)
+        start = time.perf_counter()
+        for i in range(1, renders + 1):
+            kind, kwargs = plots[i % len(plots)]
+            query.plot_web(kind, **kwargs)
+            if i % step == 0:
+                if i == step:
+                    rss_warm = _rss()
+                self.stdout.write(
+                    "{i:>6} renders: {rss:.1f} MB, {t:.1f} s".format(
+                        i=i, rss=_rss(), t=time.perf_counter() - start))
+        self.stdout.write(
+            "growth from {step} to {n} renders: {growth:.1f} MB".format(
+                step=step, n=renders, growth=_rss() - rss_warm))
+
+    def _bench_weather_zip(self, repeat, n_stations, **options):
+        """Compare deflating the weather zips again with storing them.
+
+        Uses the zip files of the first n_stations weather stations
+        or, if they are not there, synthetic ones with 30 years
+        of daily values.
+        """
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            paths = sorted(Path(WEATHER_ZIP_DIR).glob("*.zip"))[:n_stations]
+            if len(paths) < n_stations:
+                self.stdout.write("using synthetic weather zips")
+                rng = np.random.default_rng(0)
+                index = pd.date_range("1991-01-01", "2020-12-31", freq="D")
+                paths = []
+                for stid in range(n_stations):
+                    path = Path(tmp_dir).joinpath(f"{stid}.zip")
+                    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as zf:
+                        for para, scale in [("N", 5), ("Ta", 10), ("ET", 2)]:
+                            zf.writestr(f"{para}.csv", pd.Series(
+                                rng.gamma(1, scale, len(index)).round(1),
+                                index=index, name=para).to_csv())
+                    paths.append(path)
+
+            size_in = sum(path.stat().st_size for path in paths)
+            self.stdout.write("{n} stations, {size:.1f} MB of zip files".format(
+                n=len(paths), size=size_in / 1e6))
+            for name, compression in [("deflated", zipfile.ZIP_DEFLATED),
+                                      ("stored", zipfile.ZIP_STORED)]:
+                timings, size = _timeit(
+                    lambda: sum(len(chunk) for chunk in stream_zip(
+                        (f"weather_stations/{path.name}",
+                         file_chunks(path), compression)
+                        for path in paths)),
+                    repeat=repeat)
+                self.stdout.write(
+                    "{name:<8} median {med:.3f} s, min {min:.3f} s, "
+                    "{size:.1f} MB".format(
+                        name=name, med=np.median(timings),
+                        min=timings.min(), size=size / 1e6))
+
+    def _bench_download_format(self, repeat, n_sim, **options):
+        """Compare the formats of the geodata in the download.
+
+        Uses n_sim synthetic result polygons with the columns of the results.
+        """
+        rng = np.random.default_rng(0)
+        centers = gpd.points_from_xy(
+            rng.uniform(3e5, 9e5, n_sim), rng.uniform(5.3e6, 6.1e6, n_sim),
+            crs=25832)
+        gdf = gpd.GeoDataFrame({
+            "nat_id": rng.integers(1, 500, n_sim),
+            "sim_id": np.arange(n_sim),
+            "gen_id": rng.integers(1, 1000, n_sim),
+            "Boden_kurz": "Braunerde aus Sandlöss",
+            "Boden_lang": "vorherrschend Braunerde, verbreitet Parabraunerde "
+                          "aus Sandlöss über Schmelzwassersand",
+            "color": "#a0c8f0",
+            "nat_name": "Oberrheinisches Tiefland",
+            **{col: rng.uniform(0, 900, n_sim).round(1) for col in
+               ["N", "kap.A", "ET", "Abfluss", "OA", "ZA", "GWNB"]}},
+            geometry=centers.buffer(rng.uniform(50, 500, n_sim), 16))
+        self.stdout.write("{n} polygons".format(n=n_sim))
+
+        for fmt in GEO_FORMATS:
+            timings, size = _timeit(
+                lambda: sum(len(chunk) for chunk in stream_zip(
+                    geo_members(gdf, "results", fmt))),
+                repeat=repeat)
+            self.stdout.write(
+                "{fmt:<8} median {med:.3f} s, min {min:.3f} s, "
+                "{size:.2f} MB zipped".format(
+                    fmt=fmt, med=np.median(timings),
+                    min=timings.min(), size=size / 1e6))
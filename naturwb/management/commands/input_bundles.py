@@ -0,0 +1,63 @@
+"""Build or check the prebuilt input files of the simulations for the download.
+
+The simulation polygons and parameters only change with an update
+of the database. Build the bundles again after every update.
+
+Run with ``python manage.py input_bundles build|validate``.
+"""
+from django.core.management.base import BaseCommand, CommandError
+from aldjemy.core import get_engine
+
+from naturwb.input_bundles import (
+    build_input_bundles, read_manifest, sim_checksums,
+    INPUT_BUNDLE_DIR, INPUT_BUNDLE_SIZE)
+
+
+class Command(BaseCommand):
+    help = "Build or validate the input bundles of the result download."
+    actions = ["build", "validate"]
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "action", choices=self.actions,
+            help="build: save the simulation polygons and parameters, " +
+                 "validate: compare the checksums of the partitions " +
+                 "with the database.")
+        parser.add_argument(
+            "--size", type=int, default=INPUT_BUNDLE_SIZE,
+            help="The number of sim_ids per partition.")
+
+    def handle(self, *args, action, **options):
+        getattr(self, "_" + action)(**options)
+
+    def _build(self, size, **options):
+        def progress(done, n):
+            if done % 50 == 0 or done == n:
+                self.stdout.write("{done}/{n} partitions".format(
+                    done=done, n=n))
+
+        manifest = build_input_bundles(size=size, progress=progress)
+        self.stdout.write(
+            "Built the input bundles of {n} simulations in {dir}.".format(
+                n=manifest["n_sims"], dir=INPUT_BUNDLE_DIR))
+
+    def _validate(self, **options):
+        manifest = read_manifest()
+        if manifest is None:
+            raise CommandError(
+                "The input bundles are not built yet, build them first.")
+        with get_engine().connect() as con:
+            checksums = sim_checksums(con, manifest["size"])
+        outdated = sorted(
+            (part for part in set(checksums) | set(manifest["checksums"])
+             if checksums.get(part) != manifest["checksums"].get(part)),
+            key=int)
+        if len(outdated) > 0:
+            raise CommandError(
+                "The input bundles are outdated in {n} partitions "
+                "({parts}). Build them again.".format(
+                    n=len(outdated), parts=", ".join(outdated[:10])))
+        self.stdout.write(
+            "The input bundles are up to date ({n} simulations, "
+            "built {built}).".format(
+                n=manifest["n_sims"], built=manifest["built"]))
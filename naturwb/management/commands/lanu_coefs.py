@@ -0,0 +1,108 @@
+"""Build and refresh the materialized views of the landuse coefficients.
+
+The landuse areas and coefficients per soil group and NRE
+and the landuse areas in the distance bands around the cells of a coarse grid
+only depend on the static lookup polygons. They are therefor materialized
+once in the database and the NatUrWB queries read them from there.
+Refresh the views after every update of the lookup or simulation polygons.
+
+Run with ``python manage.py lanu_coefs build|refresh|validate``.
+"""
+from django.core.management.base import BaseCommand, CommandError
+from aldjemy.core import get_engine
+
+from naturwb.functions.naturwb_sql import MATERIALIZED_VIEWS
+
+
+class Command(BaseCommand):
+    help = "Build, refresh or validate the materialized landuse coefficients."
+    actions = ["build", "refresh", "validate"]
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "action", choices=self.actions,
+            help="build: create the views, " +
+                 "refresh: recompute the views from the lookup polygons, " +
+                 "validate: compare the views with the live computation.")
+        parser.add_argument(
+            "--view", choices=list(MATERIALIZED_VIEWS), default=None,
+            help="Only handle this view. The default is all views.")
+        parser.add_argument(
+            "--rebuild", action="store_true",
+            help="Drop the view before building it again, " +
+                 "e.g. if the definition changed.")
+
+    def handle(self, *args, action, view, **options):
+        if view is None:
+            views = list(MATERIALIZED_VIEWS)
+        else:
+            views = [view]
+        for view in views:
+            getattr(self, "_" + action)(view, **MATERIALIZED_VIEWS[view], **options)
+
+    def _view_exists(self, con, view):
+        return con.execute(
+            "SELECT count(*) FROM pg_matviews WHERE matviewname = '{view}';"
+            .format(view=view)).scalar() > 0
+
+    def _check_exists(self, con, view):
+        if not self._view_exists(con, view):
+            raise CommandError(
+                "The view {view} does not exist yet, build it first.".format(
+                    view=view))
+
+    def _build(self, view, sql, index, rebuild, **options):
+        with get_engine().begin() as con:
+            if self._view_exists(con, view):
+                if rebuild:
+                    con.execute("DROP MATERIALIZED VIEW {view};".format(
+                        view=view))
+                else:
+                    raise CommandError(
+                        "The view {view} already exists. ".format(view=view) +
+                        "Use refresh to update it or --rebuild to drop it first.")
+            con.execute("CREATE MATERIALIZED VIEW {view} AS {sql};".format(
+                view=view, sql=sql))
+            # the unique index is needed for the concurrent refresh
+            con.execute(
+                "CREATE UNIQUE INDEX {view}_ids_idx ON {view} ({index});".format(
+                    view=view, index=", ".join(index)))
+            con.execute("ANALYZE {view};".format(view=view))
+            n = con.execute("SELECT count(*) FROM {view};".format(
+                view=view)).scalar()
+        self.stdout.write("Built {view} with {n} rows.".format(view=view, n=n))
+
+    def _refresh(self, view, **options):
+        with get_engine().begin() as con:
+            self._check_exists(con, view)
+            # concurrently, so the running queries can still read the view
+            con.execute("REFRESH MATERIALIZED VIEW CONCURRENTLY {view};".format(
+                view=view))
+            con.execute("ANALYZE {view};".format(view=view))
+        self.stdout.write("Refreshed {view}.".format(view=view))
+
+    def _validate(self, view, sql, index, values, **options):
+        with get_engine().connect() as con:
+            self._check_exists(con, view)
+            n_rows, n_missing, n_diff = con.execute("""
+                SELECT count(*),
+                    count(*) FILTER (WHERE mv.{first} IS NULL OR live.{first} IS NULL),
+                    count(*) FILTER (WHERE {diff})
+                FROM {view} mv
+                FULL JOIN ({sql}) live
+                ON {join};""".format(
+                    view=view, sql=sql, first=index[0],
+                    join=" AND ".join(
+                        ["mv.{0} = live.{0}".format(col) for col in index]),
+                    diff=" OR ".join(
+                        ["abs(mv.{0} - live.{0}) > 1e-6 * abs(live.{0})".format(col)
+                         for col in values]))).first()
+
+        if n_missing + n_diff > 0:
+            raise CommandError(
+                "{view} is outdated: {n_missing} of {n_rows} rows are missing "
+                "and {n_diff} rows differ. Refresh the view.".format(
+                    view=view, n_rows=n_rows,
+                    n_missing=n_missing, n_diff=n_diff))
+        self.stdout.write("{view} is up to date ({n} rows).".format(
+            view=view, n=n_rows))
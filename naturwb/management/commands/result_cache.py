@@ -0,0 +1,40 @@
+"""Show the statistics of the result cache or clear it.
+
+Run with ``python manage.py result_cache stats|reset-stats|clear``.
+"""
+from django.core.management.base import BaseCommand
+
+from naturwb.result_cache import ResultCache, PlotCache
+
+
+class Command(BaseCommand):
+    help = "Show the hit and miss counters of the result cache or clear it."
+    actions = ["stats", "reset-stats", "clear"]
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "action", choices=self.actions,
+            help="stats: show the hit and miss counters, " +
+                 "reset-stats: reset the counters, " +
+                 "clear: delete all the cached results and the counters.")
+        parser.add_argument(
+            "--plots", action="store_true",
+            help="Also clear the cache of the rendered plots.")
+
+    def handle(self, *args, action, plots, **options):
+        result_cache = ResultCache()
+        if action == "stats":
+            stats = result_cache.stats()
+            n = stats["hits"] + stats["misses"]
+            self.stdout.write(
+                "hits: {hits}, misses: {misses}, hit rate: {rate:.1%}".format(
+                    rate=stats["hits"] / n if n > 0 else 0, **stats))
+        elif action == "reset-stats":
+            result_cache.reset_stats()
+            self.stdout.write("Reset the counters.")
+        elif action == "clear":
+            result_cache.cache.clear()
+            self.stdout.write("Cleared the result cache.")
+            if plots:
+                PlotCache().cache.clear()
+                self.stdout.write("Cleared the plot cache.")
@@ -0,0 +1,151 @@
+# Generated by Django 3.2.25 on 2026-10-18 11:20
+
+import django.contrib.gis.db.models.fields
+from django.db import migrations, models
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LanuJoinModel',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sim_id', models.IntegerField(blank=True, null=True)),
+                ('bf_id', models.IntegerField(blank=True, null=True)),
+            ],
+            options={
+                'db_table': 'tbl_lanu_join',
+                'managed': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='LanuParasModel',
+            fields=[
+                ('lanu_id', models.IntegerField(db_column='lanu_id', primary_key=True, serialize=False)),
+                ('baeume', models.IntegerField(blank=True, null=True)),
+                ('versiegelung', models.IntegerField(blank=True, db_column='versiegelung', null=True)),
+                ('lanu_code', models.IntegerField(blank=True, null=True)),
+                ('mpd_v', models.IntegerField(blank=True, null=True)),
+                ('mpl_v', models.IntegerField(blank=True, null=True)),
+                ('mpd_h', models.IntegerField(blank=True, null=True)),
+            ],
+            options={
+                'db_table': 'tbl_lanu_paras',
+                'managed': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='LookupModel',
+            fields=[
+                ('gid', models.AutoField(primary_key=True, serialize=False)),
+                ('gen_id', models.IntegerField(blank=True, null=True)),
+                ('nat_id', models.IntegerField(blank=True, null=True)),
+                ('lanu_id', models.IntegerField(blank=True, null=True)),
+                ('clc_code', models.IntegerField(blank=True, null=True)),
+                ('shape_area', models.DecimalField(blank=True, decimal_places=65535, max_digits=65535, null=True)),
+                ('geom', django.contrib.gis.db.models.fields.MultiPolygonField(blank=True, null=True, srid=25832)),
+            ],
+            options={
+                'db_table': 'tbl_lookup_polygons',
+                'managed': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='NaturwbSettings',
+            fields=[
+                ('name', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('value', models.BooleanField()),
+            ],
+            options={
+                'db_table': 'naturwb_settings',
+                'managed': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='SavedResults',
+            fields=[
+                ('urban_shp', django.contrib.gis.db.models.fields.MultiPolygonField(blank=True, null=True, srid=25832)),
+                ('timestamp', models.DateTimeField(primary_key=True, serialize=False)),
+                ('n', models.DecimalField(blank=True, decimal_places=20, max_digits=23, null=True)),
+                ('et', models.DecimalField(blank=True, decimal_places=20, max_digits=23, null=True)),
+                ('runoff', models.DecimalField(blank=True, decimal_places=20, max_digits=23, null=True)),
+                ('gwnb', models.DecimalField(blank=True, decimal_places=20, max_digits=23, null=True)),
+                ('kapA', models.DecimalField(blank=True, db_column='kap.A.', decimal_places=20, max_digits=23, null=True)),
+                ('lanu_1', models.DecimalField(blank=True, decimal_places=20, max_digits=23, null=True)),
+                ('lanu_2', models.DecimalField(blank=True, decimal_places=20, max_digits=23, null=True)),
+                ('lanu_3', models.DecimalField(blank=True, decimal_places=20, max_digits=23, null=True)),
+                ('lanu_4', models.DecimalField(blank=True, decimal_places=20, max_digits=23, null=True)),
+                ('lanu_5', models.DecimalField(blank=True, decimal_places=20, max_digits=23, null=True)),
+                ('lanu_6', models.DecimalField(blank=True, decimal_places=20, max_digits=23, null=True)),
+                ('lanu_7', models.DecimalField(blank=True, decimal_places=20, max_digits=23, null=True)),
+                ('lanu_8', models.DecimalField(blank=True, decimal_places=20, max_digits=23, null=True)),
+                ('lanu_9', models.DecimalField(blank=True, decimal_places=20, max_digits=23, null=True)),
+                ('lanu_10', models.DecimalField(blank=True, decimal_places=20, max_digits=23, null=True)),
+                ('lanu_11', models.DecimalField(blank=True, decimal_places=20, max_digits=23, null=True)),
+                ('lanu_12', models.DecimalField(blank=True, decimal_places=20, max_digits=23, null=True)),
+                ('lanu_13', models.DecimalField(blank=True, decimal_places=20, max_digits=23, null=True)),
+                ('centroid', django.contrib.gis.db.models.fields.GeometryField(blank=True, null=True, srid=25832)),
+            ],
+            options={
+                'db_table': 'naturwb_results_saved',
+                'managed': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='SimulationModel',
+            fields=[
+                ('geom', django.contrib.gis.db.models.fields.MultiPolygonField(blank=True, null=True, srid=25832)),
+                ('sim_id', models.IntegerField(primary_key=True, serialize=False)),
+                ('gen_id', models.IntegerField(blank=True, null=True)),
+                ('tkle_nr', models.IntegerField(blank=True, null=True)),
+                ('nrkart', models.IntegerField(blank=True, null=True)),
+                ('sym_nr', models.IntegerField(blank=True, null=True)),
+                ('buek_flag', models.SmallIntegerField(blank=True, null=True)),
+                ('stat_id', models.IntegerField(blank=True, null=True)),
+                ('wea_flag', models.SmallIntegerField(blank=True, null=True)),
+                ('wea_dist', models.IntegerField(blank=True, null=True)),
+                ('wea_n_wihj', models.DecimalField(blank=True, db_column='wea_n-wihj', decimal_places=65535, max_digits=65535, null=True)),
+                ('wea_n_sohj', models.DecimalField(blank=True, db_column='wea_n-sohj', decimal_places=65535, max_digits=65535, null=True)),
+                ('wea_et', models.DecimalField(blank=True, decimal_places=65535, max_digits=65535, null=True)),
+                ('wea_t', models.DecimalField(blank=True, decimal_places=65535, max_digits=65535, null=True)),
+                ('sl_mean', models.DecimalField(blank=True, decimal_places=65535, max_digits=65535, null=True)),
+                ('sl_flag', models.SmallIntegerField(blank=True, null=True)),
+                ('sl_dist', models.DecimalField(blank=True, decimal_places=65535, max_digits=65535, null=True)),
+                ('shape_area', models.DecimalField(blank=True, decimal_places=65535, max_digits=65535, null=True)),
+                ('lanu_key', models.IntegerField(blank=True, null=True)),
+                ('lanu_flag', models.SmallIntegerField(blank=True, null=True)),
+                ('sl_std', models.DecimalField(blank=True, decimal_places=65535, max_digits=65535, null=True)),
+                ('sl_count', models.IntegerField(blank=True, null=True)),
+                ('wea_t_std', models.DecimalField(blank=True, decimal_places=65535, max_digits=65535, null=True)),
+                ('wea_n_wihj_std', models.DecimalField(blank=True, db_column='wea_n-wihj_std', decimal_places=65535, max_digits=65535, null=True)),
+                ('wea_n_sohj_std', models.DecimalField(blank=True, db_column='wea_n-sohj_std', decimal_places=65535, max_digits=65535, null=True)),
+                ('wea_et_std', models.DecimalField(blank=True, decimal_places=65535, max_digits=65535, null=True)),
+                ('wea_count', models.IntegerField(blank=True, null=True)),
+            ],
+            options={
+                'db_table': 'tbl_simulation_polygons',
+                'managed': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='CachedResults',
+            fields=[
+                ('uuid', models.UUIDField(default=uuid.uuid4, primary_key=True, serialize=False)),
+                ('timestamp', models.DateTimeField()),
+                ('results_genid', models.BinaryField(blank=True, max_length=1800000, null=True)),
+                ('stat_ids', models.BinaryField(blank=True, max_length=5000, null=True)),
+                ('messages', models.BinaryField(blank=True, max_length=5000, null=True)),
+            ],
+            options={
+                'db_table': 'naturwb_results_cached',
+                'managed': True,
+            },
+        ),
+    ]
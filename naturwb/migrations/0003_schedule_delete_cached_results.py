@@ -0,0 +1,35 @@
+from django.db import migrations
+
+DELETE_CACHED_RESULTS = "naturwb.tasks.delete_cached_results"
+
+
+def add_schedule(apps, schema_editor):
+    """Schedule the deletion of the expired cached results every 5 minutes.
+
+    A schedule of the task, that was already added in the admin, is kept.
+    """
+    Schedule = apps.get_model("django_q", "Schedule")
+    if not Schedule.objects.filter(func=DELETE_CACHED_RESULTS).exists():
+        Schedule.objects.create(
+            name="naturwb_delete_cached_results",
+            func=DELETE_CACHED_RESULTS,
+            schedule_type="I",  # Schedule.MINUTES
+            minutes=5,
+            repeats=-1)
+
+
+def remove_schedule(apps, schema_editor):
+    Schedule = apps.get_model("django_q", "Schedule")
+    Schedule.objects.filter(name="naturwb_delete_cached_results").delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('naturwb', '0002_cachedresults_timestamp_index'),
+        ('django_q', '0006_auto_20150805_1817'),
+    ]
+
+    operations = [
+        migrations.RunPython(add_schedule, remove_schedule),
+    ]
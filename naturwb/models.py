@@ -1,11 +1,12 @@
 # from django.db import models
 
 from django.contrib.gis.db import models
-import zlib
+import geopandas as gpd
+import pyarrow.parquet as pq
 import uuid
 import datetime
 import io
-import pickle
+import json
 
 # Create your models here.
 
@@ -118,41 +119,58 @@ class SavedResults(models.Model):
         db_table = 'naturwb_results_saved'
 
 
+def gdf_to_parquet(gdf, compression="zstd", compression_level=9):
+    """Serialize a GeoDataFrame to GeoParquet bytes, with the index."""
+    with io.BytesIO() as buffer:
+        gdf.to_parquet(buffer, compression=compression,
+                       compression_level=compression_level, index=True)
+        return buffer.getvalue()
+
+
+def parquet_to_gdf(blob):
+    """Deserialize the GeoParquet bytes of gdf_to_parquet.
+
+    The crs is created from its EPSG code, because parsing the whole PROJJSON
+    of the GeoParquet metadata takes most of the time of gpd.read_parquet.
+    """
+    table = pq.read_table(io.BytesIO(blob))
+    geo = json.loads(table.schema.metadata[b"geo"])
+    geom_col = geo["primary_column"]
+    crs = geo["columns"][geom_col].get("crs")
+    if crs is not None and "id" in crs:
+        crs = "{authority}:{code}".format(**crs["id"])
+    df = table.to_pandas()
+    df[geom_col] = gpd.GeoSeries.from_wkb(df[geom_col], index=df.index, crs=crs)
+    return gpd.GeoDataFrame(df, geometry=geom_col)
+
+
 class CacheManager(models.Manager):
-    def create_cache(self, results_genid, stat_ids, messages):
-        # delete older cached values
-        self.filter(
-                timestamp__lte=datetime.datetime.now(datetime.timezone.utc)\
-                    -datetime.timedelta(minutes=20)
-            ).delete()
+    def create_cache(self, results_genid, stat_ids, messages, cache_uuid=None):
+        # the older cached values get deleted by tasks.delete_cached_results
 
         # save new cached value
-        bio_res_gen = io.BytesIO()
-        pickle.dump(results_genid, bio_res_gen)
-        bio_stat_ids = io.BytesIO()
-        pickle.dump(stat_ids, bio_stat_ids)
+        # the results as GeoParquet, the ids and messages as JSON
         new_cache = self.create(
-            uuid=uuid.uuid4(),
+            uuid=uuid.uuid4() if cache_uuid is None else cache_uuid,
             timestamp=datetime.datetime.now(datetime.timezone.utc),
-            results_genid=zlib.compress(bio_res_gen.getbuffer().tobytes()),
-            stat_ids =zlib.compress(bio_stat_ids.getbuffer().tobytes()),
-            messages=zlib.compress(str(messages).encode())
+            results_genid=gdf_to_parquet(results_genid),
+            stat_ids=json.dumps([int(stid) for stid in stat_ids]).encode(),
+            messages=json.dumps(list(messages)).encode()
             )
         return new_cache
 
     def get_cache(self, uuid):
         cache = self.get(uuid=uuid)
-        results_genid = pickle.loads(zlib.decompress(cache.results_genid))
-        stat_ids = pickle.loads(zlib.decompress(cache.stat_ids))
-        messages = zlib.decompress(cache.messages).decode()\
-            .replace("[", "").replace("]", "")[1:-1].split("', '")
+        results_genid = parquet_to_gdf(cache.results_genid)
+        stat_ids = json.loads(bytes(cache.stat_ids))
+        messages = json.loads(bytes(cache.messages))
 
         return results_genid, stat_ids, messages
         
         
 class CachedResults(models.Model):
     uuid = models.UUIDField(primary_key=True, default=uuid.uuid4)
-    timestamp = models.DateTimeField(blank=False, null=False, primary_key=False)
+    timestamp = models.DateTimeField(blank=False, null=False, primary_key=False, db_index=True)
     results_genid = models.BinaryField(max_length=1800000, null=True, blank=True)
     stat_ids = models.BinaryField(max_length=5000, null=True, blank=True)
     messages = models.BinaryField(max_length=5000,blank=True, null=True)
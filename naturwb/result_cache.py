@@ -0,0 +1,327 @@
+"""The results of a NatUrWB query only depend on the urban polygon.
+
+Many polygons, e.g. the city polygons from geoencode, are submitted again
+and again. Therefor the state of every query is saved in a Django cache
+outside of the request process (NATURWB_RESULT_CACHE in the settings,
+e.g. the file based LRU cache or a Redis cache) and gets restored
+for the same polygon without any database query or aggregation.
+
+The key is a hash of the normalized polygon in EPSG:25832,
+snapped on a grid of NATURWB_RESULT_CACHE_GRID m,
+so the same polygon with another start point or orientation of the rings
+or with small differences from the coordinate transformation
+gets the same entry.
+
+The result page only shows the headline numbers at first. Its plots are
+loaded from their own endpoint, that restores the query from the state
+saved under the uuid of the result page.
+
+The rendered plots are saved in a second, size bounded cache
+(NATURWB_PLOT_CACHE), with the fingerprint of the query results,
+the kind, dpi and arguments of the plot as key.
+So the same area never gets plotted twice, even for another result page.
+"""
+from django.conf import settings
+from django.core.cache import caches
+import geopandas as gpd
+import pandas as pd
+import shapely
+import hashlib
+import json
+import time
+
+from .functions.naturwb import Query as NWBQuery
+
+# increase this if the state of the Query class or the plot output changes
+CACHE_VERSION = 2
+RESULT_CACHE = getattr(settings, "NATURWB_RESULT_CACHE", "naturwb_results")
+RESULT_CACHE_TTL = getattr(settings, "NATURWB_RESULT_CACHE_TTL", 60*60*24*7)
+RESULT_CACHE_GRID = getattr(settings, "NATURWB_RESULT_CACHE_GRID", 1)
+PLOT_CACHE = getattr(settings, "NATURWB_PLOT_CACHE", "naturwb_plots")
+PLOT_CACHE_TTL = getattr(settings, "NATURWB_PLOT_CACHE_TTL", 60*60*24*30)
+
+
+def geometry_key(urban_shp, urban_shp_crs="EPSG:4326",
+                 grid_size=RESULT_CACHE_GRID, **query_kwargs):
+    """Get the cache key of an urban polygon.
+
+    Parameters
+    ----------
+    urban_shp : shapely.Polygon or MultiPolygon
+        The urban polygon of the query.
+    urban_shp_crs : str of crs type, optional
+        The coordinate reference system of the urban_shp.
+        The default is "EPSG:4326".
+    grid_size : float, optional
+        The size of the grid in m to snap the coordinates on.
+        The default is RESULT_CACHE_GRID.
+    **query_kwargs
+        The further arguments of the query, that change the results.
+
+    Returns
+    -------
+    str
+        The key of the urban polygon.
+    """
+    geom = gpd.GeoSeries(urban_shp, crs=urban_shp_crs).to_crs(25832).iloc[0]
+    geom = shapely.normalize(shapely.set_precision(geom, grid_size))
+    key_hash = hashlib.sha256(geom.wkb)
+    key_hash.update(json.dumps(query_kwargs, sort_keys=True).encode())
+    return "naturwb_result:{version}:{hash}".format(
+        version=CACHE_VERSION, hash=key_hash.hexdigest())
+
+
+def query_fingerprint(query):
+    """Get the fingerprint of the results of a query.
+
+    It is made of the key of the urban polygon
+    and the hashes of the results the plots are made of.
+
+    Parameters
+    ----------
+    query : naturwb.Query
+        The finished query.
+
+    Returns
+    -------
+    str
+        The fingerprint of the query results.
+    """
+    key_hash = hashlib.sha256(
+        geometry_key(query.urban_shp, "EPSG:25832").encode())
+    for attr in ["naturwb_ref", "coef_all", "res_sim", "coef_sim", "coef_gen"]:
+        key_hash.update(
+            pd.util.hash_pandas_object(getattr(query, attr)).values.tobytes())
+    return key_hash.hexdigest()
+
+
+def plot_key(fingerprint, kind, dpi=75, **kwargs):
+    """Get the cache key of a rendered plot of the query results."""
+    key_hash = hashlib.sha256(
+        json.dumps(dict(dpi=dpi, **kwargs), sort_keys=True, default=str
+                   ).encode())
+    return "naturwb_plot:{version}:{fingerprint}:{kind}:{hash}".format(
+        version=CACHE_VERSION, fingerprint=fingerprint, kind=kind,
+        hash=key_hash.hexdigest())
+
+
+class ResultCache(object):
+    """The cache of the query states with hit and miss counters.
+
+    Parameters
+    ----------
+    alias : str, optional
+        The name of the cache in the CACHES setting.
+        The default is RESULT_CACHE.
+    ttl : int, optional
+        The time in seconds, after which an entry expires.
+        The default is RESULT_CACHE_TTL.
+    """
+    counters = ["hits", "misses"]
+    counter_prefix = "naturwb_result_cache:"
+
+    def __init__(self, alias=RESULT_CACHE, ttl=RESULT_CACHE_TTL):
+        self.cache = caches[alias]
+        self.ttl = ttl
+
+    def _count(self, counter):
+        key = self.counter_prefix + counter
+        try:
+            self.cache.incr(key)
+        except ValueError:
+            # the counter doesn't exist yet
+            if not self.cache.add(key, 1, timeout=None):
+                self.cache.incr(key)
+
+    def get(self, key):
+        """Get the state of a query or None if not in the cache."""
+        state = self.cache.get(key)
+        self._count("misses" if state is None else "hits")
+        return state
+
+    def set(self, key, state):
+        """Save the state of a query."""
+        self.cache.set(key, state, timeout=self.ttl)
+
+    def stats(self):
+        """Get the hit and miss counters."""
+        return {counter: self.cache.get(self.counter_prefix + counter, 0)
+                for counter in self.counters}
+
+    def reset_stats(self):
+        """Reset the hit and miss counters."""
+        self.cache.delete_many(
+            [self.counter_prefix + counter for counter in self.counters])
+
+    def get_query(self, urban_shp, db_engine=None, urban_shp_crs="EPSG:4326",
+                  **query_kwargs):
+        """Get the query of an urban polygon from the cache or compute it.
+
+        Parameters
+        ----------
+        urban_shp : shapely.Polygon or MultiPolygon
+            The urban polygon of the query.
+        db_engine : sqlalchemy.engine, optional.
+            The database engine to the NatUrWB database.
+        urban_shp_crs : str of crs type, optional
+            The coordinate reference system of the urban_shp.
+            The default is "EPSG:4326".
+        **query_kwargs
+            The further arguments for the query, see naturwb.Query.
+
+        Returns
+        -------
+        naturwb.Query, bool
+            The query and whether it was restored from the cache.
+        """
+        # those arguments don't change the results
+        key = geometry_key(
+            urban_shp, urban_shp_crs,
+            **{name: value for name, value in query_kwargs.items()
+               if name not in ["single_query", "do_plots", "progress"]})
+        state = self.get(key)
+        if state is not None:
+            query = NWBQuery.from_state(
+                state, urban_shp=urban_shp, db_engine=db_engine,
+                urban_shp_crs=urban_shp_crs)
+            return query, True
+        else:
+            query = NWBQuery(urban_shp=urban_shp, db_engine=db_engine,
+                             urban_shp_crs=urban_shp_crs, **query_kwargs)
+            self.set(key, query.get_state())
+            return query, False
+
+    def set_result(self, cache_uuid, query):
+        """Save the state of the query of a result page for its plots."""
+        self.cache.set_many({
+            "naturwb_result_state:{uuid}".format(uuid=cache_uuid):
+                dict(state=query.get_state(), urban_shp=query.urban_shp),
+            "naturwb_result_fingerprint:{uuid}".format(uuid=cache_uuid):
+                query_fingerprint(query)},
+            timeout=self.ttl)
+
+    def get_result(self, cache_uuid, db_engine=None):
+        """Restore the query of a result page or None if not in the cache."""
+        entry = self.cache.get(
+            "naturwb_result_state:{uuid}".format(uuid=cache_uuid))
+        if entry is None:
+            return None
+        return NWBQuery.from_state(
+            entry["state"], urban_shp=entry["urban_shp"], db_engine=db_engine,
+            urban_shp_crs="EPSG:25832")
+
+    def get_fingerprint(self, cache_uuid):
+        """Get the fingerprint of the query of a result page or None."""
+        return self.cache.get(
+            "naturwb_result_fingerprint:{uuid}".format(uuid=cache_uuid))
+
+
+class PlotCache(object):
+    """The cache of the rendered plots (output of naturwb.Query.plot_web).
+
+    Parameters
+    ----------
+    alias : str, optional
+        The name of the cache in the CACHES setting.
+        The default is PLOT_CACHE.
+    ttl : int, optional
+        The time in seconds, after which an entry expires.
+        The default is PLOT_CACHE_TTL.
+    """
+    def __init__(self, alias=PLOT_CACHE, ttl=PLOT_CACHE_TTL):
+        self.cache = caches[alias]
+        self.ttl = ttl
+
+    def get(self, fingerprint, kind, dpi=75, **kwargs):
+        """Get a rendered plot or None if not in the cache."""
+        return self.cache.get(plot_key(fingerprint, kind, dpi=dpi, **kwargs))
+
+    def set(self, fingerprint, kind, plot, dpi=75, **kwargs):
+        """Save a rendered plot."""
+        self.cache.set(plot_key(fingerprint, kind, dpi=dpi, **kwargs), plot,
+                       timeout=self.ttl)
+
+    def plot_web(self, query, kind, dpi=75, fingerprint=None, **kwargs):
+        """Get a plot of the query from the cache or render it.
+
+        Parameters
+        ----------
+        query : naturwb.Query
+            The query to plot.
+        kind : str
+            The kind of the plot, see naturwb.Query.plot.
+        dpi : int, optional
+            The dpi value for a matplotlib plot. The default is 75.
+        fingerprint : str, optional
+            The fingerprint of the query, if already known.
+            The default is None.
+        **kwargs
+            The keyword arguments for naturwb.Query.plot_web.
+
+        Returns
+        -------
+        str
+            The output of naturwb.Query.plot_web.
+        """
+        if fingerprint is None:
+            fingerprint = query_fingerprint(query)
+        plot = self.get(fingerprint, kind, dpi=dpi, **kwargs)
+        if plot is None:
+            plot = query.plot_web(kind, dpi=dpi, **kwargs)
+            self.set(fingerprint, kind, plot, dpi=dpi, **kwargs)
+        return plot
+
+    def plot_data(self, query, kind, fingerprint=None):
+        """Get the data of a plot from the cache or compute it.
+
+        See naturwb.Query.plot_data.
+        """
+        if fingerprint is None:
+            fingerprint = query_fingerprint(query)
+        data = self.get(fingerprint, "data_" + kind)
+        if data is None:
+            data = query.plot_data(kind)
+            self.set(fingerprint, "data_" + kind, data)
+        return data
+
+    def plot_web_many(self, query, plots, fingerprint=None):
+        """Get several plots from the cache and render the missing ones.
+
+        Parameters
+        ----------
+        query : naturwb.Query
+            The query to plot.
+        plots : dict of tuple
+            The plots as name: (kind, kwargs),
+            see naturwb.Query.plot_web_many.
+        fingerprint : str, optional
+            The fingerprint of the query, if already known.
+            The default is None.
+
+        Returns
+        -------
+        dict, dict
+            The output of plot_web and the time in seconds to get every plot.
+        """
+        if fingerprint is None:
+            fingerprint = query_fingerprint(query)
+
+        results, timings = {}, {}
+        for name, (kind, kwargs) in plots.items():
+            start = time.perf_counter()
+            plot = self.get(fingerprint, kind, **kwargs)
+            if plot is not None:
+                results[name] = plot
+                timings[name] = time.perf_counter() - start
+
+        missing = {name: plot for name, plot in plots.items()
+                   if name not in results}
+        if len(missing) > 0:
+            rendered, rendered_timings = query.plot_web_many(missing)
+            for name, (kind, kwargs) in missing.items():
+                self.set(fingerprint, kind, rendered[name], **kwargs)
+            results.update(rendered)
+            timings.update(rendered_timings)
+
+        return ({name: results[name] for name in plots},
+                {name: timings[name] for name in plots})
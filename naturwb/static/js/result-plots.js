@@ -0,0 +1,200 @@
+// load the plots of the result page, when they get scrolled into view
+// the containers have either a data-plot-url to get the html of a plotly figure
+// or a data-data-url and data-kind to render the figure from its data
+
+const PLOT_FONT_SIZE = 16;
+
+// the renderers of the figures from their data
+const plotRenderers = {
+  "sankey": function(container, data) {
+    const nodes = [
+      `Niederschlag<br>${data["n"]} mm/a`,
+      `kapillarer Aufstieg<br>${data["kap.A."]} mm/a`,
+      "Boden",
+      `Evapotranspiration<br>${data["et"]} mm/a<br>(pot. ET: ${Math.round(data["pet"])} mm/a)`,
+      `Oberflächenabfluss<br>${data["oa"]} mm/a`,
+      `Zwischenabfluss<br>${data["za"]} mm/a`,
+      `Tiefenperkolation<br>${data["tp"]} mm/a`,
+      `Zwischenabfluss zum Abfluss<br>${data["za_oa"]} mm/a`,
+      `Zwischenabfluss bei hohem Grundwasser<br>${data["za_gwnah"]} mm/a`];
+    const links = [
+      [0, 2, data["n"]],
+      [1, 2, data["kap.A."]],
+      [2, 3, data["et"]],
+      [2, 4, data["oa"]],
+      [2, 5, data["za"]],
+      [2, 6, data["tp"]],
+      [5, 7, data["za_oa"]],
+      [5, 8, data["za_gwnah"]]
+    ].filter(link => link[2] > 0);
+
+    Plotly.newPlot(container, [{
+      type: "sankey",
+      valueformat: ".1f",
+      valuesuffix: " mm/a",
+      node: {
+        label: nodes,
+        color: "#1f77b4",
+        pad: 20,
+        thickness: 20
+      },
+      link: {
+        source: links.map(link => link[0]),
+        target: links.map(link => link[1]),
+        value: links.map(link => link[2]),
+        color: "rgba(31, 119, 180, 0.4)"
+      }
+    }], {
+      title: {text: "Wasserbilanz der NatUrWB-Referenz", x: 0.5, xanchor: "center"},
+      font: {size: PLOT_FONT_SIZE},
+      height: 700
+    }, {responsive: true});
+  },
+
+  "pie": function(container, data) {
+    Plotly.newPlot(container, [{
+      type: "pie",
+      values: [data["runoff"], data["tp"], data["et"]],
+      labels: ["Abfluss (Q)", "Grundwasserneubildung (GWNB)", "Evapotranspiration (ET)"],
+      hovertemplate: "%{label}<br>%{value:.1%}<extra></extra>",
+      texttemplate: "%{value:.1%}",
+      sort: false,
+      marker: {colors: ["#1f77b4", "#ff7f0e", "#2ca02c"]}
+    }], {
+      title: {text: "NatUrWB Referenz", font: {size: 20}, x: 0.5, xanchor: "center"},
+      font: {size: PLOT_FONT_SIZE},
+      hoverlabel: {font: {size: 14}},
+      legend: {orientation: "h", valign: "bottom"}
+    }, {responsive: true});
+  },
+
+  // the soils and NRE from the shared vector tiles with the urban polygon
+  "tile_map": function(container, data) {
+    const tileUrl = decodeURI(new URL(container.dataset.tileUrl, window.location.origin).href);
+    const map = new maplibregl.Map({
+      container: container,
+      style: {
+        version: 8,
+        sources: {
+          "osm": {
+            type: "raster",
+            tiles: ["https://tile.openstreetmap.org/{z}/{x}/{y}.png"],
+            tileSize: 256,
+            attribution: "© OpenStreetMap contributors"
+          },
+          "naturwb": {
+            type: "vector",
+            tiles: [tileUrl],
+            minzoom: Number(container.dataset.tileMinZoom),
+            maxzoom: Number(container.dataset.tileMaxZoom),
+            attribution: "© GeoBasis-DE/ BKG 2018"
+          },
+          "urban": {type: "geojson", data: data["urban"]}
+        },
+        layers: [
+          {id: "osm", type: "raster", source: "osm"},
+          {id: "soils", type: "fill", source: "naturwb", "source-layer": "soils",
+           paint: {"fill-color": ["get", "color"], "fill-opacity": 0.75}},
+          {id: "nre", type: "fill", source: "naturwb", "source-layer": "nre",
+           layout: {visibility: "none"},
+           paint: {"fill-color": ["get", "color"], "fill-opacity": 0.5}},
+          {id: "urban", type: "line", source: "urban",
+           paint: {"line-color": "#000000", "line-width": 2}}
+        ]
+      },
+      bounds: data["bounds"],
+      fitBoundsOptions: {padding: 20}
+    });
+    map.addControl(new maplibregl.NavigationControl());
+
+    // show the informations of the polygons
+    const popup = new maplibregl.Popup({closeButton: false, closeOnClick: false});
+    const popupTexts = {
+      "soils": props => `<b>Bodengesellschaft</b>:<br>GEN_ID: ${props["gen_id"]}<br>${props["leg_tkle_kurz"]}`,
+      "nre": props => `<b>Naturraumeinheit</b>:<br>${props["name"]}`
+    };
+    for (const [layer, popupText] of Object.entries(popupTexts)) {
+      map.on("mousemove", layer, e => {
+        map.getCanvas().style.cursor = "pointer";
+        popup.setLngLat(e.lngLat).setHTML(popupText(e.features[0].properties)).addTo(map);
+      });
+      map.on("mouseleave", layer, () => {
+        map.getCanvas().style.cursor = "";
+        popup.remove();
+      });
+    }
+
+    // switch between the soils and NRE
+    document.querySelectorAll("input[name=tile_map_layer]").forEach(input => {
+      input.addEventListener("change", e => {
+        for (const layer of Object.keys(popupTexts)) {
+          map.setLayoutProperty(
+            layer, "visibility", layer == e.target.value ? "visible" : "none");
+        }
+      });
+    });
+  },
+
+  "pie_landuse": function(container, data) {
+    Plotly.newPlot(container, [{
+      type: "pie",
+      values: data["values"],
+      labels: data["labels"],
+      hovertemplate: "%{label}<br>%{value:.1%}<extra></extra>",
+      texttemplate: "%{value:.1%}",
+      marker: {colors: data["colors"]}
+    }], {
+      title: {text: "Landnutzungsverteilung", x: 0.5, xanchor: "center"},
+      font: {size: PLOT_FONT_SIZE},
+      hoverlabel: {font: {size: 14}}
+    }, {responsive: true});
+  }
+};
+
+let loadPlot = function(container) {
+  let request;
+  // the spinner is centered, the plot takes the full width
+  const showPlot = () => container.classList.remove("d-flex", "justify-content-center");
+  if (container.dataset.dataUrl) {
+    request = fetch(container.dataset.dataUrl)
+      .then(response => {
+        if (!response.ok) throw new Error(response.statusText);
+        return response.json();
+      })
+      .then(data => {
+        container.innerHTML = "";
+        showPlot();
+        plotRenderers[container.dataset.kind](container, data);
+      });
+  } else {
+    request = fetch(container.dataset.plotUrl)
+      .then(response => {
+        if (!response.ok) throw new Error(response.statusText);
+        return response.text();
+      })
+      .then(html => {
+        container.innerHTML = html;
+        showPlot();
+        // the scripts of the plotly div don't run with innerHTML
+        container.querySelectorAll("script").forEach(oldScript => {
+          const script = document.createElement("script");
+          script.text = oldScript.text;
+          oldScript.replaceWith(script);
+        });
+      });
+  }
+  request.catch(() => {
+    container.innerHTML = '<div class="alert alert-warning" role="alert">Die Grafik konnte nicht geladen werden.</div>';
+  });
+}
+
+const plotObserver = new IntersectionObserver((entries, observer) => {
+  entries.forEach(entry => {
+    if (entry.isIntersecting) {
+      observer.unobserve(entry.target);
+      loadPlot(entry.target);
+    }
+  });
+}, {rootMargin: "200px"});
+document.querySelectorAll(".naturwb-lazy-plot").forEach(
+  container => plotObserver.observe(container));
@@ -1,6 +1,10 @@
 # the sheduled tasks to perform
-from .models import SavedResults
+from .models import SavedResults, CachedResults
+from django.conf import settings
 import datetime
+import logging
+
+logger = logging.getLogger(__name__)
 
 def delete_saved_results(hours=2):
     """
@@ -10,4 +14,46 @@ def delete_saved_results(hours=2):
     expired_results = SavedResults.objects.filter(
         timestamp__lte=twohours_ago
     )
-    expired_results.delete()
\ No newline at end of file
+    expired_results.delete()
+
+def delete_cached_results(minutes=None, batch_size=None):
+    """
+    Deletes all cached results that are older than the TTL in batches.
+
+    It is sheduled every 5 minutes by the migration
+    0003_schedule_delete_cached_results, change it in the django-q admin.
+
+    Parameters
+    ----------
+    minutes : int, optional
+        The time to live of the cached results in minutes.
+        The default is the NATURWB_CACHED_RESULTS_TTL setting or 20.
+    batch_size : int, optional
+        How many rows get deleted at once,
+        so the locks and the vacuum pressure stay small.
+        The default is the NATURWB_CACHED_RESULTS_DELETE_BATCH setting or 500.
+
+    Returns
+    -------
+    int
+        The number of deleted cached results.
+    """
+    if minutes is None:
+        minutes = getattr(settings, "NATURWB_CACHED_RESULTS_TTL", 20)
+    if batch_size is None:
+        batch_size = getattr(settings, "NATURWB_CACHED_RESULTS_DELETE_BATCH", 500)
+    expired = datetime.datetime.now(datetime.timezone.utc) \
+        - datetime.timedelta(minutes=minutes)
+
+    n_deleted = 0
+    while True:
+        uuids = list(
+            CachedResults.objects.filter(timestamp__lte=expired)
+            .values_list("uuid", flat=True)[:batch_size])
+        if len(uuids) == 0:
+            break
+        n_batch, _ = CachedResults.objects.filter(uuid__in=uuids).delete()
+        n_deleted += n_batch
+
+    logger.info("Deleted %d expired cached results.", n_deleted)
+    return n_deleted
@@ -1,3 +1,537 @@
-from django.test import TestCase
+from django.test import SimpleTestCase, TransactionTestCase
+from django.db import connection
+import os
+import tempfile
+import io
+import threading
+import time
+import zipfile
+import numpy as np
+import pandas as pd
+from shapely.geometry import Polygon
+import geopandas as gpd
+import shapely
+
+from .functions.naturwb import _simplify_for_map
+from .functions.synthetic import make_synthetic_query
+from .functions.naturwb_sql import prepare, unprepared
+from .functions.naturwb_agg import (
+    aggregate_levels, aggregate_levels_pandas,
+    renormalise_bfid_area, renormalise_bfid_area_loop)
+from .result_cache import (
+    ResultCache, PlotCache, geometry_key, query_fingerprint)
+from .cache_backends import LRUFileBasedCache
+from .zip_stream import (
+    stream_zip, csv_chunks, sql_csv_chunks, geo_members, parquet_chunks,
+    CSV_CHUNK_ROWS, GEO_FORMATS)
+from .downloads import get_download_data, _deduplicated
+from .input_bundles import (
+    _new_manifest, _write_part, _write_manifest, has_input_bundles,
+    read_sim_polygons, sim_paras_csv_chunks, encode_csv_rows)
 
 # Create your tests here.
+
+RES_AGG_COLS = ["n", "kap.A.", "et", "pet", "runoff",
+                "oa", "za", "za_gwnah", "tp"]
+
+
+class AggregationTests(SimpleTestCase):
+    def _levels_input(self, query, n_unresolved=0):
+        results = query.results.copy()
+        results["runoff"] = results["oa"] + results["za"]
+        results["za_gwnah"] = results["za"] * results["za_gwnah_flag"]
+        coef_lanu = (query.ref_lanus[["area"]] /
+                     query.ref_lanus[["area"]].groupby(["gen_id", "nat_id"]).sum()
+                     ).rename({"area": "coef"}, axis=1)
+
+        # drop some soil groups as if they were not resolved
+        if n_unresolved > 0:
+            gen_nat = coef_lanu.index.droplevel("lanu_id")
+            coef_lanu = coef_lanu[~gen_nat.isin(gen_nat.unique()[:n_unresolved])]
+
+        return dict(results=results,
+                    bfid_area_raw=query.results["bfid_area"],
+                    coef_lanu=coef_lanu,
+                    clip_area=query.sim_shps_clip["area"],
+                    res_agg_cols=RES_AGG_COLS)
+
+    def _assert_same(self, left, right):
+        if isinstance(left, pd.Series):
+            pd.testing.assert_series_equal(left, right)
+        else:
+            # rows with undefined ids are sorted differently
+            left, right = [
+                df.reset_index().sort_values(
+                    list(df.index.names) + list(df.columns)
+                    ).reset_index(drop=True)
+                for df in [left, right]]
+            pd.testing.assert_frame_equal(left, right, check_dtype=False)
+
+    def test_kernel_equals_pandas(self):
+        for kwargs in [dict(seed=0), dict(seed=1, n_sim=1000, n_nat=20),
+                       dict(seed=2, n_flagged=20)]:
+            query = make_synthetic_query(**kwargs)
+            for n_unresolved in [0, 5]:
+                with self.subTest(n_unresolved=n_unresolved, **kwargs):
+                    levels_input = self._levels_input(query, n_unresolved)
+                    expected = aggregate_levels_pandas(**levels_input)
+                    result = aggregate_levels(**levels_input)
+                    self.assertEqual(expected.keys(), result.keys())
+                    for name in expected:
+                        self._assert_same(expected[name], result[name])
+
+    def test_aggregate_results(self):
+        query = make_synthetic_query()
+        query._aggregate_results()
+        self.assertAlmostEqual(
+            query.naturwb_ref[["runoff_rel", "tp_rel", "et_rel"]].sum(), 1)
+        self.assertEqual(len(query.missing_lanus), 0)
+
+    def test_renormalise_equals_loop(self):
+        query = make_synthetic_query(n_flagged=50, seed=3)
+        bfid_area = query.results["bfid_area"]
+        pd.testing.assert_series_equal(
+            renormalise_bfid_area_loop(bfid_area),
+            renormalise_bfid_area(bfid_area))
+        self.assertTrue(np.allclose(
+            renormalise_bfid_area(bfid_area).groupby(
+                ["sim_id", "lanu_id"]).sum(), 100))
+
+
+class SqlTests(SimpleTestCase):
+    def test_prepare_once_per_session(self):
+        import sqlite3
+        import sqlalchemy
+        from sqlalchemy.pool import NullPool
+
+        class Session(sqlite3.Connection):
+            pass
+
+        class Wrapper(object):
+            # like aldjemy, a new wrapper of the same connection per checkout
+            def __init__(self, obj):
+                self.obj = obj
+
+            def __getattr__(self, attr):
+                if attr == "close":
+                    return lambda: None
+                return getattr(self.obj, attr)
+
+        session = sqlite3.connect(
+            ":memory:", check_same_thread=False, factory=Session)
+        engine = sqlalchemy.create_engine(
+            "sqlite://", poolclass=NullPool, creator=lambda: Wrapper(session))
+        prepared = []
+
+        @sqlalchemy.event.listens_for(
+            engine, "before_cursor_execute", retval=True)
+        def no_prepare(conn, cursor, statement, params, context, many):
+            # sqlite can't prepare statements, only count them
+            if statement.startswith("PREPARE"):
+                prepared.append(statement)
+                statement = "SELECT 1"
+            return statement, params
+
+        for _ in range(2):
+            with engine.connect() as con:
+                prepare(con, "sim_id_range")
+        self.assertEqual(len(prepared), 1)
+
+        # a new session prepares the statement again
+        session = sqlite3.connect(
+            ":memory:", check_same_thread=False, factory=Session)
+        with engine.connect() as con:
+            prepare(con, "sim_id_range")
+        self.assertEqual(len(prepared), 2)
+
+
+class ResultCacheTests(SimpleTestCase):
+    polygon = Polygon([(7.80, 47.99), (7.86, 47.99), (7.86, 48.03), (7.80, 48.03)])
+
+    def test_geometry_key(self):
+        key = geometry_key(self.polygon)
+        # other start point and orientation of the ring
+        self.assertEqual(
+            key,
+            geometry_key(Polygon(self.polygon.exterior.coords[::-1][1:])))
+        # differences below the grid size
+        self.assertEqual(
+            key,
+            geometry_key(Polygon([(x + 1e-7, y) for x, y in self.polygon.exterior.coords])))
+        self.assertNotEqual(
+            key,
+            geometry_key(Polygon([(x + 1e-3, y) for x, y in self.polygon.exterior.coords])))
+        self.assertNotEqual(key, geometry_key(self.polygon, exact_nolanu=True))
+
+    def test_get_query(self):
+        query = make_synthetic_query()
+        query._aggregate_results()
+        query.msgs = ["message"]
+
+        result_cache = ResultCache(alias="default")
+        result_cache.reset_stats()
+        result_cache.set(geometry_key(self.polygon), query.get_state())
+        cached_query, from_cache = result_cache.get_query(self.polygon)
+
+        self.assertTrue(from_cache)
+        self.assertEqual(result_cache.stats(), {"hits": 1, "misses": 0})
+        pd.testing.assert_series_equal(
+            cached_query.naturwb_ref, query.naturwb_ref)
+        self.assertEqual(cached_query.msgs, ["message"])
+
+    def test_result_plots(self):
+        query = make_synthetic_query()
+        query._aggregate_results()
+        query.msgs = []
+        query._set_urban_shp(self.polygon, "EPSG:4326")
+
+        result_cache = ResultCache(alias="default")
+        result_cache.set_result("uuid", query)
+        restored = result_cache.get_result("uuid")
+        self.assertIsNone(result_cache.get_result("other"))
+        pd.testing.assert_series_equal(restored.naturwb_ref, query.naturwb_ref)
+        self.assertAlmostEqual(restored.urban_shp.area, query.urban_shp.area)
+
+        self.assertEqual(result_cache.get_fingerprint("uuid"),
+                         query_fingerprint(query))
+
+    def test_plot_cache(self):
+        query = make_synthetic_query()
+        query._aggregate_results()
+        query._set_urban_shp(self.polygon, "EPSG:4326")
+        fingerprint = query_fingerprint(query)
+
+        plot_cache = PlotCache(alias="default")
+        plot_cache.set(fingerprint, "pie", "png", dpi=75)
+        self.assertEqual(plot_cache.get(fingerprint, "pie"), "png")
+        self.assertIsNone(plot_cache.get(fingerprint, "pie", dpi=100))
+        # cached plots don't get rendered again
+        plots, _ = plot_cache.plot_web_many(
+            query, {"plot_pie": ("pie", {})})
+        self.assertEqual(plots, {"plot_pie": "png"})
+
+        other = make_synthetic_query(seed=1)
+        other._aggregate_results()
+        other._set_urban_shp(self.polygon, "EPSG:4326")
+        self.assertNotEqual(fingerprint, query_fingerprint(other))
+
+    def test_lru_max_size(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            cache = LRUFileBasedCache(
+                tmp_dir, {"OPTIONS": {"MAX_SIZE": 35000}})
+            for i in range(4):
+                cache.set(i, os.urandom(10000))
+                os.utime(cache._key_to_file(i), (i, i))
+            cache.get(0)
+            # the cache is culled before the new entry gets written
+            # down to 2/3 of MAX_SIZE (CULL_FREQUENCY = 3)
+            cache.set(4, os.urandom(10000))
+            self.assertEqual(
+                [i for i in range(5) if cache.has_key(i)], [0, 3, 4])
+            # the size is tracked without scanning the files again
+            size = sum(os.path.getsize(cache._key_to_file(i)) for i in [0, 3, 4])
+            self.assertEqual(cache._size, size)
+            size -= os.path.getsize(cache._key_to_file(3))
+            cache.delete(3)
+            self.assertEqual(cache._size, size)
+
+    def test_plot_data(self):
+        query = make_synthetic_query()
+        query._aggregate_results()
+        query._set_urban_shp(self.polygon, "EPSG:4326")
+
+        data = PlotCache(alias="default").plot_data(query, "sankey")
+        self.assertAlmostEqual(data["za"], data["za_oa"] + data["za_gwnah"],
+                               delta=0.11)
+        self.assertAlmostEqual(sum(query.plot_data("pie").values()), 1,
+                               places=3)
+
+
+class MapTests(SimpleTestCase):
+    def test_simplify_for_map(self):
+        # two neighbours with a noisy shared edge
+        rng = np.random.default_rng(0)
+        xs = np.linspace(7.8, 7.9, 2001)
+        edge = list(zip(xs, 48 + rng.normal(0, 1e-5, xs.size)))
+        geoms = gpd.GeoSeries([
+            Polygon(edge + [(7.9, 47.95), (7.8, 47.95)]),
+            Polygon(edge[::-1] + [(7.8, 48.05), (7.9, 48.05)])], crs=4326)
+
+        simple = _simplify_for_map(geoms, 1e-4, decimals=6)
+        self.assertLess(shapely.get_num_coordinates(simple.values).sum(),
+                        shapely.get_num_coordinates(geoms.values).sum() / 10)
+        # no gaps or overlaps between the neighbours
+        self.assertAlmostEqual(
+            simple.iloc[0].intersection(simple.iloc[1]).area, 0)
+        self.assertAlmostEqual(simple.unary_union.area, geoms.unary_union.area)
+        coords = shapely.get_coordinates(simple.values)
+        np.testing.assert_array_equal(coords, np.round(coords, 6))
+
+    def test_map_data(self):
+        query = make_synthetic_query()
+        query._set_urban_shp(ResultCacheTests.polygon, "EPSG:4326")
+        data = query.plot_data("map")
+        np.testing.assert_allclose(
+            data["bounds"], ResultCacheTests.polygon.bounds, atol=1e-6)
+        self.assertEqual(data["urban"]["features"][0]["geometry"]["type"],
+                         "Polygon")
+
+
+class PlotTests(SimpleTestCase):
+    def test_plot_web_releases_figures(self):
+        from matplotlib import pyplot as plt
+        query = make_synthetic_query()
+        query._aggregate_results()
+
+        for kind in ["sankey", "pie"]:
+            self.assertTrue(query.plot_web(kind).startswith("data:image/png"))
+            self.assertFalse(hasattr(query, "fig_" + kind))
+        from .functions.naturwb_plot import MPL_WEB_FORMATS, MPL_WEB_FORMAT
+        self.assertTrue(query.plot_web("pie", fmt="web").startswith(
+            "data:" + MPL_WEB_FORMATS[MPL_WEB_FORMAT]))
+        query.plot_web("pie", keep=True)
+        self.assertTrue(hasattr(query, "fig_pie"))
+        # no figures in the global state of pyplot
+        self.assertEqual(plt.get_fignums(), [])
+
+    def test_plot_web_many_fallback(self):
+        from .functions import naturwb
+        query = make_synthetic_query()
+        query._aggregate_results()
+        # a state that can't get pickled for the worker process
+        query.lock = threading.Lock()
+        process_kinds = naturwb._PROCESS_KINDS
+        naturwb._PROCESS_KINDS = {"pie": ["naturwb_ref", "lock"]}
+        try:
+            plots, times = query.plot_web_many(dict(pie=("pie", {})))
+        finally:
+            naturwb._PROCESS_KINDS = process_kinds
+        self.assertTrue(plots["pie"].startswith("data:image/png"))
+        self.assertIn("pie", times)
+
+
+class DownloadTests(SimpleTestCase):
+    def test_stream_zip(self):
+        produced = []
+        def members():
+            gdf = gpd.GeoDataFrame(
+                {"sim_id": [1, 2]},
+                geometry=[ResultCacheTests.polygon] * 2, crs=4326)
+            produced.append("results")
+            yield from geo_members(gdf, "input/Modellgebiete")
+            produced.append("csv")
+            yield ("input/Simulations-Parameter.csv", csv_chunks(
+                [pd.DataFrame({"sim_id": [1, 2]}), pd.DataFrame({"sim_id": [3]})],
+                index=False))
+            yield "weather_stations/1.zip", [b"PK" * 100], zipfile.ZIP_STORED
+            yield "README.txt", ["Erläuterung".encode("iso-8859-1")]
+
+        chunks = stream_zip(members())
+        first = next(chunks)
+        # the members are made while streaming
+        self.assertTrue(first.startswith(b"PK"))
+        self.assertEqual(produced, ["results"])
+
+        with zipfile.ZipFile(io.BytesIO(first + b"".join(chunks))) as zip_file:
+            self.assertIsNone(zip_file.testzip())
+            self.assertIn("input/Modellgebiete.shp", zip_file.namelist())
+            self.assertEqual(
+                zip_file.read("input/Simulations-Parameter.csv"),
+                b"sim_id\n1\n2\n3\n")
+            self.assertEqual(zip_file.read("README.txt").decode("iso-8859-1"),
+                             "Erläuterung")
+            # the compressed members are stored as they are
+            info = zip_file.getinfo("weather_stations/1.zip")
+            self.assertEqual(info.compress_type, zipfile.ZIP_STORED)
+            self.assertEqual(zip_file.read(info), b"PK" * 100)
+            self.assertEqual(
+                zip_file.getinfo("README.txt").compress_type,
+                zipfile.ZIP_DEFLATED)
+            # zip64, as the sizes are unknown while streaming
+            self.assertGreaterEqual(info.extract_version, zipfile.ZIP64_VERSION)
+
+    def test_unprepared(self):
+        sql = str(unprepared("sim_paras"))
+        self.assertNotIn("$", sql)
+        self.assertIn("ANY(CAST(:sim_ids AS integer[]))", sql)
+
+    def test_geo_formats(self):
+        # like the results per soil group
+        gdf = gpd.GeoDataFrame(
+            {"Boden_kurz": ["Lehm", "Sand"]},
+            index=pd.MultiIndex.from_tuples(
+                [(1, 10, 5), (2, 11, 5)], names=["sim_id", "gen_id", "nat_id"]),
+            geometry=[ResultCacheTests.polygon] * 2, crs=4326).to_crs(25832)
+        columns = {}
+        for fmt, (_, suffix, _) in GEO_FORMATS.items():
+            with self.subTest(fmt=fmt):
+                chunks = stream_zip(geo_members(gdf, "results", fmt))
+                with tempfile.TemporaryDirectory() as tmp_dir:
+                    with zipfile.ZipFile(io.BytesIO(b"".join(chunks))) as zip_file:
+                        zip_file.extractall(tmp_dir)
+                    path = os.path.join(tmp_dir, "results" + suffix)
+                    if fmt == "parquet":
+                        restored = gpd.read_parquet(path)
+                    else:
+                        restored = gpd.read_file(path)
+                self.assertEqual(restored.crs, gdf.crs)
+                self.assertEqual(list(restored["Boden_kurz"]), ["Lehm", "Sand"])
+                self.assertEqual(list(restored["gen_id"]), [10, 11])
+                self.assertAlmostEqual(restored.area.sum(), gdf.area.sum())
+                columns[fmt] = sorted(restored.columns)
+        # the same columns in every format
+        self.assertEqual(len(set(map(tuple, columns.values()))), 1, columns)
+
+    def test_parquet_chunks(self):
+        gdf = gpd.GeoDataFrame(
+            {"sim_id": range(25)},
+            geometry=[ResultCacheTests.polygon] * 25, crs=4326)
+        chunks = list(parquet_chunks(gdf, chunk_rows=10))
+        # a chunk for every row group and the footer
+        self.assertEqual(len(chunks), 4)
+        restored = gpd.read_parquet(io.BytesIO(b"".join(chunks)))
+        self.assertEqual(list(restored["sim_id"]), list(range(25)))
+        self.assertEqual(restored.crs, gdf.crs)
+
+    def test_input_bundles(self):
+        sim_ids = np.arange(1, 30)
+        polygons = gpd.GeoDataFrame(
+            {"sim_id": sim_ids},
+            geometry=[Polygon([(i, 0), (i + 1, 0), (i + 1, 1)]) for i in sim_ids],
+            crs=25832).rename_geometry("geom")
+        paras = pd.DataFrame({
+            "sim_id": sim_ids.repeat(2),
+            "lanu_id": np.tile([2, 5], len(sim_ids)),
+            "name": ["Acker, \"trocken\""] * 2 * len(sim_ids),
+            "value": np.linspace(0, 1, 2 * len(sim_ids))})
+
+        with tempfile.TemporaryDirectory() as bundle_dir:
+            self.assertFalse(has_input_bundles(bundle_dir))
+            self.assertIsNone(read_sim_polygons([3], bundle_dir=bundle_dir))
+            self.assertIsNone(sim_paras_csv_chunks([3], bundle_dir=bundle_dir))
+            manifest = _new_manifest(bundle_dir, size=10)
+            for part in range(3):
+                _write_part(
+                    bundle_dir, part, manifest,
+                    polygons=polygons[polygons["sim_id"] // 10 == part],
+                    paras=paras[paras["sim_id"] // 10 == part])
+            _write_manifest(bundle_dir, manifest)
+            self.assertTrue(has_input_bundles(bundle_dir))
+
+            selected = [3, 25, 12, 14]
+            gdf = read_sim_polygons(selected, bundle_dir=bundle_dir)
+            self.assertEqual(sorted(gdf["sim_id"]), sorted(selected))
+            self.assertEqual(gdf.crs, polygons.crs)
+            expected = paras[paras["sim_id"].isin(selected)].to_csv(
+                index=False).encode("utf8")
+            csv = b"".join(sim_paras_csv_chunks(selected, bundle_dir=bundle_dir))
+            self.assertEqual(csv, expected)
+
+            # the opened partitions are read completely during a swap
+            chunks = sim_paras_csv_chunks(selected, bundle_dir=bundle_dir)
+            os.rename(bundle_dir + "/paras", bundle_dir + "/paras.old")
+            self.assertEqual(b"".join(chunks), expected)
+
+            # a missing partition of the manifest is an error, no gap
+            with self.assertRaises(FileNotFoundError):
+                sim_paras_csv_chunks(selected, bundle_dir=bundle_dir)
+            os.remove(os.path.join(bundle_dir, "polygons", "part=2.parquet"))
+            with self.assertRaises(FileNotFoundError):
+                read_sim_polygons(selected, bundle_dir=bundle_dir)
+            # partitions without simulations are not in the manifest
+            self.assertEqual(
+                len(read_sim_polygons([3, 45], bundle_dir=bundle_dir)), 1)
+
+            # a half written manifest means no bundles
+            with open(os.path.join(bundle_dir, "manifest.json"), "w") as f:
+                f.write('{"version": ')
+            self.assertFalse(has_input_bundles(bundle_dir))
+            self.assertIsNone(read_sim_polygons(selected, bundle_dir=bundle_dir))
+
+    def test_encode_csv_rows(self):
+        # the same floats as writing the whole DataFrame
+        df = pd.DataFrame({"a": [1, np.nan], "b": [0.1 + 0.2, 1 / 3]})
+        header, rows = encode_csv_rows(df)
+        self.assertEqual(header + b"".join(rows),
+                         df.to_csv(index=False).encode("utf8"))
+
+    def test_get_download_data(self):
+        query = make_synthetic_query()
+        query._aggregate_results()
+        query.msgs = ["message"]
+        query.sim_infos["stat_id"] = query.sim_infos.index % 3
+        query.sim_shps_clip = gpd.GeoDataFrame(
+            query.sim_shps_clip.assign(
+                leg_tkle_txt="Braunerde", leg_tkle_kurz="BB", color="#a0c8f0"),
+            geometry=[ResultCacheTests.polygon] * len(query.sim_shps_clip),
+            crs=4326)
+        query._set_urban_shp(ResultCacheTests.polygon, "EPSG:4326")
+        result_cache = ResultCache(alias="default")
+        result_cache.set_result("download-uuid", query)
+
+        res_gen, stat_ids, msgs = get_download_data(
+            cache_uuid="download-uuid", result_cache=result_cache)
+        self.assertEqual(len(res_gen), len(query.get_results_genid()))
+        self.assertEqual(sorted(stat_ids), [0, 1, 2])
+        self.assertEqual(msgs, ["message"])
+
+        # the recent downloads are kept in memory
+        result_cache.cache.clear()
+        self.assertIs(
+            get_download_data(cache_uuid="download-uuid")[0], res_gen)
+
+    def test_get_download_data_legacy_row(self):
+        from unittest import mock
+        import pickle
+        import zlib
+        from .models import CachedResults
+        # a row pickled before the results were saved as GeoParquet
+        legacy = CachedResults(
+            results_genid=zlib.compress(pickle.dumps(pd.DataFrame())),
+            stat_ids=zlib.compress(pickle.dumps([1])),
+            messages=zlib.compress(b"[]"))
+        with mock.patch.object(CachedResults.objects, "get",
+                               return_value=legacy):
+            with self.assertLogs("naturwb.downloads", level="WARNING"):
+                self.assertIsNone(get_download_data(
+                    cache_uuid="legacy-uuid",
+                    result_cache=ResultCache(alias="default")))
+
+    def test_deduplicated(self):
+        calls = []
+        def compute():
+            calls.append(1)
+            time.sleep(0.2)
+            return len(calls)
+
+        results = []
+        threads = [
+            threading.Thread(
+                target=lambda: results.append(_deduplicated("key", compute)))
+            for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(calls, [1])
+        self.assertEqual(results, [1] * 4)
+        # afterwards it gets computed again
+        self.assertEqual(_deduplicated("key", compute), 2)
+
+
+class DownloadDatabaseTests(TransactionTestCase):
+    databases = {"default"}
+
+    def test_sql_csv_chunks(self):
+        # the fallback of the input bundles, not in a transaction like TestCase
+        from aldjemy.core import get_engine
+        import sqlalchemy
+        n = CSV_CHUNK_ROWS + 5
+        chunks = sql_csv_chunks(
+            get_engine(), sqlalchemy.text("SELECT generate_series(1, :n) AS i"),
+            params=dict(n=n), index=False)
+        self.assertEqual(
+            b"".join(chunks),
+            ("i\n" + "".join("{}\n".format(i) for i in range(1, n + 1))
+             ).encode("utf8"))
+        self.assertTrue(connection.get_autocommit())
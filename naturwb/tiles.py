@@ -0,0 +1,59 @@
+"""The vector tiles of the soil groups and NRE for the map of the result page.
+
+The map of the result page only overlays the urban polygon on these tiles,
+so the polygons of a region are sent once and get cached by the browser
+and every query in the same region shares them.
+The tiles are made by PostGIS (ST_AsMVT, see naturwb_sql.TILE_SQL)
+and saved in the tile cache (NATURWB_TILE_CACHE in the settings).
+Increase NATURWB_TILE_VERSION after an update of the simulation polygons.
+"""
+from django.conf import settings
+from django.core.cache import caches
+from aldjemy.core import get_engine
+
+from .functions.naturwb_sql import prepare
+
+TILE_CACHE = getattr(settings, "NATURWB_TILE_CACHE", "naturwb_tiles")
+TILE_CACHE_TTL = getattr(settings, "NATURWB_TILE_CACHE_TTL", None)
+TILE_VERSION = getattr(settings, "NATURWB_TILE_VERSION", 1)
+TILE_MIN_ZOOM = getattr(settings, "NATURWB_TILE_MIN_ZOOM", 8)
+TILE_MAX_ZOOM = getattr(settings, "NATURWB_TILE_MAX_ZOOM", 14)
+TILE_MAX_AGE = getattr(settings, "NATURWB_TILE_MAX_AGE", 60*60*24*7)
+
+
+def is_valid_tile(z, x, y):
+    """Check if the tile exists and is in the served zoom levels."""
+    return (TILE_MIN_ZOOM <= z <= TILE_MAX_ZOOM and
+            0 <= x < 2**z and 0 <= y < 2**z)
+
+
+def get_tile(z, x, y, db_engine=None):
+    """Get a vector tile from the cache or the database.
+
+    Parameters
+    ----------
+    z, x, y : int
+        The zoom level and the column and row of the tile.
+    db_engine : sqlalchemy.engine, optional.
+        The database engine to the NatUrWB database.
+        The default is None, which uses the engine of the django database.
+
+    Returns
+    -------
+    bytes
+        The mapbox vector tile with the layers "soils" and "nre".
+        Empty if there are no polygons in the tile.
+    """
+    cache = caches[TILE_CACHE]
+    key = "naturwb_tile:{version}:{z}:{x}:{y}".format(
+        version=TILE_VERSION, z=z, x=x, y=y)
+    tile = cache.get(key)
+    if tile is None:
+        if db_engine is None:
+            db_engine = get_engine()
+        with db_engine.connect() as con:
+            tile = con.execute(
+                prepare(con, "tile"), dict(z=z, x=x, y=y)).scalar()
+        tile = b"" if tile is None else bytes(tile)
+        cache.set(key, tile, timeout=TILE_CACHE_TTL)
+    return tile
@@ -21,6 +21,11 @@ from .views import (
     get_ref_view,
     home_view,
     result_view,
+    result_job_view,
+    result_status_view,
+    result_plot_view,
+    result_data_view,
+    tile_view,
     method_view,
     impressum_view,
     result_download,
@@ -34,6 +39,11 @@ urlpatterns = [
     path('', home_view, name="home"),
     path('get_ref/', get_ref_view, name='get_reference'),
     path('get_ref/result/', result_view, name='Ergebnis der NatUrWB Referenz'),
+    path('get_ref/result/<str:job_id>/', result_job_view, name='result_job'),
+    path('get_ref/result/<str:job_id>/status/', result_status_view, name='result_status'),
+    path('result/<uuid:cache_uuid>/plot/<str:kind>/', result_plot_view, name='result_plot'),
+    path('result/<uuid:cache_uuid>/data/<str:kind>/', result_data_view, name='result_data'),
+    path('tiles/<int:z>/<int:x>/<int:y>.mvt', tile_view, name='tiles'),
     path('download_result/', result_download, name='download_result'),
     path('method/', method_view, name='method'),
     path('impressum/', impressum_view, name="impressum"),
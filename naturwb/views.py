@@ -1,4 +1,5 @@
 from django.shortcuts import render
+from django.conf import settings
 from .forms import EnterPolygonForm
 from django.contrib.gis.geos import GEOSGeometry
 from aldjemy.core import get_engine
@@ -9,20 +10,32 @@ import traceback
 from django.shortcuts import redirect
 from .models import NaturwbSettings, CachedResults
 from .functions.naturwb_db import results_to_db
+from .functions.naturwb_sql import prepare, unprepared, ids
+from .result_cache import ResultCache, PlotCache, RESULT_CACHE_TTL
+from .jobs import submit_result_job, get_job, JOB_STAGES
+from .downloads import get_download_data
+from .input_bundles import (
+    read_sim_polygons, sim_paras_csv_chunks)
+from .tiles import (
+    get_tile, is_valid_tile, TILE_MIN_ZOOM, TILE_MAX_ZOOM, TILE_MAX_AGE)
 from django.views.decorators.csrf import csrf_protect
 from django.views.decorators.http import require_POST
 import geopandas as gpd
-import pandas as pd
 
 # for result_download
-import tempfile
 from pathlib import Path
 import zipfile
-from django.http import StreamingHttpResponse
-from django.core.files import File
-import io
+from .zip_stream import (
+    stream_zip, file_chunks, sql_csv_chunks, geo_members, GEO_FORMATS)
+from django.http import (
+    StreamingHttpResponse, JsonResponse, HttpResponse, Http404)
+from django.utils.cache import (
+    patch_cache_control, set_response_etag, get_conditional_response)
+from django.urls import reverse
 import datetime
 import textwrap
+import base64
+import uuid
 from geodjango.settings import DEBUG
 
 
@@ -35,7 +48,115 @@ context_base = {
     'wartungsmodus': Wartungsmodus(),
     'debug': DEBUG}
 
+def get_setting(name, default):
+    """Get a value from the naturwb_settings table or the default if not set."""
+    try:
+        return NaturwbSettings.objects.get(pk=name).value
+    except NaturwbSettings.DoesNotExist:
+        return default
+
+def make_query(urban_shp, progress=None):
+    """Make the NatUrWB query or get it from the result cache."""
+    query_kwargs = dict(
+        single_query=get_setting("single_query", True),
+        precomputed_lanus=get_setting("precomputed_lanus", True),
+        exact_nolanu=get_setting("exact_nolanu", False),
+        progress=progress)
+    if get_setting("result_cache", True):
+        nwbquery, _ = ResultCache().get_query(
+            urban_shp=urban_shp, db_engine=get_engine(), **query_kwargs)
+    else:
+        nwbquery = NWBQuery(
+            urban_shp=urban_shp, db_engine=get_engine(), do_plots=False,
+            **query_kwargs)
+    return nwbquery
+
+# the plots of the result page as name: (kind, kwargs)
+RESULT_PLOTS = {
+    "plot_sim_shps_clip_plotly": ("sim_shps_clip_plotly", dict(
+        simplify_px=getattr(settings, "NATURWB_MAP_SIMPLIFY_PX", 0.5),
+        decimals=getattr(settings, "NATURWB_MAP_DECIMALS", 6))),
+    # "plot_pie": ("pie", dict(figsize=(7, 7))),
+    "plot_pie_plotly": ("pie_plotly", {}),
+    "plot_sankey": ("sankey", dict(figsize=(17,17), cex=1.5, fmt="web")),
+    "plot_ternary": ("ternary", dict(width=1000, do_size=True)),
+    "plot_pie_lanu": ("pie_landuse", {}),
+    }
+RESULT_PLOT_KWARGS = {kind: kwargs for kind, kwargs in RESULT_PLOTS.values()}
+# the plots that get rendered in the browser from their data
+RESULT_DATA_PLOTS = ["sankey", "pie", "pie_landuse", "map"]
+
+def get_result_context(nwbquery, urban_geom):
+    """Create the context of the result page.
+
+    With the lazy_plots setting, the page only gets the headline numbers
+    and every plot is loaded from result_plot_view afterwards.
+    Otherwise all the plots are rendered concurrently.
+    """
+    cache_uuid = uuid.uuid4()
+    context = {
+        "messages": nwbquery.msgs,
+        "success": True,
+        "et_rel": "{:.0%}".format(nwbquery.naturwb_ref["et_rel"]).replace('%', ' %'),
+        "a_rel": "{:.0%}".format(nwbquery.naturwb_ref["runoff_rel"]).replace('%', ' %'),
+        "tp_rel": "{:.0%}".format(nwbquery.naturwb_ref["tp_rel"]).replace('%', ' %'),
+        "n_natids": len(nwbquery.sim_shps_clip.index.get_level_values("nat_id").unique()),
+        "urban_geom": urban_geom,
+        "cache_uuid": cache_uuid,
+        "cached": False,
+        "lazy_plots": get_setting("lazy_plots", True),
+        "geo_format_names": GEO_FORMAT_NAMES,
+        }
+    # the map from the shared vector tiles, only with the lazy plots
+    context["tile_map"] = (
+        context["lazy_plots"] and get_setting("tile_map", False))
+    if context["tile_map"]:
+        context.update({
+            "tile_url": reverse("tiles", kwargs=dict(z=0, x=0, y=0)
+                                ).replace("/0/0/0.", "/{z}/{x}/{y}."),
+            "tile_min_zoom": TILE_MIN_ZOOM,
+            "tile_max_zoom": TILE_MAX_ZOOM})
+
+    if context["lazy_plots"]:
+        ResultCache().set_result(cache_uuid, nwbquery)
+    else:
+        plots, timings = PlotCache().plot_web_many(nwbquery, RESULT_PLOTS)
+        if DEBUG:
+            print("Plot rendering times: " + ", ".join(
+                ["{name}: {time:.2f} s".format(name=name, time=time)
+                 for name, time in timings.items()]))
+        context.update(plots)
+
+    return context
+
+def save_result(nwbquery, context):
+    """Save the results to the database and to the cache for the download."""
+    try:
+        # save the landuse results to the database
+        try:
+            if NaturwbSettings.objects.get(pk="save_to_db").value:
+                results_to_db(nwbquery)
+        except NaturwbSettings.DoesNotExist:
+            print("No setting parameter 'save_to_db' in the naturwb_settings table in the database")
+
+        # save the results to the caching table in the database
+        if NaturwbSettings.objects.get(pk="cache_result_to_db"):
+            cache = CachedResults.objects.create_cache(
+                results_genid=nwbquery.get_results_genid(),
+                stat_ids=nwbquery.sim_infos["stat_id"].unique(),
+                messages=nwbquery.msgs,
+                cache_uuid=context["cache_uuid"]
+            )
+            context.update({"cache_uuid": cache.uuid, "cached":True})
+    except Exception as ex:
+        print(ex)
+        print(traceback.format_exc())
+
 APP_DIR = Path(__file__).parent
+WEATHER_ZIP_DIR = APP_DIR.joinpath("data/weather_zips/")
+GEO_FORMAT_NAMES = {
+    "shp": "Shapefile", "gpkg": "GeoPackage",
+    "fgb": "FlatGeobuf", "parquet": "GeoParquet"}
 with open(APP_DIR.joinpath("data/README-part-Input.txt"), encoding="iso-8859-1") as f:
     README_PART_INPUT = f.read()
 with open(APP_DIR.joinpath("data/README-part-results.txt"), encoding="iso-8859-1") as f:
@@ -88,28 +209,16 @@ def result_view(request, *args, **kwargs):
     if urban_geom.transform(25832, True).area > 1e9:
         return redirect("/get_ref/?error_biggeom=True")
 
+    # make the naturwb query in the task queue
+    if get_setting("async_result", False):
+        job_id = submit_result_job(request.POST['geom'])
+        return redirect("result_job", job_id=job_id)
+
     # make naturwb query
     try:
-        nwbquery = NWBQuery(
-            urban_shp=wkt_loads(urban_geom.wkt),
-            db_engine=get_engine(),
-            do_plots=False)
-
+        nwbquery = make_query(wkt_loads(urban_geom.wkt))
         context = {
-            "messages": nwbquery.msgs,
-            "success": True,
-            "plot_sim_shps_clip_plotly": nwbquery.plot_web("sim_shps_clip_plotly"),
-            # "plot_pie": nwbquery.plot_web("pie", figsize=(7, 7)),
-            "plot_pie_plotly": nwbquery.plot_web("pie_plotly"),
-            "plot_sankey": nwbquery.plot_web("sankey", figsize=(17,17), cex=1.5),
-            "plot_ternary": nwbquery.plot_web("ternary", width=1000, do_size=True),
-            "plot_pie_lanu": nwbquery.plot_web("pie_landuse"),
-            "et_rel": "{:.0%}".format(nwbquery.naturwb_ref["et_rel"]).replace('%', ' %'),
-            "a_rel": "{:.0%}".format(nwbquery.naturwb_ref["runoff_rel"]).replace('%', ' %'),
-            "tp_rel": "{:.0%}".format(nwbquery.naturwb_ref["tp_rel"]).replace('%', ' %'),
-            "n_natids": len(nwbquery.sim_shps_clip.index.get_level_values("nat_id").unique()),
-            "urban_geom": request.POST['geom'],
-            "cached": False,
+            **get_result_context(nwbquery, request.POST['geom']),
             **context_base
             }
 
@@ -123,48 +232,112 @@ def result_view(request, *args, **kwargs):
         return render(request, "result.html", context)
 
     # save the results to DB
-    try:
-        # save the landuse results to the database
-        try:
-            if NaturwbSettings.objects.get(pk="save_to_db").value:
-                results_to_db(nwbquery)
-        except NaturwbSettings.DoesNotExist:
-            print("No setting parameter 'save_to_db' in the naturwb_settings table in the database")
-
-        # save the results to the caching table in the database
-        if NaturwbSettings.objects.get(pk="cache_result_to_db"):
-            cache = CachedResults.objects.create_cache(
-                results_genid=nwbquery.get_results_genid(),
-                stat_ids=nwbquery.sim_infos["stat_id"].unique(),
-                messages=nwbquery.msgs
-            )
-            context.update({"cache_uuid": cache.uuid, "cached":True})
-    except Exception as ex:
-        print(ex)
-        print(traceback.format_exc())
+    save_result(nwbquery, context)
 
     return render(request, "result.html", context)
 
+def result_job_view(request, job_id, *args, **kwargs):
+    job = get_job(job_id)
+    if job is None:
+        return redirect("/get_ref/")
+
+    if job["stage"] in ["done", "failed"]:
+        return render(request, "result.html", {**job["context"], **context_base})
+    else:
+        context = {
+            "job_id": job_id,
+            "stage_name": JOB_STAGES[job["stage"]],
+            **context_base
+        }
+        return render(request, "result_wait.html", context)
+
+def result_status_view(request, job_id, *args, **kwargs):
+    job = get_job(job_id)
+    if job is None:
+        raise Http404("Unbekannter Auftrag")
+
+    return JsonResponse({
+        "stage": job["stage"],
+        "stage_name": JOB_STAGES[job["stage"]],
+        "done": job["stage"] in ["done", "failed"]})
+
+def result_plot_view(request, cache_uuid, kind, *args, **kwargs):
+    if kind not in RESULT_PLOT_KWARGS:
+        raise Http404("Unbekannte Grafik")
+    plot_kwargs = RESULT_PLOT_KWARGS[kind]
+
+    # get the plot from the cache or render it from the saved query
+    result_cache = ResultCache()
+    plot_cache = PlotCache()
+    fingerprint = result_cache.get_fingerprint(cache_uuid)
+    if fingerprint is None:
+        raise Http404("Das Ergebnis ist nicht mehr verfügbar")
+    plot = plot_cache.get(fingerprint, kind, **plot_kwargs)
+    if plot is None:
+        nwbquery = result_cache.get_result(cache_uuid, db_engine=get_engine())
+        if nwbquery is None:
+            raise Http404("Das Ergebnis ist nicht mehr verfügbar")
+        plot = plot_cache.plot_web(
+            nwbquery, kind, fingerprint=fingerprint, **plot_kwargs)
+
+    if plot.startswith("data:"):
+        # the image of a matplotlib plot as data URI
+        header, graphic = plot.split(",", 1)
+        response = HttpResponse(
+            base64.b64decode(graphic),
+            content_type=header[len("data:"):].split(";")[0])
+    else:
+        response = HttpResponse(plot)
+    # the plots of a result never change
+    patch_cache_control(response, private=True, max_age=RESULT_CACHE_TTL)
+    return response
+
+def result_data_view(request, cache_uuid, kind, *args, **kwargs):
+    if kind not in RESULT_DATA_PLOTS:
+        raise Http404("Unbekannte Grafik")
+
+    # get the data from the cache or from the saved query
+    result_cache = ResultCache()
+    plot_cache = PlotCache()
+    fingerprint = result_cache.get_fingerprint(cache_uuid)
+    if fingerprint is None:
+        raise Http404("Das Ergebnis ist nicht mehr verfügbar")
+    data = plot_cache.get(fingerprint, "data_" + kind)
+    if data is None:
+        nwbquery = result_cache.get_result(cache_uuid, db_engine=get_engine())
+        if nwbquery is None:
+            raise Http404("Das Ergebnis ist nicht mehr verfügbar")
+        data = plot_cache.plot_data(nwbquery, kind, fingerprint=fingerprint)
+
+    response = JsonResponse(data)
+    patch_cache_control(response, private=True, max_age=RESULT_CACHE_TTL)
+    return response
+
+def tile_view(request, z, x, y, *args, **kwargs):
+    if not is_valid_tile(z, x, y):
+        raise Http404("Unbekannte Kachel")
+
+    response = HttpResponse(
+        get_tile(z, x, y), content_type="application/vnd.mapbox-vector-tile")
+    # the tiles are shared by all users
+    patch_cache_control(response, public=True, max_age=TILE_MAX_AGE)
+    set_response_etag(response)
+    return get_conditional_response(
+        request, etag=response["ETag"], response=response)
+
 @csrf_protect
 @require_POST
 def result_download(request, *args, **kwargs):
-    # get results from cache
-    try:
-        if "cache_uuid" in request.POST:
-            res_gen, stat_ids, msgs = CachedResults.objects.get_cache(
-                uuid=request.POST["cache_uuid"])
-        else:
-            raise Exception("No Cache found")
-    except:
-        if "urban_geom" in request.POST:
-            urban_geom = GEOSGeometry(request.POST['urban_geom'])
-            nwbquery = NWBQuery(
-                urban_shp=wkt_loads(urban_geom.wkt),
-                db_engine=get_engine(),
-                do_plots=False)
-            res_gen = nwbquery.get_results_genid()
-            stat_ids = nwbquery.sim_infos["stat_id"].unique()
-            msgs = nwbquery.msgs
+    # get the results from the caches or compute them again
+    urban_shp = None
+    if "urban_geom" in request.POST:
+        urban_shp = wkt_loads(GEOSGeometry(request.POST['urban_geom']).wkt)
+    download_data = get_download_data(
+        cache_uuid=request.POST.get("cache_uuid"), urban_shp=urban_shp)
+    if download_data is None:
+        raise Http404(
+            "Das Ergebnis ist nicht mehr vorhanden. Bitte starten Sie die Abfrage erneut.")
+    res_gen, stat_ids, msgs = download_data
 
     # wrap messages
     new_msgs = []
@@ -172,84 +345,93 @@ def result_download(request, *args, **kwargs):
     for msg in msgs:
         new_msgs.append(" - " + "\n   ".join(wrapper.wrap(msg)))
 
+    # the format of the geodata
+    geo_format = request.POST.get("geo_format", "shp")
+    if geo_format not in GEO_FORMATS:
+        geo_format = "shp"
+
     # create README.txt
-    with tempfile.TemporaryDirectory() as tmp_dir:
-        # create results shape file
-        tmp_dir_fp = Path(tmp_dir).joinpath("temp")
-        tmp_dir_fp.mkdir()
+    readme = (
+        "# README  #\n###########\n" +
+        "Diese Datei soll das Ergebnis etwas erläutern und beschreiben.\n\n")
+    if geo_format != "shp":
+        readme += (
+            "Die Geodaten sind im Format {name} gespeichert (Dateiendung \"{suffix}\"). ".format(
+                name=GEO_FORMAT_NAMES[geo_format], suffix=GEO_FORMATS[geo_format][1]) +
+            "Die Beschreibungen der Shape-Dateien gelten für diese Dateien entsprechend.\n\n")
+    if "add_input" in request.POST:
+        readme += README_PART_INPUT
+    if "add_weather" in request.POST:
+        readme += (
+            "\n# /weather_stations/\n###################\n" +
+            "Im Ordner \"weather_stations\" befinden sich die einzelnen Stations-Zeitreihen die bei der Simulation für dieses Gebiet genutzt wurden.\n" +
+            "Je Station befindet sich hierin eine ZIP-Datei die nach der DWD-Stations-ID benannt ist. \n" +
+            "Darin befinden sich die 3 Zeitreihen für Niederschlag (N), Temperatur (Ta) und Evapotranspiration(ET)\n")
+    if "add_result" in request.POST:
+        readme += README_PART_RESULT
+    if len(msgs)>0:
+        readme += (
+            "\n\n##############\n# !!Achtung!! #\n##############\n"+
+            "Um eine NatUrWB-Referenz für ihr Gebiet zu erhalten, musste an einigen Punkten vom optimalen Weg abgewichen werden.\n"+
+            "Daher sind die Ergebnisse nur unter Berücksichtigung der folgenden Anmerkungen zu verstehen: \n" +
+            "\n".join(new_msgs))
+
+    # the members of the zip file, they are only made while streaming
+    use_input_bundles = get_setting("input_bundles", True)
+    def zip_members():
+        # results shape file
         if "add_result" in request.POST:
-            res_gen.to_file(tmp_dir_fp.joinpath("results.shp"))
+            yield from geo_members(res_gen, "results", geo_format)
 
-        # create input files
+        # input files, from the database if the bundles are not available
         if "add_input" in request.POST:
-            sim_ids = res_gen.index.get_level_values("sim_id").unique().astype(str)
-            sim_in_dir = tmp_dir_fp.joinpath("input")
-            sim_in_dir.mkdir()
-            simids_sql_where = f"WHERE sim_id IN ({', '.join(sim_ids)})"
-            gpd.read_postgis(
-                f"SELECT sim_id, geom FROM tbl_simulation_polygons {simids_sql_where};",
-                con=get_engine(),
-                crs=25832,
-                geom_col="geom"
-            ).to_file(sim_in_dir.joinpath("Modellgebiete.shp"))
-
-            pd.read_sql(
-                f"SELECT * FROM view_simulation_paras {simids_sql_where};",
-                con=get_engine()
-            ).to_csv(sim_in_dir.joinpath("Simulations-Parameter.csv"),
-                     index=False)
-
-        # create zip file localy/memory
-        if len(res_gen) > 500:
-            zip_obj = Path(tmp_dir).joinpath("temp.zip")
-        else:
-            zip_obj = io.BytesIO()
-
-        with zipfile.ZipFile(zip_obj, "a", zipfile.ZIP_DEFLATED, False) as zip_file:
-            for folder in tmp_dir_fp.glob("**"):
-                zip_file.write(folder, folder.relative_to(tmp_dir_fp))
-                for file in folder.iterdir():
-                    if file.is_file():
-                        zip_file.write(file, file.relative_to(tmp_dir_fp))
-
-            # add weather
-            if "add_weather" in request.POST:
-                wea_zip_dir = APP_DIR.joinpath("data/weather_zips/")
-                zip_file.write(wea_zip_dir, "weather_stations")
-                for stid in stat_ids:
-                    zip_file.write(wea_zip_dir.joinpath(f"{stid}.zip"),
-                                   f"weather_stations/{stid}.zip")
-
-            # create README.txt
-            readme = (
-                "# README  #\n###########\n" +
-                "Diese Datei soll das Ergebnis etwas erläutern und beschreiben.\n\n")
-            if "add_input" in request.POST:
-                readme += README_PART_INPUT
-            if "add_weather" in request.POST:
-                readme += (
-                    "\n# /weather_stations/\n###################\n" +
-                    "Im Ordner \"weather_stations\" befinden sich die einzelnen Stations-Zeitreihen die bei der Simulation für dieses Gebiet genutzt wurden.\n" +
-                    "Je Station befindet sich hierin eine ZIP-Datei die nach der DWD-Stations-ID benannt ist. \n" +
-                    "Darin befinden sich die 3 Zeitreihen für Niederschlag (N), Temperatur (Ta) und Evapotranspiration(ET)\n")
-            if "add_result" in request.POST:
-                readme += README_PART_RESULT
-            if len(msgs)>0:
-                readme += (
-                    "\n\n##############\n# !!Achtung!! #\n##############\n"+
-                    "Um eine NatUrWB-Referenz für ihr Gebiet zu erhalten, musste an einigen Punkten vom optimalen Weg abgewichen werden.\n"+
-                    "Daher sind die Ergebnisse nur unter Berücksichtigung der folgenden Anmerkungen zu verstehen: \n" +
-                    "\n".join(new_msgs))
-
-            # store README to zip
-            zip_file.writestr("README.txt", readme.encode("iso-8859-1"))
-
-        # create http response
-        file_buffer = File(zip_obj)
-        response = StreamingHttpResponse(file_buffer, content_type="application/zip")
-        response['Content-Disposition'] = f'attachment; filename="result_{datetime.datetime.now().strftime("%Y-%m-%d_%H%M%S")}.zip"'
-        # response['Content-Length'] = file_buffer.tell()
-        return response
+            sim_ids = ids(res_gen.index.get_level_values("sim_id"))
+            sim_polygons = paras_chunks = None
+            if use_input_bundles:
+                try:
+                    sim_polygons = read_sim_polygons(sim_ids)
+                    paras_chunks = sim_paras_csv_chunks(sim_ids)
+                except OSError:
+                    # a partition is missing, e.g. while building the bundles
+                    sim_polygons = paras_chunks = None
+            if sim_polygons is not None and paras_chunks is not None:
+                yield from geo_members(
+                    sim_polygons, "input/Modellgebiete", geo_format)
+                yield ("input/Simulations-Parameter.csv", paras_chunks)
+            else:
+                with get_engine().connect() as con:
+                    yield from geo_members(
+                        gpd.read_postgis(
+                            prepare(con, "sim_polygons"),
+                            con=con,
+                            params=dict(sim_ids=sim_ids),
+                            crs=25832,
+                            geom_col="geom"),
+                        "input/Modellgebiete", geo_format)
+
+                # a server-side cursor, so only one chunk is in memory
+                yield ("input/Simulations-Parameter.csv",
+                       sql_csv_chunks(
+                           get_engine(), unprepared("sim_paras"),
+                           params=dict(sim_ids=sim_ids),
+                           index=False))
+
+        # add weather
+        if "add_weather" in request.POST:
+            # the zip files are already compressed, so store them as they are
+            for stid in stat_ids:
+                yield (f"weather_stations/{stid}.zip",
+                       file_chunks(WEATHER_ZIP_DIR.joinpath(f"{stid}.zip")),
+                       zipfile.ZIP_STORED)
+
+        # store README to zip
+        yield "README.txt", [readme.encode("iso-8859-1")]
+
+    # create http response
+    response = StreamingHttpResponse(
+        stream_zip(zip_members()), content_type="application/zip")
+    response['Content-Disposition'] = f'attachment; filename="result_{datetime.datetime.now().strftime("%Y-%m-%d_%H%M%S")}.zip"'
+    return response
 
 def home_view(request, *args, **kwargs):
     return render(request, "home.html", context_base)
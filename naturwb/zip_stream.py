@@ -0,0 +1,243 @@
+"""Stream a ZIP archive while its members get produced.
+
+The download of the results used to write all the files into a temporary
+directory and the whole archive into memory or a temporary file,
+before the first byte got sent.
+Here the archive is written by zipfile into a write only buffer,
+that can't seek. Therefor zipfile writes the sizes and checksums
+after the data of every member (data descriptor)
+and the compressed chunks can get yielded as soon as they are written.
+So the memory only holds one chunk, whatever the size of the result.
+
+Members that are already compressed, like the zip files of the weather
+stations, are stored (ZIP_STORED) and their bytes get copied as they are,
+instead of deflating them again.
+"""
+import io
+import tempfile
+import time
+import zipfile
+from pathlib import Path
+from django.db import transaction
+import pandas as pd
+import pyarrow.parquet as pq
+try:
+    # to write GeoParquet in row groups
+    from geopandas.io.arrow import _geopandas_to_arrow
+except ImportError:
+    _geopandas_to_arrow = None
+try:
+    import pyogrio
+    # the Arrow path needs pyogrio >= 0.8 and GDAL >= 3.8
+    _PYOGRIO_ARROW = (
+        tuple(int(v) for v in pyogrio.__version__.split(".")[:2]) >= (0, 8)
+        and pyogrio.__gdal_version__ >= (3, 8, 0))
+except ImportError:
+    pyogrio = None
+
+CHUNK_SIZE = 64 * 1024
+CSV_CHUNK_ROWS = 10000
+
+# the formats of the geodata in the download
+# as (OGR driver, suffix, compression in the zip file),
+# GeoParquet is written by pyarrow and already compressed
+GEO_FORMATS = {
+    "shp": ("ESRI Shapefile", ".shp", zipfile.ZIP_DEFLATED),
+    "gpkg": ("GPKG", ".gpkg", zipfile.ZIP_DEFLATED),
+    "fgb": ("FlatGeobuf", ".fgb", zipfile.ZIP_DEFLATED),
+    "parquet": (None, ".parquet", zipfile.ZIP_STORED)}
+
+
+class _ChunkBuffer(io.RawIOBase):
+    """A write only file object that collects the written chunks."""
+    def __init__(self):
+        self.chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self.chunks.append(bytes(b))
+        return len(b)
+
+    def pop(self):
+        """Get the written bytes since the last call."""
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def stream_zip(members, compression=zipfile.ZIP_DEFLATED):
+    """Write a ZIP archive and yield its bytes chunk by chunk.
+
+    Parameters
+    ----------
+    members : iterable of tuple
+        The name in the archive, the data and optionally the compression
+        of every member, e.g. ("weather/1.zip", chunks, zipfile.ZIP_STORED).
+        The data is an iterable of chunks, e.g. from file_chunks,
+        and only gets read, when the member is written.
+    compression : int, optional
+        The compression of the members without their own compression.
+        The default is zipfile.ZIP_DEFLATED.
+
+    Yields
+    ------
+    bytes
+        The next chunk of the ZIP archive.
+    """
+    buffer = _ChunkBuffer()
+    with zipfile.ZipFile(buffer, "w", compression) as zip_file:
+        for arcname, chunks, *member_compression in members:
+            zinfo = zipfile.ZipInfo(
+                arcname, date_time=time.localtime(time.time())[:6])
+            zinfo.compress_type = (
+                member_compression[0] if member_compression else compression)
+            # the size is unknown before, so always allow more than 4 GB
+            with zip_file.open(zinfo, "w", force_zip64=True) as member:
+                for chunk in chunks:
+                    member.write(chunk)
+                    data = buffer.pop()
+                    if data:
+                        yield data
+            yield buffer.pop()
+    # the central directory
+    yield buffer.pop()
+
+
+def file_chunks(path, chunk_size=CHUNK_SIZE):
+    """Read a file in chunks."""
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+
+def csv_chunks(dfs, **kwargs):
+    """Convert the DataFrames to one CSV file in chunks.
+
+    Parameters
+    ----------
+    dfs : iterable of pandas.DataFrame
+        The parts of the table, e.g. from pd.read_sql with chunksize.
+    **kwargs : dict
+        The keyword arguments for pandas.DataFrame.to_csv.
+    """
+    header = True
+    for df in dfs:
+        yield df.to_csv(header=header, **kwargs).encode("utf8")
+        header = False
+
+
+def sql_csv_chunks(db_engine, sql, params, **kwargs):
+    """Read a query with a server-side cursor and convert it to CSV in chunks.
+
+    psycopg2 only opens a server-side (named) cursor in a transaction,
+    but aldjemy shares django's connection, that is in autocommit mode.
+    So the rows are read in an atomic block of django.
+
+    Parameters
+    ----------
+    db_engine : sqlalchemy.engine
+        The database engine, e.g. aldjemy.core.get_engine().
+    sql : sqlalchemy.sql.expression.TextClause
+        The query, e.g. from naturwb_sql.unprepared,
+        as prepared statements can't get executed by a named cursor.
+    params : dict
+        The parameters of the query.
+    **kwargs : dict
+        The keyword arguments for pandas.DataFrame.to_csv.
+
+    Yields
+    ------
+    bytes
+        The header and then CSV_CHUNK_ROWS rows at once.
+    """
+    with transaction.atomic(), db_engine.connect() as con:
+        yield from csv_chunks(
+            pd.read_sql(
+                sql,
+                con=con.execution_options(stream_results=True),
+                params=params,
+                chunksize=CSV_CHUNK_ROWS),
+            **kwargs)
+
+
+def _index_to_columns(gdf):
+    """Reset a named index to columns, like the OGR drivers write it."""
+    if any(name is not None for name in gdf.index.names):
+        return gdf.reset_index()
+    return gdf
+
+
+def parquet_chunks(gdf, chunk_rows=CSV_CHUNK_ROWS):
+    """Write the GeoDataFrame as GeoParquet and yield its bytes in chunks.
+
+    Every row group is yielded as soon as it is written,
+    so the file is neither saved on disk nor held in memory as a whole.
+    """
+    table = _geopandas_to_arrow(_index_to_columns(gdf), index=False)
+    buffer = _ChunkBuffer()
+    with pq.ParquetWriter(buffer, table.schema, compression="zstd") as writer:
+        for batch in table.to_batches(max_chunksize=chunk_rows):
+            writer.write_batch(batch)
+            yield buffer.pop()
+    # the footer
+    yield buffer.pop()
+
+
+def write_geodata(gdf, path, fmt="shp"):
+    """Save the GeoDataFrame in one of the GEO_FORMATS.
+
+    The OGR formats are written with pyogrio and its Arrow path,
+    if they are available, otherwise with fiona.
+    A named index, like the sim_id, gen_id and nat_id of the results,
+    is written as columns in every format.
+    """
+    driver, _, _ = GEO_FORMATS[fmt]
+    if driver is None:
+        _index_to_columns(gdf).to_parquet(path, compression="zstd", index=False)
+    elif pyogrio is not None:
+        gdf.to_file(path, driver=driver, engine="pyogrio",
+                    use_arrow=_PYOGRIO_ARROW)
+    else:
+        gdf.to_file(path, driver=driver)
+
+
+def geo_members(gdf, name, fmt="shp"):
+    """Get the files of the GeoDataFrame for stream_zip.
+
+    GeoParquet is written straight into the archive.
+    The OGR drivers need a file system, so their files are written
+    into a temporary directory, that only exists while the files are read.
+
+    Parameters
+    ----------
+    gdf : geopandas.GeoDataFrame
+        The table to save.
+    name : str
+        The name of the file in the archive, without the suffix,
+        e.g. "input/Modellgebiete".
+    fmt : str, optional
+        The format, one of GEO_FORMATS.
+        The default is "shp".
+
+    Yields
+    ------
+    tuple of str, iterable of bytes and int
+        The name in the archive, the chunks and the compression
+        of every file, the shapefile consists of several files.
+    """
+    driver, suffix, compression = GEO_FORMATS[fmt]
+    if driver is None and _geopandas_to_arrow is not None:
+        yield (str(Path(name).as_posix()) + suffix,
+               parquet_chunks(gdf), compression)
+        return
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        write_geodata(
+            gdf, Path(tmp_dir).joinpath(Path(name).name + suffix), fmt=fmt)
+        for file in sorted(Path(tmp_dir).iterdir()):
+            yield (str(Path(name).parent.joinpath(file.name).as_posix()),
+                   file_chunks(file), compression)